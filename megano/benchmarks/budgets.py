@@ -0,0 +1,160 @@
+import json
+import math
+from itertools import count
+from io import BytesIO
+from typing import Any, Callable, Dict, List, Optional, Union
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.http import QueryDict
+from django.urls import reverse
+from PIL import Image
+from mycatalog.export import EXPORT_CHUNK_SIZE
+from myorders.models import Order
+from .dataset import BENCH_EMAIL, BENCH_PASSWORD, BENCH_USERNAME
+
+
+SIGNUP_NUMBERS = count()
+
+
+class Endpoint:
+
+    """
+    Замеряемый запрос к API и его бюджет.
+    queries - наибольшее допустимое число SQL запросов (обычно это первый, холодный запрос)
+    или функция от данных замера, если число запросов зависит от размера каталога,
+    p95_ms - допустимое время 95 процентиля в миллисекундах.
+    prepare вызывается перед каждым запросом вне замера и готовит состояние
+    (корзину, заказ, пароль), его результат передается в args и data
+    """
+
+    def __init__(self, name: str, method: str, url_name: str, queries: Union[int, Callable], p95_ms: float,
+                 args: Callable = None, data: Callable = None, params: Dict[str, Any] = None,
+                 prepare: Callable = None, auth: bool = True, format: Optional[str] = 'json'):
+        self.name = name
+        self.method = method
+        self.url_name = url_name
+        self.queries = queries
+        self.p95_ms = p95_ms
+        self.args = args or (lambda context, state: [])
+        self.data = data or (lambda context, state: None)
+        self.params = params
+        self.prepare = prepare or (lambda client, context: None)
+        self.auth = auth
+        self.format = format
+
+
+def export_queries(context: Dict[str, Any]) -> int:
+
+    """выгрузка делает один запрос товаров и запрос тегов на каждую пачку"""
+
+    return 1 + math.ceil(len(context["product_ids"]) / EXPORT_CHUNK_SIZE)
+
+
+def product_id(context: Dict[str, Any], state: Any) -> List[int]:
+    return [context["in_stock_ids"][0]]
+
+
+def basket_item(context: Dict[str, Any]) -> Dict[str, Any]:
+    return {"id": context["in_stock_ids"][0], "count": 1, "price": "1.00"}
+
+
+def fill_basket(client, context: Dict[str, Any]) -> None:
+    client.post(reverse('myorders:basket'), data={"id": context["in_stock_ids"][0], "count": 1}, format='json')
+
+
+def create_order(client, context: Dict[str, Any]) -> int:
+    fill_basket(client, context)
+    return client.post(reverse('myorders:orders'), data=[basket_item(context)], format='json').json()["orderId"]
+
+
+def last_order(client, context: Dict[str, Any]) -> int:
+    # детали заказа читают корзину из сессии
+    fill_basket(client, context)
+    return Order.objects.filter(user=context["user"]).values_list('pk', flat=True).last() or create_order(client, context)
+
+
+def order_details(context: Dict[str, Any], order_id: int) -> Dict[str, Any]:
+    return {
+        "orderId": order_id,
+        "fullName": "Bench User",
+        "phone": "+70000000000",
+        "email": BENCH_EMAIL,
+        "deliveryType": "express",
+        "city": "Москва",
+        "address": "Народная 5",
+        "paymentType": "online",
+        "status": "in_process",
+        "totalCost": "1.00",
+        "products": [basket_item(context)],
+    }
+
+
+def reset_password(client, context: Dict[str, Any]) -> None:
+    user = context["user"]
+    user.set_password(BENCH_PASSWORD)
+    user.save(update_fields=['password'])
+    client.force_authenticate(user=user)
+
+
+def avatar_file(context: Dict[str, Any], state: Any) -> Dict[str, Any]:
+    buffer = BytesIO()
+    Image.new('RGB', (64, 64), 'white').save(buffer, 'PNG')
+    return {"avatar": SimpleUploadedFile("avatar.png", buffer.getvalue(), content_type="image/png")}
+
+
+def legacy_form(payload: Dict[str, Any]) -> QueryDict:
+
+    """фронтенд отправляет формы входа и регистрации как JSON строку в ключе формы"""
+
+    return QueryDict(json.dumps(payload))
+
+
+ENDPOINTS = [
+    Endpoint("categories", "get", "mycatalog:categories", queries=3, p95_ms=60),
+    Endpoint("catalog", "get", "mycatalog:catalog", queries=9, p95_ms=150,
+             params={"currentPage": 3, "limit": 20, "sort": "price", "sortType": "inc"}),
+    # поиск и цена не входят в индекс фасетов, id подходящих товаров читаются отдельным запросом
+    Endpoint("catalog filtered", "get", "mycatalog:catalog", queries=11, p95_ms=200,
+             params={"filter[name]": "product", "filter[minPrice]": 10, "filter[maxPrice]": 500,
+                     "filter[available]": "true", "sort": "rating", "sortType": "dec", "limit": 20}),
+    Endpoint("catalog export", "get", "mycatalog:catalog_export", queries=export_queries, p95_ms=2000,
+             params={"type": "ndjson"}),
+    Endpoint("popular", "get", "mycatalog:popular", queries=5, p95_ms=60),
+    Endpoint("limited", "get", "mycatalog:limited", queries=5, p95_ms=100),
+    Endpoint("sales", "get", "mycatalog:sales", queries=4, p95_ms=100, params={"currentPage": 1}),
+    Endpoint("banners", "get", "mycatalog:banners", queries=5, p95_ms=60),
+    Endpoint("product", "get", "mycatalog:product", queries=6, p95_ms=60, args=product_id),
+    Endpoint("reviews", "get", "mycatalog:reviews", queries=1, p95_ms=40, args=product_id,
+             params={"sort": "rating", "sortType": "dec", "limit": 10}),
+    Endpoint("review", "post", "mycatalog:reviews", queries=9, p95_ms=100, args=product_id,
+             data=lambda context, state: {"author": BENCH_USERNAME, "email": BENCH_EMAIL, "text": "bench", "rate": 4}),
+    Endpoint("tags", "get", "mycatalog:tags", queries=1, p95_ms=40),
+    Endpoint("basket get", "get", "myorders:basket", queries=8, p95_ms=60, prepare=fill_basket),
+    Endpoint("basket add", "post", "myorders:basket", queries=9, p95_ms=80,
+             data=lambda context, state: {"id": context["in_stock_ids"][1], "count": 1}),
+    Endpoint("basket remove", "delete", "myorders:basket", queries=4, p95_ms=60, prepare=fill_basket,
+             data=lambda context, state: {"id": context["in_stock_ids"][0], "count": 1}),
+    Endpoint("orders create", "post", "myorders:orders", queries=6, p95_ms=80, prepare=fill_basket,
+             data=lambda context, state: [basket_item(context)]),
+    Endpoint("orders list", "get", "myorders:orders", queries=5, p95_ms=150),
+    Endpoint("order get", "get", "myorders:orders-pk", queries=8, p95_ms=80, prepare=last_order,
+             args=lambda context, order_id: [order_id]),
+    Endpoint("order confirm", "post", "myorders:orders-pk", queries=15, p95_ms=120, prepare=create_order,
+             args=lambda context, order_id: [order_id], data=order_details),
+    Endpoint("payment", "post", "myorders:payment", queries=9, p95_ms=150, prepare=create_order,
+             args=lambda context, order_id: [order_id],
+             data=lambda context, state: {"number": "2147483647", "name": "Bench User",
+                                          "month": "02", "year": "2030", "code": "123"}),
+    Endpoint("profile get", "get", "myauth:profile", queries=1, p95_ms=40),
+    Endpoint("profile update", "post", "myauth:profile", queries=4, p95_ms=80,
+             data=lambda context, state: {"fullName": "Bench User", "email": BENCH_EMAIL, "phone": "+70000000000"}),
+    Endpoint("avatar", "post", "myauth:post-avatar", queries=7, p95_ms=100, data=avatar_file, format='multipart'),
+    Endpoint("password", "post", "myauth:post-password", queries=10, p95_ms=2000, prepare=reset_password,
+             data=lambda context, state: {"currentPassword": BENCH_PASSWORD, "newPassword": BENCH_PASSWORD}),
+    Endpoint("sign in", "post", "myauth:sign-in", queries=9, p95_ms=1000, auth=False, format=None,
+             data=lambda context, state: legacy_form({"username": BENCH_USERNAME, "password": BENCH_PASSWORD})),
+    Endpoint("sign up", "post", "myauth:sign-up", queries=16, p95_ms=2000, auth=False, format=None,
+             prepare=lambda client, context: f"signup{next(SIGNUP_NUMBERS)}",
+             data=lambda context, username: legacy_form({"name": "Bench", "username": username,
+                                                         "password": BENCH_PASSWORD})),
+    Endpoint("sign out", "post", "myauth:sign-out", queries=0, p95_ms=40),
+]
@@ -0,0 +1,97 @@
+import random
+from datetime import timedelta
+from typing import Any, Dict
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.utils import timezone
+from myauth.models import Profile
+from mycatalog.importer import CatalogImporter
+from mycatalog.models import Categories, Product, ProductImage, Review, SaleDate
+from mycatalog.services import rebuild_review_stats
+from mycatalog.stores import rebuild_banner_pool, rebuild_leaderboards
+
+
+BENCH_USERNAME = "bench"
+BENCH_PASSWORD = "bench-password"
+BENCH_EMAIL = "bench@example.com"
+ROOT_CATEGORIES = 5
+SUBCATEGORIES = 4
+TAGS = 60
+SPECIFICATIONS = 40
+IMAGES_PER_PRODUCT = 2
+REVIEWERS = 50
+SALE_SHARE = 0.1
+
+
+def synthetic_rows(products: int, category_ids, rng: random.Random):
+
+    """функция генерирует строки каталога в формате import_catalog"""
+
+    for product_id in range(1, products + 1):
+        yield {
+            "id": product_id,
+            "title": f"bench product {product_id}",
+            "price": f"{rng.randint(100, 100000) / 100:.2f}",
+            "count": rng.choice((0, 1, 2, 5, 10, 50)),
+            "categoryId": rng.choice(category_ids),
+            "freeDelivery": rng.random() < 0.3,
+            "description": f"synthetic product {product_id} for endpoint benchmarks",
+            "fullDescription": "lorem ipsum " * 20,
+            "tags": [f"tag{tag}" for tag in rng.sample(range(TAGS), 3)],
+            "specifications": [
+                {"name": f"spec{spec}", "value": str(rng.randint(1, 5))} for spec in rng.sample(range(SPECIFICATIONS), 2)
+            ],
+        }
+
+
+def build_dataset(products: int = 5000, reviews_per_product: int = 5, seed: int = 1) -> Dict[str, Any]:
+
+    """
+    функция наполняет пустую базу синтетическим каталогом:
+    дерево категорий, товары с тегами, спецификациями и картинками,
+    отзывы, распродажи и пользователь для запросов с авторизацией
+    :return: id объектов, которые используют замеры
+    """
+
+    rng = random.Random(seed)
+    category_ids = []
+    for root_number in range(ROOT_CATEGORIES):
+        root = Categories.objects.create(title=f"bench category {root_number}")
+        for child_number in range(SUBCATEGORIES):
+            child = Categories.objects.create(title=f"bench category {root_number}.{child_number}", parent_category=root)
+            category_ids.append(child.pk)
+
+    CatalogImporter().run(synthetic_rows(products, category_ids, rng))
+    product_ids = list(Product.objects.order_by('pk').values_list('pk', flat=True))
+    ProductImage.objects.bulk_create(
+        ProductImage(images_product_id=product_id, image=f"products/bench/{product_id}_{number}.png")
+        for product_id in product_ids for number in range(IMAGES_PER_PRODUCT)
+    )
+
+    user = User.objects.create_user(username=BENCH_USERNAME, password=BENCH_PASSWORD, email=BENCH_EMAIL)
+    Profile.objects.filter(user=user).update(fullName="Bench User", email=BENCH_EMAIL, phone="+70000000000")
+    user = User.objects.select_related('profile').get(pk=user.pk)
+    password = make_password(BENCH_PASSWORD)
+    reviewers = User.objects.bulk_create(
+        User(username=f"reviewer{number}", password=password) for number in range(REVIEWERS)
+    )
+    Profile.objects.bulk_create(Profile(user=reviewer, fullName=reviewer.username) for reviewer in reviewers)
+    Review.objects.bulk_create(
+        Review(author=rng.choice(reviewers), product_id=product_id, text="synthetic review", rate=rng.randint(1, 5))
+        for product_id in product_ids for _ in range(reviews_per_product)
+    )
+    now = timezone.now()
+    SaleDate.objects.bulk_create(
+        SaleDate(product_id=product_id, discount=rng.randint(5, 50),
+                 date_from=now - timedelta(days=1), date_to=now + timedelta(days=30))
+        for product_id in rng.sample(product_ids, int(len(product_ids) * SALE_SHARE))
+    )
+    rebuild_review_stats()
+    rebuild_banner_pool()
+    rebuild_leaderboards()
+    return {
+        "user": user,
+        "product_ids": product_ids,
+        "category_ids": category_ids,
+        "in_stock_ids": list(Product.objects.filter(count__gt=1).order_by('pk').values_list('pk', flat=True)[:20]),
+    }
@@ -0,0 +1,56 @@
+import json
+import tempfile
+from django.core.management.base import BaseCommand, CommandError
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+from benchmarks.budgets import ENDPOINTS
+from benchmarks.dataset import build_dataset
+from benchmarks.runner import budget_failures, run_benchmarks
+
+
+class Command(BaseCommand):
+
+    """Команда замеряет время и число SQL запросов всех эндпоинтов API на синтетическом каталоге"""
+
+    help = "Benchmark every API endpoint on a synthetic dataset in a test database and check the budgets"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=5000, help="synthetic products")
+        parser.add_argument("--reviews", type=int, default=5, help="reviews per product")
+        parser.add_argument("--repeat", type=int, default=20, help="requests per endpoint")
+        parser.add_argument("--only", help="benchmark only endpoints whose name contains this text")
+        parser.add_argument("--time-scale", type=float, default=1.0, help="multiplier of time budgets for slow machines")
+        parser.add_argument("--json", dest="json_path", help="write the results to this file")
+
+    def handle(self, *args, **options):
+        endpoints = [endpoint for endpoint in ENDPOINTS if not options["only"] or options["only"] in endpoint.name]
+        if not endpoints:
+            raise CommandError(f"No endpoint matches {options['only']!r}")
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        runner.setup_test_environment()
+        databases = runner.setup_databases()
+        try:
+            with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+                self.stdout.write(f"Building {options['products']} products...")
+                context = build_dataset(products=options["products"], reviews_per_product=options["reviews"])
+                results = run_benchmarks(endpoints, context, options["repeat"])
+        finally:
+            runner.teardown_databases(databases)
+            runner.teardown_test_environment()
+
+        self.stdout.write(f"{'endpoint':<18} {'method':<6} {'p50 ms':>8} {'p95 ms':>8} {'budget':>8} {'queries':>8} {'budget':>6}")
+        failures = []
+        for result in results:
+            failed = budget_failures(result, options["time_scale"])
+            failures.extend(failed)
+            line = (
+                f"{result['name']:<18} {result['method']:<6} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} "
+                f"{result['budget_p95_ms'] * options['time_scale']:>8g} {result['queries']:>8} {result['budget_queries']:>6}"
+            )
+            self.stdout.write(self.style.ERROR(line) if failed else line)
+        if options["json_path"]:
+            with open(options["json_path"], "w", encoding="utf-8") as file:
+                json.dump(results, file, ensure_ascii=False, indent=2)
+        if failures:
+            raise CommandError("Budgets exceeded:\n" + "\n".join(failures))
+        self.stdout.write(self.style.SUCCESS(f"{len(results)} endpoints within budget"))
@@ -0,0 +1,153 @@
+import re
+from typing import Any, Callable, Dict, List, Tuple
+from django.db import connection, transaction
+from django.urls import reverse
+from rest_framework.test import APIClient
+from megano.cache import bump_generation
+from mycatalog.cache import CATALOG_NAMESPACE
+
+
+# таблицы, которые растут вместе с каталогом, полный проход по ним недопустим
+LARGE_TABLES = {
+    "mycatalog_product",
+    "mycatalog_product_tags",
+    "mycatalog_product_specifications",
+    "mycatalog_productsearchdocument",
+    "mycatalog_review",
+}
+EXPLAIN_VENDORS = ("sqlite", "postgresql")
+SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS (\w+))?$')
+POSTGRESQL_SCAN = re.compile(r'Seq Scan on (\w+)')
+SQL_ALIAS = re.compile(r'"(\w+)" (U\d+|T\d+)\b')
+
+
+class QueryShape:
+
+    """
+    Вид запроса: параметры GET запроса к url_name (по умолчанию /api/catalog),
+    args - аргументы адреса от данных замера.
+    allowed_scans - большие таблицы, полный проход по которым неизбежен, с причиной
+    """
+
+    def __init__(self, name: str, params: Callable, allowed_scans: Dict[str, str] = None,
+                 url_name: str = "mycatalog:catalog", args: Callable = None):
+        self.name = name
+        self.params = params
+        self.allowed_scans = allowed_scans or {}
+        self.url_name = url_name
+        self.args = args or (lambda context: [])
+
+
+EFFECTIVE_PRICE = "цена со скидкой зависит от текущего времени и не индексируется"
+UNSORTED_PAGE = "страница без фильтров и сортировки читает первые строки таблицы и останавливается на LIMIT"
+OFFSET_PAGE = "OFFSET читает все пропускаемые строки, глубокие страницы без OFFSET отдает курсорная пагинация"
+PRIMARY_KEY_ORDER = "сортировка по id идет по первичному ключу, в SQLite это сама таблица, чтение останавливается на LIMIT"
+
+CATALOG_QUERY_SHAPES = [
+    QueryShape("first page", lambda context: {"currentPage": 1},
+               allowed_scans={"mycatalog_product": UNSORTED_PAGE}),
+    QueryShape("deep page", lambda context: {"currentPage": 3, "limit": 5},
+               allowed_scans={"mycatalog_product": OFFSET_PAGE}),
+    QueryShape("category", lambda context: {"category": context["category_ids"][0]}),
+    QueryShape("category rating", lambda context: {
+        "category": context["category_ids"][0], "subcategories": "false", "sort": "rating", "sortType": "dec"}),
+    QueryShape("category date", lambda context: {
+        "category": context["category_ids"][0], "subcategories": "false", "sort": "date", "sortType": "dec"}),
+    QueryShape("category reviews", lambda context: {
+        "category": context["category_ids"][0], "subcategories": "false", "sort": "reviews", "sortType": "inc"}),
+    QueryShape("rating", lambda context: {"sort": "rating", "sortType": "dec"}),
+    QueryShape("reviews", lambda context: {"sort": "reviews", "sortType": "dec"}),
+    QueryShape("date", lambda context: {"sort": "date", "sortType": "inc"}),
+    QueryShape("available", lambda context: {"filter[available]": "true", "sort": "rating", "sortType": "dec"}),
+    QueryShape("free delivery", lambda context: {
+        "filter[freeDelivery]": "true", "filter[available]": "true", "sort": "date", "sortType": "dec"}),
+    QueryShape("tag", lambda context: {"tags[]": 1}),
+    QueryShape("search", lambda context: {"filter[name]": "product"}),
+    QueryShape("price", lambda context: {"sort": "price", "sortType": "inc"},
+               allowed_scans={"mycatalog_product": EFFECTIVE_PRICE}),
+    QueryShape("price range", lambda context: {"filter[minPrice]": 10, "filter[maxPrice]": 500},
+               allowed_scans={"mycatalog_product": EFFECTIVE_PRICE}),
+    QueryShape("cursor", lambda context: {"cursor": ""},
+               allowed_scans={"mycatalog_product": PRIMARY_KEY_ORDER}),
+    QueryShape("cursor rating", lambda context: {"cursor": "", "sort": "rating", "sortType": "dec"}),
+    QueryShape("cursor category date", lambda context: {
+        "cursor": "", "category": context["category_ids"][0], "subcategories": "false", "sort": "date"}),
+]
+
+REVIEW_QUERY_SHAPES = [
+    QueryShape("reviews", lambda context: {}, url_name="mycatalog:reviews",
+               args=lambda context: [context["product_ids"][0]]),
+    QueryShape("reviews rating", lambda context: {"sort": "rating", "sortType": "dec", "limit": 5},
+               url_name="mycatalog:reviews", args=lambda context: [context["product_ids"][0]]),
+]
+
+
+def capture_selects(func: Callable[[], Any]) -> List[Tuple[str, Any]]:
+
+    """функция выполняет func и возвращает SQL и параметры всех выполненных SELECT"""
+
+    captured = []
+
+    def wrapper(execute, sql, params, many, context):
+        if sql.lstrip().upper().startswith("SELECT"):
+            captured.append((sql, params))
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(wrapper):
+        func()
+    return captured
+
+
+def explain(sql: str, params: Any) -> List[str]:
+
+    """
+    функция возвращает строки плана запроса.
+    В PostgreSQL последовательное чтение выключается, чтобы на маленьких таблицах
+    план показывал индексы, а Seq Scan оставался только там, где подходящего индекса нет
+    """
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute("EXPLAIN " + sql, params)
+        else:
+            cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def full_scans(sql: str, plan: List[str]) -> List[str]:
+
+    """функция возвращает большие таблицы, которые план читает целиком"""
+
+    if connection.vendor == "postgresql":
+        scanned = [match.group(1) for line in plan for match in POSTGRESQL_SCAN.finditer(line)]
+    else:
+        aliases = dict((alias, table) for table, alias in SQL_ALIAS.findall(sql))
+        scanned = []
+        for line in plan:
+            match = SQLITE_SCAN.match(line.strip())
+            if match:
+                name = match.group(2) or match.group(1)
+                scanned.append(aliases.get(name, match.group(1)))
+    return sorted({table for table in scanned if table in LARGE_TABLES})
+
+
+def explain_shape(shape: QueryShape, context: Dict[str, Any]) -> List[Dict[str, Any]]:
+
+    """
+    функция выполняет запрос вида shape с холодным кешем страниц каталога
+    и возвращает план каждого его SELECT и найденные полные проходы.
+    Индекс фасетов строится заранее: его перестройка читает каталог целиком намеренно
+    """
+
+    client = APIClient()
+    client.get(reverse("mycatalog:catalog"))
+    bump_generation(CATALOG_NAMESPACE)
+    url = reverse(shape.url_name, args=shape.args(context))
+    statements = capture_selects(lambda: client.get(url, shape.params(context)))
+    results = []
+    for sql, params in statements:
+        plan = explain(sql, params)
+        scans = [table for table in full_scans(sql, plan) if table not in shape.allowed_scans]
+        results.append({"sql": sql, "plan": plan, "scans": scans})
+    return results
@@ -0,0 +1,94 @@
+import math
+import time
+from typing import Any, Dict, Iterable, List
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+from megano.cache import bump_generation
+from myauth.models import PROFILE_NAMESPACE
+from mycatalog.cache import CATALOG_NAMESPACE, CATEGORIES_NAMESPACE, TAGS_NAMESPACE, invalidate_product_details
+from mycatalog.facets import bump_facets_version
+from mycatalog.stores import invalidate_product_stores
+from .budgets import Endpoint
+
+
+def percentile(values: List[float], share: float) -> float:
+
+    """функция считает процентиль методом ближайшего ранга"""
+
+    ordered = sorted(values)
+    rank = max(1, math.ceil(share * len(ordered)))
+    return ordered[rank - 1]
+
+
+def reset_shared_caches(product_ids: Iterable[int] = ()) -> None:
+
+    """функция делает устаревшими кеши, пул банеров и рейтинги в общем Redis,
+    чтобы замеры не видели данные другой базы и не оставляли свои"""
+
+    invalidate_product_details(product_ids)
+    for namespace in (CATALOG_NAMESPACE, CATEGORIES_NAMESPACE, TAGS_NAMESPACE, PROFILE_NAMESPACE):
+        bump_generation(namespace)
+    bump_facets_version()
+    invalidate_product_stores()
+
+
+def measure_endpoint(endpoint: Endpoint, context: Dict[str, Any], repeat: int) -> Dict[str, Any]:
+
+    """
+    функция выполняет запрос repeat раз и собирает время и число SQL запросов,
+    первый запрос холодный: кеши каталога перед ним сбрасываются
+    """
+
+    client = APIClient(raise_request_exception=False)
+    if endpoint.auth:
+        client.force_authenticate(user=context["user"])
+    reset_shared_caches(context["product_ids"])
+    timings, queries, statuses = [], [], set()
+    for _ in range(repeat):
+        state = endpoint.prepare(client, context)
+        url = reverse(endpoint.url_name, args=endpoint.args(context, state))
+        data = endpoint.data(context, state)
+        if endpoint.params:
+            data = endpoint.params
+        kwargs = {"format": endpoint.format} if endpoint.format and endpoint.method != "get" else {}
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = getattr(client, endpoint.method)(url, data=data, **kwargs)
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+            elapsed = time.perf_counter() - started
+        timings.append(elapsed * 1000)
+        queries.append(len(captured))
+        statuses.add(response.status_code)
+    return {
+        "name": endpoint.name,
+        "method": endpoint.method.upper(),
+        "url": endpoint.url_name,
+        "status": sorted(statuses),
+        "p50_ms": round(percentile(timings, 0.5), 2),
+        "p95_ms": round(percentile(timings, 0.95), 2),
+        "queries": max(queries),
+        "budget_queries": endpoint.queries(context) if callable(endpoint.queries) else endpoint.queries,
+        "budget_p95_ms": endpoint.p95_ms,
+    }
+
+
+def budget_failures(result: Dict[str, Any], time_scale: float = 1.0) -> List[str]:
+    failures = []
+    if any(code >= 400 for code in result["status"]):
+        failures.append(f"{result['name']}: HTTP {result['status']}")
+    if result["queries"] > result["budget_queries"]:
+        failures.append(f"{result['name']}: {result['queries']} queries > {result['budget_queries']}")
+    if result["p95_ms"] > result["budget_p95_ms"] * time_scale:
+        failures.append(f"{result['name']}: p95 {result['p95_ms']} ms > {result['budget_p95_ms'] * time_scale:g} ms")
+    return failures
+
+
+def run_benchmarks(endpoints: Iterable[Endpoint], context: Dict[str, Any], repeat: int) -> List[Dict[str, Any]]:
+    try:
+        return [measure_endpoint(endpoint, context, repeat) for endpoint in endpoints]
+    finally:
+        reset_shared_caches(context["product_ids"])
@@ -0,0 +1,36 @@
+import tempfile
+from unittest import skipUnless
+from django.db import connection
+from django.test import TestCase, override_settings
+from .budgets import ENDPOINTS
+from .dataset import build_dataset
+from .plans import CATALOG_QUERY_SHAPES, EXPLAIN_VENDORS, REVIEW_QUERY_SHAPES, explain_shape
+from .runner import reset_shared_caches, run_benchmarks
+
+
+class QueryBudgetsTestCase(TestCase):
+
+    def test_endpoints_stay_within_query_budgets(self):
+        # время зависит от машины и проверяется командой bench_api, здесь только число запросов
+        context = build_dataset(products=40, reviews_per_product=2)
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            results = run_benchmarks(ENDPOINTS, context, repeat=2)
+        for result in results:
+            with self.subTest(endpoint=result["name"]):
+                self.assertTrue(all(code < 400 for code in result["status"]), result["status"])
+                self.assertLessEqual(result["queries"], result["budget_queries"])
+
+
+@skipUnless(connection.vendor in EXPLAIN_VENDORS, "EXPLAIN is parsed for SQLite and PostgreSQL only")
+class QueryPlansTestCase(TestCase):
+
+    def test_catalog_and_review_queries_do_not_scan_large_tables(self):
+        context = build_dataset(products=60, reviews_per_product=1)
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            for shape in CATALOG_QUERY_SHAPES + REVIEW_QUERY_SHAPES:
+                with self.subTest(shape=shape.name):
+                    statements = explain_shape(shape, context)
+                    self.assertTrue(statements)
+                    for statement in statements:
+                        self.assertFalse(statement["scans"], "\n".join([statement["sql"]] + statement["plan"]))
+        reset_shared_caches(context["product_ids"])
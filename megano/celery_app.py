@@ -14,8 +14,9 @@ app.conf.broker_url = settings.CELERY_BROKER_URL
 app.autodiscover_tasks()
 
 app.conf.beat_schedule = {
-    "task_store_loader":
+    "reconcile_dirty_review_stats":
         {
-            "schedule": crontab(minute=1, hour=0),
+            "task": "mycatalog.tasks.reconcile_dirty_review_stats",
+            "schedule": crontab(minute="*"),
         }
-}
\ No newline at end of file
+}
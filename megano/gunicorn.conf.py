@@ -0,0 +1,21 @@
+import os
+import shutil
+
+
+def on_starting(server):
+    """
+    при старте мастера очищает каталог метрик прошлых запусков
+    """
+    directory = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+
+
+def child_exit(server, worker):
+    """
+    удаляет файлы live gauge завершившегося воркера, счетчики и гистограммы остаются в сумме
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,74 @@
+import time
+from typing import Any
+from django.core.cache import cache
+from django.db import transaction
+
+
+GENERATION_KEY = "{namespace}:generation"
+MODIFIED_KEY = "{namespace}:modified"
+NAMESPACE_KEY = "{namespace}:{generation}:{key}"
+NAMESPACE_TIMEOUT = 6 * 60 * 60
+
+
+def get_generation(namespace: str) -> int:
+
+    """функция возвращает текущее поколение пространства имен кеша"""
+
+    key = GENERATION_KEY.format(namespace=namespace)
+    generation = cache.get(key)
+    if generation is None:
+        # поколение начинается со времени, чтобы после вытеснения ключа не совпасть со старым
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        generation = cache.get(key)
+    return generation
+
+
+def bump_generation(namespace: str) -> None:
+
+    """функция меняет поколение пространства имен, все его записи становятся недоступны
+    и вытесняются из Redis по истечении срока жизни"""
+
+    try:
+        cache.incr(GENERATION_KEY.format(namespace=namespace))
+    except ValueError:
+        get_generation(namespace)
+    cache.set(MODIFIED_KEY.format(namespace=namespace), time.time(), timeout=None)
+
+
+def bump_generation_on_commit(namespace: str) -> None:
+
+    """функция меняет поколение после фиксации текущей транзакции: при смене до фиксации
+    параллельный запрос успевает закешировать старые данные уже под новым поколением"""
+
+    transaction.on_commit(lambda: bump_generation(namespace))
+
+
+def get_modified(namespace: str) -> float:
+
+    """функция возвращает время последнего изменения пространства имен (unix time)"""
+
+    key = MODIFIED_KEY.format(namespace=namespace)
+    modified = cache.get(key)
+    if modified is None:
+        cache.add(key, time.time(), timeout=None)
+        modified = cache.get(key)
+    return modified
+
+
+def namespace_key(namespace: str, key: Any = "") -> str:
+    return NAMESPACE_KEY.format(namespace=namespace, generation=get_generation(namespace), key=key)
+
+
+def namespace_get(namespace: str, key: Any = "") -> Any:
+    return cache.get(namespace_key(namespace, key))
+
+
+def namespace_set(namespace: str, value: Any, key: Any = "", timeout: int = NAMESPACE_TIMEOUT) -> None:
+    cache.set(namespace_key(namespace, key), value, timeout)
+
+
+def namespace_delete(namespace: str, key: Any = "") -> None:
+
+    """функция удаляет одну запись пространства имен, не трогая остальные"""
+
+    cache.delete(namespace_key(namespace, key))
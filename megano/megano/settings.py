@@ -48,6 +48,8 @@ INSTALLED_APPS = [
     'myauth.apps.MyauthConfig',
     'mycatalog.apps.MycatalogConfig',
     'myorders.apps.MyordersConfig',
+    'mymonitoring.apps.MymonitoringConfig',
+    'benchmarks.apps.BenchmarksConfig',
 
 ]
 
@@ -55,11 +57,14 @@ INSTALLED_APPS = [
 
 
 MIDDLEWARE = [
+    'mymonitoring.middleware.MetricsMiddleware',
+    'mymonitoring.middleware.ServerTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'mymonitoring.middleware.ProfilerMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -191,14 +196,56 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 #     }
 # }
 
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'}
+    },
+    'loggers': {
+        'mymonitoring': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        }
+    }
+}
+
+# доля запросов, для которых собираются счетчики SQL, кеша и сериалайзеров (заголовок Server-Timing)
+SERVER_TIMING_SAMPLE_RATE = float(os.environ.get("SERVER_TIMING_SAMPLE_RATE", 0))
+
+# профайлер отдельных запросов: интервал снятия стеков, каталог файлов, сколько последних файлов
+# в нем хранится и срок жизни подписи X-Profile
+PROFILER_INTERVAL = float(os.environ.get("PROFILER_INTERVAL", 0.005))
+PROFILER_OUTPUT_DIR = os.environ.get("PROFILER_OUTPUT_DIR", BASE_DIR / 'profiles')
+PROFILER_MAX_FILES = int(os.environ.get("PROFILER_MAX_FILES", 100))
+PROFILER_TOKEN_MAX_AGE = 3600
+
+# токен сборщика метрик для /internal/metrics (Authorization: Bearer ...),
+# для gunicorn с несколькими воркерами нужна переменная PROMETHEUS_MULTIPROC_DIR
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+# хранилище корзины: "session" (в сессии) или "redis" (hash в Redis кеша с атомарными изменениями)
+BASKET_BACKEND = os.environ.get("BASKET_BACKEND", "session")
+# время жизни корзины в Redis после последнего изменения
+BASKET_TTL = int(os.environ.get("BASKET_TTL", 60 * 60 * 24 * 14))
+
+# изменения отзывов за это число секунд применяются к агрегатам товаров одним пересчетом
+REVIEW_STATS_DELAY = int(os.environ.get("REVIEW_STATS_DELAY", 5))
+
 CELERY_BROKER_URL = 'redis://redis:6379/0'
 
 CELERY_RESULT_BACKEND = 'redis://redis:6379/0'
 
 CACHES = {
     "default": {
-        "BACKEND": "django_redis.cache.RedisCache",
+        "BACKEND": "mymonitoring.cache.InstrumentedRedisCache",
         "LOCATION": "redis://redis:6379/1",
 
     }
-}
\ No newline at end of file
+}
+# тесты используют свою базу Redis, раннер очищает ее перед запуском и после него
+TEST_RUNNER = "megano.test_runner.IsolatedCacheTestRunner"
+TEST_CACHE_LOCATION = os.environ.get("TEST_CACHE_LOCATION", "redis://redis:6379/15")
+# способ выбора случайных банеров: "uniform" или "rating" (чаще товары с высоким рейтингом)
+BANNERS_WEIGHTING = os.environ.get("BANNERS_WEIGHTING", "uniform")
@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class IsolatedCacheTestRunner(DiscoverRunner):
+
+    """
+    Раннер тестов с отдельной базой Redis для кеша (TEST_CACHE_LOCATION).
+    Кеш, пул банеров, рейтинги и корзины живут в Redis дольше одного запуска тестов,
+    поэтому ключи прошлого запуска, в том числе записанные другой версией кода,
+    делали результат зависимым от истории запусков. База очищается до и после тестов
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        caches = {alias: dict(config) for alias, config in settings.CACHES.items()}
+        caches["default"]["LOCATION"] = settings.TEST_CACHE_LOCATION
+        self.cache_override = override_settings(CACHES=caches)
+        self.cache_override.enable()
+        cache.clear()
+
+    def teardown_test_environment(self, **kwargs):
+        cache.clear()
+        self.cache_override.disable()
+        super().teardown_test_environment(**kwargs)
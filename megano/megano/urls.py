@@ -25,6 +25,7 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path("api/", include('mycatalog.urls')),
     path("api/", include('myorders.urls')),
+    path("internal/", include('mymonitoring.urls')),
     path("", include("frontend.urls")),
 
     path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
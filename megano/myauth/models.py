@@ -1,8 +1,12 @@
 from django.db import models
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save, pre_save
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 from django.core.files.storage import default_storage
+from megano.cache import namespace_delete
+
+
+PROFILE_NAMESPACE = "profile"
 
 
 def profile_avatar_directory_path(instance: "Avatar", filename: str) -> str:
@@ -64,3 +68,12 @@ def delete_old_avatar(sender, instance, **kwargs):
 
 
 pre_save.connect(delete_old_avatar, sender=Profile)
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def invalidate_profile_cache(sender, instance, **kwargs):
+    """
+    функция удаляет из кеша данные профиля пользователя после их изменения
+    """
+    namespace_delete(PROFILE_NAMESPACE, instance.user_id)
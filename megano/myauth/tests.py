@@ -99,6 +99,16 @@ class ProfileUpdateViewTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['fullName'], self.user.profile.fullName)
 
+    def test_profile_cache_per_user(self):
+        url = reverse('myauth:profile')
+        self.client.get(url)
+        self.client.post(url, {'fullName': 'new name', 'phone': '', 'email': ''}, format='json')
+        self.assertEqual(self.client.get(url).data['fullName'], 'new name')
+
+        other_user = User.objects.create_user(username='otheruser', password='otherpassword')
+        self.client.force_authenticate(user=other_user)
+        self.assertNotEqual(self.client.get(url).data['fullName'], 'new name')
+
 class PostPasswordViewTestCase(APITestCase):
     def setUp(self):
         self.user = User.objects.create_user(username='testuser', password='testpassword')
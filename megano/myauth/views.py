@@ -1,8 +1,8 @@
 import json
 from rest_framework import status
-from django.core.cache import cache
+from megano.cache import namespace_get, namespace_set
 from rest_framework import generics
-from .models import Profile, Avatar
+from .models import PROFILE_NAMESPACE, Profile, Avatar
 from rest_framework.views import APIView
 from rest_framework.request import Request
 from django.contrib.auth.models import User
@@ -141,22 +141,18 @@ class ProfileUpdateView(APIView):
         serializer = ProfileGetPostSerializer(data=data, instance=profile)
         if serializer.is_valid():
             serializer.save()
-            cache.set('profile_cache', profile, 20)
             return Response(data=serializer.data, status=status.HTTP_200_OK)
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     def get(self, request):
         user = request.user
-        profile_cache_name = 'profile_cache'
-        profile_cache = cache.get(profile_cache_name)
-        if profile_cache:
-            profile = profile_cache
-        else:
+        profile_data = namespace_get(PROFILE_NAMESPACE, user.pk)
+        if profile_data is None:
             profile = get_object_or_404(Profile, user=user)
-            cache.set(profile_cache_name, profile, 20)
-        serializer = ProfileGetPostSerializer(instance=profile)
-        return Response(data=serializer.data, status=status.HTTP_200_OK)
+            profile_data = ProfileGetPostSerializer(instance=profile).data
+            namespace_set(PROFILE_NAMESPACE, profile_data, user.pk)
+        return Response(data=profile_data, status=status.HTTP_200_OK)
 
 
 @extend_schema(tags=["myauth APP"])
@@ -209,7 +205,6 @@ class PostAvatarView(APIView):
         avatar.profile_rel = profile
         avatar.save()
         profile.save()
-        cache.set('profile_cache', profile, 20)
         response_data = {
             'src': avatar.image.url,
             'alt': 'Image alt string',
@@ -0,0 +1,123 @@
+import json
+import time
+import hashlib
+from typing import Any, Dict, Iterable, Optional, Tuple
+from django.core.cache import cache
+from django.db import transaction
+from megano.cache import namespace_key
+
+
+CATALOG_NAMESPACE = "catalog"
+CATEGORIES_NAMESPACE = "categories"
+TAGS_NAMESPACE = "tags"
+CATALOG_HITS_KEY = "catalog:hits"
+CATALOG_MISSES_KEY = "catalog:misses"
+CATALOG_PAGE_TIMEOUT = 60 * 60
+SEARCH_PARAMETER = "filter[name]"
+# пустой cursor запрашивает первую страницу курсорной пагинации, ответ другой формы
+CURSOR_PARAMETER = "cursor"
+PRODUCT_DETAIL_KEY = "product:detail:{product_id}"
+PRODUCT_MODIFIED_KEY = "product:modified:{product_id}"
+PRODUCT_DETAIL_TIMEOUT = 60 * 60
+PRODUCT_MODIFIED_TIMEOUT = 7 * 24 * 60 * 60
+
+FilterSpec = Tuple[Tuple[str, Any], ...]
+
+
+def catalog_filter_spec(filtered_dict: Dict[str, Any]) -> FilterSpec:
+
+    """
+    функция приводит разобранные параметры каталога к нормализованному виду:
+    пустые параметры отбрасываются (кроме cursor, который выбирает вид пагинации),
+    списки сортируются, поисковая строка приводится к нижнему регистру,
+    поэтому одинаковые по смыслу запросы дают одинаковый ключ
+    :param filtered_dict: словарь DataFilter.filtered_dict
+    :return: неизменяемый кортеж пар "параметр, значение"
+    """
+
+    spec = []
+    for key, value in filtered_dict.items():
+        if isinstance(value, list):
+            value = tuple(sorted((item for item in value if item != ''), key=str))
+        elif isinstance(value, str):
+            value = value.strip()
+            if key == SEARCH_PARAMETER:
+                value = value.lower()
+        if value in ('', None, ()) and key != CURSOR_PARAMETER:
+            continue
+        spec.append((key, value))
+    return tuple(sorted(spec))
+
+
+def catalog_page_key(spec: FilterSpec) -> str:
+    digest = hashlib.sha1(json.dumps(spec, ensure_ascii=False).encode()).hexdigest()
+    return namespace_key(CATALOG_NAMESPACE, f"page:{digest}")
+
+
+def count_catalog_cache(hit: bool) -> None:
+    key = CATALOG_HITS_KEY if hit else CATALOG_MISSES_KEY
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, timeout=None)
+
+
+def get_catalog_cache_stats() -> Dict[str, Any]:
+
+    """функция возвращает счетчики попаданий в кеш каталога и долю попаданий"""
+
+    hits = cache.get(CATALOG_HITS_KEY) or 0
+    misses = cache.get(CATALOG_MISSES_KEY) or 0
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "ratio": round(hits / total, 4) if total else 0.0,
+    }
+
+
+def product_detail_key(product_id: int) -> str:
+    return PRODUCT_DETAIL_KEY.format(product_id=product_id)
+
+
+def invalidate_product_details(product_ids: Iterable[int]) -> None:
+
+    """функция удаляет из кеша детальные документы переданных товаров
+    и запоминает время их изменения для условных GET запросов"""
+
+    product_ids = {product_id for product_id in product_ids if product_id is not None}
+    if product_ids:
+        cache.delete_many([product_detail_key(product_id) for product_id in product_ids])
+        now = time.time()
+        cache.set_many(
+            {PRODUCT_MODIFIED_KEY.format(product_id=product_id): now for product_id in product_ids},
+            timeout=PRODUCT_MODIFIED_TIMEOUT,
+        )
+
+
+def invalidate_product_details_on_commit(product_ids: Iterable[int]) -> None:
+
+    """функция удаляет детальные документы и меняет время изменения товаров после фиксации
+    текущей транзакции, иначе параллельный запрос успевает закешировать старый документ"""
+
+    product_ids = list(product_ids)
+    transaction.on_commit(lambda: invalidate_product_details(product_ids))
+
+
+def remember_product_modified(product_ids: Iterable[int]) -> None:
+
+    """функция запоминает время изменения собранных из базы товаров, если оно еще не записано,
+    поэтому ключи появляются только у существующих товаров"""
+
+    now = time.time()
+    for product_id in product_ids:
+        cache.add(PRODUCT_MODIFIED_KEY.format(product_id=product_id), now, timeout=PRODUCT_MODIFIED_TIMEOUT)
+
+
+def get_product_modified(product_id: int) -> Optional[float]:
+
+    """функция возвращает время последнего изменения детальных данных товара (unix time)
+    или None, если оно неизвестно. Чтение ключ не создает: иначе запросы к несуществующим
+    id заполняли бы Redis без ограничений"""
+
+    return cache.get(PRODUCT_MODIFIED_KEY.format(product_id=product_id))
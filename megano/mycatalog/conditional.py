@@ -0,0 +1,84 @@
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+from typing import Any, Callable, Optional
+from django.utils.http import http_date
+from django.views.decorators.http import condition
+from rest_framework.request import Request
+from megano.cache import get_generation, get_modified
+from .cache import CATALOG_NAMESPACE, get_product_modified
+from .stores import current_banner_ids
+
+
+def to_datetime(timestamp: float) -> datetime:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc)
+
+
+def namespace_condition(namespace: str) -> Callable:
+
+    """
+    функция возвращает декоратор условного GET для данных пространства имен кеша:
+    ETag строится по поколению, Last-Modified по времени его смены,
+    поэтому ответ 304 отдается без запросов к базе и без сериализации
+    """
+
+    def etag(request: Request, *args: Any, **kwargs: Any) -> str:
+        return f'"{namespace}-{get_generation(namespace)}"'
+
+    def last_modified(request: Request, *args: Any, **kwargs: Any) -> datetime:
+        return to_datetime(get_modified(namespace))
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
+
+
+def banners_etag(request: Request, *args: Any, **kwargs: Any) -> str:
+
+    """функция строит ETag по текущей выборке банеров, выборка хранится
+    в поколении кеша каталога, поэтому ETag меняется и при изменении товаров"""
+
+    ids = ",".join(str(product_id) for product_id in current_banner_ids())
+    digest = hashlib.sha1(ids.encode()).hexdigest()[:16]
+    return f'"banners-{get_generation(CATALOG_NAMESPACE)}-{digest}"'
+
+
+def product_etag(request: Request, *args: Any, **kwargs: Any) -> Optional[str]:
+
+    """функция строит ETag по времени изменения товара, пока оно неизвестно
+    (товар еще не собирался из базы) ответ отдается без валидатора"""
+
+    product_id = kwargs.get("id")
+    modified = get_product_modified(product_id)
+    if modified is None:
+        return None
+    return f'"product-{product_id}-{int(modified * 1000)}"'
+
+
+def product_last_modified(request: Request, *args: Any, **kwargs: Any) -> Optional[datetime]:
+    modified = get_product_modified(kwargs.get("id"))
+    return to_datetime(modified) if modified is not None else None
+
+
+def product_condition(view: Callable) -> Callable:
+
+    """
+    декоратор условного GET детальной страницы товара. Время изменения товара
+    записывается при первой сборке его документа, поэтому валидаторы, неизвестные
+    до вызова вью, добавляются в ответ после него
+    """
+
+    conditional_view = condition(etag_func=product_etag, last_modified_func=product_last_modified)(view)
+
+    @wraps(view)
+    def wrapper(request: Request, *args: Any, **kwargs: Any) -> Any:
+        response = conditional_view(request, *args, **kwargs)
+        if response.status_code == 200 and not response.has_header("ETag"):
+            etag = product_etag(request, *args, **kwargs)
+            if etag is not None:
+                response.headers["ETag"] = etag
+                response.headers["Last-Modified"] = http_date(product_last_modified(request, *args, **kwargs).timestamp())
+        return response
+
+    return wrapper
+
+
+banners_condition = condition(etag_func=banners_etag)
@@ -0,0 +1,103 @@
+import csv
+import json
+from typing import Any, Dict, Iterator, List
+from django.db.models import BooleanField, ExpressionWrapper
+from django.utils import timezone
+from .models import Product
+from .renderers import render_datetime, render_price
+from .services import active_sale_q, effective_price_expression
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+EXPORT_CHUNK_SIZE = 500
+EXPORT_FIELDS = [
+    "id", "title", "categoryId", "category", "price", "salePrice", "discount",
+    "saleFrom", "saleTo", "count", "freeDelivery", "tags",
+]
+EXPORT_CONTENT_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def export_rows() -> Iterator[Dict[str, Any]]:
+
+    """
+    функция перебирает все товары каталога пачками по EXPORT_CHUNK_SIZE,
+    в памяти находится только текущая пачка вместе с ее тегами
+    """
+
+    current_timezone = timezone.get_current_timezone()
+    products = (
+        Product.objects.select_related('category', 'sale')
+        .prefetch_related('tags')
+        .annotate(
+            effective_price=effective_price_expression(),
+            sale_active=ExpressionWrapper(active_sale_q(), output_field=BooleanField()),
+        )
+        .order_by('pk')
+    )
+    for product in products.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        sale = product.sale if product.sale_active else None
+        yield {
+            "id": product.pk,
+            "title": product.title,
+            "categoryId": product.category_id,
+            "category": product.category.title if product.category else None,
+            "price": render_price(product.price),
+            "salePrice": render_price(product.effective_price) if sale else None,
+            "discount": sale.discount if sale else None,
+            "saleFrom": render_datetime(sale.date_from, current_timezone) if sale else None,
+            "saleTo": render_datetime(sale.date_to, current_timezone) if sale else None,
+            "count": product.count,
+            "freeDelivery": product.freeDelivery,
+            "tags": sorted(tag.name for tag in product.tags.all()),
+        }
+
+
+def encode_ndjson(row: Dict[str, Any]) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(row, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(row, ensure_ascii=False, separators=(',', ':')) + "\n").encode()
+
+
+def stream_ndjson() -> Iterator[bytes]:
+
+    """функция отдает каталог построчно, одна строка JSON на товар"""
+
+    for row in export_rows():
+        yield encode_ndjson(row)
+
+
+class Echo:
+
+    """Буфер для csv.writer, который сразу возвращает записанную строку"""
+
+    def write(self, value: str) -> str:
+        return value
+
+
+def csv_values(row: Dict[str, Any]) -> List[Any]:
+    values = [row[field] for field in EXPORT_FIELDS]
+    values[EXPORT_FIELDS.index("tags")] = "|".join(row["tags"])
+    return values
+
+
+def stream_csv() -> Iterator[bytes]:
+
+    """функция отдает каталог построчно в формате CSV с заголовком, теги разделены символом |"""
+
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS).encode()
+    for row in export_rows():
+        yield writer.writerow(csv_values(row)).encode()
+
+
+EXPORT_STREAMS = {
+    "ndjson": stream_ndjson,
+    "csv": stream_csv,
+}
@@ -0,0 +1,286 @@
+import threading
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from django.core.cache import cache
+from .models import Categories, Product
+
+
+FACETS_VERSION_KEY = "catalog:facets:version"
+FACETS_CHANGE_KEY = "catalog:facets:change:{version}"
+FACETS_CHANGE_TIMEOUT = 60 * 60
+# отставший больше чем на столько версий процесс перестраивает индекс целиком
+FACETS_MAX_CHANGES = 500
+FACETS_REFRESH_BATCH_SIZE = 500
+
+
+def iter_bits(bits: int) -> Iterator[int]:
+
+    """функция перебирает номера установленных битов, номер бита равен id товара.
+    Двоичная строка строится за один проход, снятие младшего бита в цикле
+    копировало бы все число на каждом шаге"""
+
+    digits = bin(bits)[:1:-1]
+    position = digits.find('1')
+    while position != -1:
+        yield position
+        position = digits.find('1', position + 1)
+
+
+def bits_from_ids(product_ids: Iterable[int]) -> int:
+
+    """функция собирает битовое множество из id товаров за один проход"""
+
+    product_ids = list(product_ids)
+    if not product_ids:
+        return 0
+    buffer = bytearray(max(product_ids) // 8 + 1)
+    for product_id in product_ids:
+        buffer[product_id >> 3] |= 1 << (product_id & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def category_ancestors(path: str) -> List[int]:
+
+    """функция возвращает id категории и всех ее предков по материализованному пути"""
+
+    return [int(segment) for segment in path.split('/') if segment]
+
+
+class FacetIndex:
+
+    """
+    Индекс фасетов каталога в памяти процесса.
+    Для каждого тега, категории (вместе с подкатегориями и отдельно только
+    с собственными товарами) и булевого признака хранится битовое множество товаров в виде int, где бит с номером id товара
+    установлен если товар входит в множество. Пересечение множеств дает
+    количество и id товаров для любой комбинации фильтров.
+    После фиксации изменения товара сигнал меняет версию в общем кеше и записывает
+    под ней id измененных товаров, каждый процесс при чтении перечитывает из базы
+    только эти товары. Версия без списка товаров (изменение дерева категорий,
+    загрузка фикстур) или слишком большое отставание перестраивают индекс целиком.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.version = None
+        self.clear()
+
+    def clear(self) -> None:
+        self.all = 0
+        self.free_delivery = 0
+        self.available = 0
+        self.tags = defaultdict(int)
+        self.categories = defaultdict(int)
+        self.exact_categories = defaultdict(int)
+        self.category_paths = {}
+
+    def rebuild(self) -> None:
+
+        """метод строит индекс заново тремя запросами"""
+
+        with self.lock:
+            version = get_facets_version()
+            self.clear()
+            self.category_paths = dict(Categories.objects.values_list('pk', 'path'))
+            products = Product.objects.values_list('pk', 'category_id', 'freeDelivery', 'count')
+            tag_links = Product.tags.through.objects.values_list('tag_id', 'product_id')
+            self.add_products(products.iterator(chunk_size=2000), tag_links.iterator(chunk_size=2000))
+            self.version = version
+
+    def ensure_fresh(self) -> None:
+        version = get_facets_version()
+        if self.version == version:
+            return
+        with self.lock:
+            if self.version is None or not self.apply_changes(version):
+                self.rebuild()
+
+    def apply_changes(self, version: int) -> bool:
+
+        """метод обновляет товары, измененные после версии индекса процесса
+        :return: False, если изменения неизвестны и индекс нужно перестроить"""
+
+        if self.version == version:
+            return True
+        if not 0 < version - self.version <= FACETS_MAX_CHANGES:
+            return False
+        keys = [FACETS_CHANGE_KEY.format(version=number) for number in range(self.version + 1, version + 1)]
+        changes = cache.get_many(keys)
+        if len(changes) != len(keys):
+            return False
+        self.refresh_products(set().union(*changes.values()))
+        self.version = version
+        return True
+
+    def add_products(self, products: Iterable[Tuple[int, Optional[int], bool, int]],
+                     tag_links: Iterable[Tuple[int, int]]) -> None:
+
+        """метод добавляет товары в индекс: id сначала собираются по множествам,
+        затем каждое множество строится один раз через bits_from_ids,
+        побитовое ИЛИ на каждую строку копировало бы все число
+        :param products: строки (id, id категории, бесплатная доставка, количество)
+        :param tag_links: строки (id тега, id товара)"""
+
+        all_ids, free_delivery_ids, available_ids = [], [], []
+        category_ids, exact_category_ids, tag_ids = defaultdict(list), defaultdict(list), defaultdict(list)
+        for product_id, category_id, free_delivery, count in products:
+            all_ids.append(product_id)
+            if free_delivery:
+                free_delivery_ids.append(product_id)
+            if count and count > 0:
+                available_ids.append(product_id)
+            if category_id is not None:
+                exact_category_ids[category_id].append(product_id)
+                path = self.category_paths.get(category_id)
+                for ancestor_id in category_ancestors(path) if path else [category_id]:
+                    category_ids[ancestor_id].append(product_id)
+        for tag_id, product_id in tag_links:
+            tag_ids[tag_id].append(product_id)
+        self.all |= bits_from_ids(all_ids)
+        self.free_delivery |= bits_from_ids(free_delivery_ids)
+        self.available |= bits_from_ids(available_ids)
+        for bitsets, collected in (
+            (self.categories, category_ids),
+            (self.exact_categories, exact_category_ids),
+            (self.tags, tag_ids),
+        ):
+            for key, product_ids in collected.items():
+                bitsets[key] |= bits_from_ids(product_ids)
+
+    def clear_products(self, product_ids: Iterable[int]) -> None:
+        mask = ~bits_from_ids(product_ids)
+        self.all &= mask
+        self.free_delivery &= mask
+        self.available &= mask
+        for bitsets in (self.tags, self.categories, self.exact_categories):
+            for key in bitsets:
+                bitsets[key] &= mask
+
+    def refresh_products(self, product_ids: Iterable[int]) -> None:
+
+        """метод перечитывает биты товаров из базы, удаленные товары убираются из индекса"""
+
+        product_ids = sorted(product_ids)
+        with self.lock:
+            self.clear_products(product_ids)
+            for start in range(0, len(product_ids), FACETS_REFRESH_BATCH_SIZE):
+                batch = product_ids[start:start + FACETS_REFRESH_BATCH_SIZE]
+                products = Product.objects.filter(pk__in=batch).values_list('pk', 'category_id', 'freeDelivery', 'count')
+                tag_links = Product.tags.through.objects.filter(product_id__in=batch).values_list('tag_id', 'product_id')
+                self.add_products(products, tag_links)
+
+    def category_bitsets(self, subcategories: bool = True) -> Dict[int, int]:
+        return self.categories if subcategories else self.exact_categories
+
+    def select(self, tags: Iterable[int] = (), category: Optional[int] = None,
+               free_delivery: bool = False, available: bool = False,
+               restrict: Optional[int] = None, exclude: str = None, subcategories: bool = True) -> int:
+
+        """метод пересекает множества выбранных фильтров,
+        фильтр с именем exclude не учитывается (для подсчета его собственных вариантов),
+        restrict - множество товаров, прошедших фильтры, которых нет в индексе (поиск, цена),
+        subcategories - включать ли в категорию товары ее подкатегорий, как в DataFilter"""
+
+        bits = self.all if restrict is None else self.all & restrict
+        tags = list(tags)
+        if tags and exclude != 'tags':
+            tag_bits = 0
+            for tag_id in tags:
+                tag_bits |= self.tags.get(tag_id, 0)
+            bits &= tag_bits
+        if category is not None and exclude != 'category':
+            bits &= self.category_bitsets(subcategories).get(category, 0)
+        if free_delivery and exclude != 'freeDelivery':
+            bits &= self.free_delivery
+        if available and exclude != 'available':
+            bits &= self.available
+        return bits
+
+    def matching_ids(self, **filters: Any) -> List[int]:
+        self.ensure_fresh()
+        return list(iter_bits(self.select(**filters)))
+
+    def facet_counts(self, **filters: Any) -> Dict[str, Any]:
+
+        """метод считает количество товаров для каждого варианта фильтров
+        с учетом остальных выбранных фильтров"""
+
+        self.ensure_fresh()
+        with self.lock:
+            without_tags = self.select(exclude='tags', **filters)
+            without_category = self.select(exclude='category', **filters)
+            category_bitsets = self.category_bitsets(filters.get('subcategories', True))
+            tags = [
+                {"id": tag_id, "count": (bits & without_tags).bit_count()}
+                for tag_id, bits in sorted(self.tags.items()) if bits
+            ]
+            categories = [
+                {"id": category_id, "count": (bits & without_category).bit_count()}
+                for category_id, bits in sorted(category_bitsets.items()) if bits
+            ]
+            return {
+                "total": self.select(**filters).bit_count(),
+                "tags": tags,
+                "categories": categories,
+                "freeDelivery": (self.select(exclude='freeDelivery', **filters) & self.free_delivery).bit_count(),
+                "available": (self.select(exclude='available', **filters) & self.available).bit_count(),
+            }
+
+
+def get_facets_version() -> int:
+    version = cache.get(FACETS_VERSION_KEY)
+    if version is None:
+        cache.add(FACETS_VERSION_KEY, 1, timeout=None)
+        version = cache.get(FACETS_VERSION_KEY)
+    return version
+
+
+def bump_facets_version() -> Optional[int]:
+
+    """
+    функция меняет версию индекса фасетов в общем кеше, без записанного под ней
+    списка товаров процессы перестроят индекс целиком
+    :return: новая версия или None, если ключ версии вытеснен
+    """
+
+    if cache.add(FACETS_VERSION_KEY, 1, timeout=None):
+        return 1
+    try:
+        return cache.incr(FACETS_VERSION_KEY)
+    except ValueError:
+        return None
+
+
+def publish_facets_change(product_ids: Iterable[int]) -> None:
+
+    """функция меняет версию индекса фасетов и записывает под ней id измененных товаров,
+    вызывается после фиксации транзакции, чтобы процессы прочитали уже новые данные"""
+
+    product_ids = [product_id for product_id in product_ids if product_id is not None]
+    if not product_ids:
+        return
+    version = bump_facets_version()
+    if version is not None:
+        cache.set(FACETS_CHANGE_KEY.format(version=version), product_ids, FACETS_CHANGE_TIMEOUT)
+
+
+facet_index = FacetIndex()
+
+
+def catalog_facets(filtered_dict: Dict[str, Any], restrict_ids: Optional[Iterable[int]] = None) -> Dict[str, Any]:
+
+    """функция считает блок фасетов каталога по параметрам запроса DataFilter.filtered_dict,
+    restrict_ids - id товаров, прошедших поиск и фильтр по цене, или None без этих фильтров"""
+
+    tags = filtered_dict.get('tags[]') or []
+    if not isinstance(tags, list):
+        tags = [tags]
+    category = filtered_dict.get('category')
+    return facet_index.facet_counts(
+        tags=[tag for tag in tags if isinstance(tag, int)],
+        category=category if isinstance(category, int) else None,
+        free_delivery=filtered_dict.get('filter[freeDelivery]') == 'true',
+        available=filtered_dict.get('filter[available]') == 'true',
+        subcategories=filtered_dict.get('subcategories') != 'false',
+        restrict=bits_from_ids(restrict_ids) if restrict_ids is not None else None,
+    )
@@ -3,9 +3,16 @@ from rest_framework import serializers
 from .models import Categories, Product, Tag, Review
 
 
+class ImageVariantSw(serializers.Serializer):
+    src = serializers.CharField()
+    width = serializers.IntegerField()
+    height = serializers.IntegerField()
+
+
 class ImageSw(serializers.Serializer):
     src = serializers.CharField()
     alt = serializers.CharField()
+    srcset = ImageVariantSw(many=True)
 
 
 class TagSw(serializers.Serializer):
@@ -47,10 +54,24 @@ class ProductSw(serializers.Serializer):
     rating = serializers.IntegerField()
 
 
+class FacetCountSw(serializers.Serializer):
+    id = serializers.IntegerField()
+    count = serializers.IntegerField()
+
+
+class FacetsSw(serializers.Serializer):
+    total = serializers.IntegerField()
+    tags = FacetCountSw(many=True)
+    categories = FacetCountSw(many=True)
+    freeDelivery = serializers.IntegerField()
+    available = serializers.IntegerField()
+
+
 class CatalogSw(serializers.Serializer):
     items = ProductSw(many=True)
     currentPage = serializers.IntegerField()
     lastPage = serializers.IntegerField()
+    facets = FacetsSw()
 
 
 class QuerySerializerFilter(serializers.Serializer):
@@ -0,0 +1,77 @@
+import posixpath
+from io import BytesIO
+from typing import Any, Dict, Iterable, List, Union
+from PIL import Image, ImageOps
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from megano.cache import bump_generation
+from .cache import CATALOG_NAMESPACE, CATEGORIES_NAMESPACE, invalidate_product_details
+from .models import CategoryImage, ImageVariant, ProductImage
+
+
+IMAGE_VARIANT_WIDTHS = (160, 320, 640)
+IMAGE_VARIANT_FORMAT = "WEBP"
+IMAGE_VARIANT_EXTENSION = "webp"
+IMAGE_VARIANT_QUALITY = 80
+IMAGE_VARIANT_DIRECTORY = "image_variants"
+IMAGE_MODELS = {
+    "product": ProductImage,
+    "category": CategoryImage,
+}
+
+
+def image_srcset(variants: Iterable[ImageVariant]) -> List[Dict[str, Any]]:
+
+    """функция возвращает уменьшенные копии картинки для srcset, от меньшей к большей"""
+
+    return [
+        {"src": default_storage.url(variant.image.name), "width": variant.width, "height": variant.height}
+        for variant in sorted(variants, key=lambda variant: variant.width)
+    ]
+
+
+def open_source_image(image_object: Union[ProductImage, CategoryImage]) -> Image.Image:
+    with image_object.image.open('rb') as source:
+        image = Image.open(source)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        has_alpha = 'A' in image.getbands() or 'transparency' in image.info
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+    return image
+
+
+def generate_image_variants(image_object: Union[ProductImage, CategoryImage]) -> int:
+
+    """
+    функция пересоздает уменьшенные webp копии картинки товара или категории
+    для ширин IMAGE_VARIANT_WIDTHS (картинки не увеличиваются) и запоминает их размеры
+    :return: колличество созданных копий
+    """
+
+    for variant in image_object.variants.all():
+        variant.delete()
+    if not image_object.image:
+        return 0
+    image = open_source_image(image_object)
+    widths = [width for width in IMAGE_VARIANT_WIDTHS if width < image.width] or [image.width]
+    stem = posixpath.splitext(posixpath.basename(image_object.image.name))[0]
+    owner = {"product_image": image_object} if isinstance(image_object, ProductImage) else {"category_image": image_object}
+    variants = []
+    for width in widths:
+        height = max(1, round(image.height * width / image.width))
+        resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+        buffer = BytesIO()
+        resized.save(buffer, IMAGE_VARIANT_FORMAT, quality=IMAGE_VARIANT_QUALITY)
+        name = default_storage.save(
+            posixpath.join(IMAGE_VARIANT_DIRECTORY, f"{stem}_{width}w.{IMAGE_VARIANT_EXTENSION}"),
+            ContentFile(buffer.getvalue()),
+        )
+        variants.append(ImageVariant(image=name, width=width, height=height, size=buffer.tell(), **owner))
+    ImageVariant.objects.bulk_create(variants)
+    if isinstance(image_object, ProductImage):
+        invalidate_product_details([image_object.images_product_id])
+        bump_generation(CATALOG_NAMESPACE)
+    else:
+        bump_generation(CATEGORIES_NAMESPACE)
+    return len(variants)
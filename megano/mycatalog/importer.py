@@ -0,0 +1,324 @@
+import csv
+import io
+import json
+import sys
+from collections import Counter
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, IO, Iterable, Iterator, List, Set, Tuple
+from django.core.management.color import no_style
+from django.db import DatabaseError, connection, transaction
+from megano.cache import bump_generation
+from .cache import CATALOG_NAMESPACE, TAGS_NAMESPACE, invalidate_product_details
+from .facets import bump_facets_version
+from .models import Categories, Product, Specification, Tag
+from .search import index_products
+from .stores import invalidate_product_stores
+
+
+IMPORT_BATCH_SIZE = 1000
+IMPORT_LIST_SEPARATOR = "|"
+IMPORT_SPECIFICATION_SEPARATOR = ":"
+TAG_NAME_LENGTH = Tag._meta.get_field('name').max_length
+SPECIFICATION_LENGTH = Specification._meta.get_field('name').max_length
+TRUE_VALUES = {"1", "true", "yes", "y", "on"}
+
+
+class ImportRowError(ValueError):
+    pass
+
+
+class ImportBatchError(Exception):
+
+    """Ошибка базы данных при записи пачки: пачка откатывается, загрузка прерывается,
+    stats - счетчики уже записанных пачек"""
+
+    def __init__(self, message: str, stats: Counter):
+        super().__init__(message)
+        self.stats = stats
+
+
+def read_ndjson(stream: IO[str]) -> Iterator[Dict[str, Any]]:
+
+    """функция читает NDJSON по строкам, вместо строки с неверным JSON отдается ImportRowError
+    с номером строки файла, и загрузка пропускает ее как любую другую неверную строку"""
+
+    for number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as error:
+            row = ImportRowError(f"invalid JSON on line {number}: {error.msg}")
+        yield row
+
+
+def read_csv(stream: IO[str]) -> Iterator[Dict[str, Any]]:
+    yield from csv.DictReader(stream)
+
+
+IMPORT_READERS = {
+    "ndjson": read_ndjson,
+    "csv": read_csv,
+}
+
+
+def detect_format(path: str) -> str:
+    return "csv" if path.lower().endswith(".csv") else "ndjson"
+
+
+def parse_bool(value: Any) -> bool:
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in TRUE_VALUES
+
+
+def parse_list(value: Any) -> List[str]:
+    if isinstance(value, list):
+        return [str(item).strip() for item in value if str(item).strip()]
+    return [item.strip() for item in str(value or "").split(IMPORT_LIST_SEPARATOR) if item.strip()]
+
+
+def parse_specifications(value: Any) -> List[Tuple[str, str]]:
+
+    """функция разбирает спецификации: список {"name", "value"} в NDJSON или строку name:value|name:value в CSV"""
+
+    if isinstance(value, list) and all(isinstance(item, dict) for item in value):
+        return [(str(item.get("name") or ""), str(item.get("value") or "")) for item in value]
+    specifications = []
+    for item in parse_list(value):
+        name, _, item_value = item.partition(IMPORT_SPECIFICATION_SEPARATOR)
+        specifications.append((name.strip(), item_value.strip()))
+    return specifications
+
+
+class CatalogImporter:
+
+    """
+    Загрузка товаров из CSV/NDJSON пачками. Товар определяется по id,
+    категории, теги и спецификации ищутся по словарям в памяти,
+    новые теги и спецификации создаются одним запросом на пачку.
+    Меняются только строки, значения которых отличаются от базы данных,
+    поэтому повторная загрузка того же файла ничего не пишет.
+    Сигналы моделей при bulk операциях не вызываются, поэтому после загрузки
+    поисковые документы, фасеты, банеры, рейтинги и кеши обновляются один раз
+    """
+
+    def __init__(self, batch_size: int = IMPORT_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.stats = Counter()
+        self.errors: List[str] = []
+        self.changed_ids: Set[int] = set()
+        self.created_ids: Set[int] = set()
+        self.categories_by_id = set(Categories.objects.values_list('pk', flat=True))
+        self.categories_by_title: Dict[str, int] = {}
+        for pk, title in Categories.objects.order_by('-pk').values_list('pk', 'title'):
+            self.categories_by_title[title] = pk
+        self.tags: Dict[str, int] = {}
+        for pk, name in Tag.objects.order_by('-pk').values_list('pk', 'name'):
+            self.tags[name or ""] = pk
+        self.specifications: Dict[Tuple[str, str], int] = {}
+        for pk, name, value in Specification.objects.order_by('-pk').values_list('pk', 'name', 'value'):
+            self.specifications[(name or "", value or "")] = pk
+
+    def run(self, rows: Iterable[Dict[str, Any]]) -> Counter:
+        batch, first_line, line = [], 1, 0
+        try:
+            for line, row in enumerate(rows, start=1):
+                try:
+                    batch.append(self.parse_row(row))
+                except ImportRowError as error:
+                    self.skip(f"row {line}: {error}")
+                if len(batch) >= self.batch_size:
+                    self.write_batch(batch, first_line, line)
+                    batch, first_line = [], line + 1
+            if batch:
+                self.write_batch(batch, first_line, line)
+        finally:
+            # уже записанные пачки должны попасть в индексы даже если файл оборвался
+            self.finish()
+        return self.stats
+
+    def write_batch(self, batch: List[Dict[str, Any]], first_line: int, last_line: int) -> None:
+        stats = self.stats.copy()
+        try:
+            self.import_batch(batch)
+        except DatabaseError as error:
+            # пачка откатилась целиком, ее строки не считаются загруженными
+            self.stats = stats
+            raise ImportBatchError(f"rows {first_line}-{last_line}: {error}", stats) from error
+
+    def skip(self, error: str) -> None:
+        self.stats["skipped"] += 1
+        self.errors.append(error)
+
+    def parse_row(self, row: Dict[str, Any]) -> Dict[str, Any]:
+
+        """метод приводит строку файла к значениям полей товара, отсутствующие колонки не меняются"""
+
+        if isinstance(row, ImportRowError):
+            raise row
+        try:
+            product_id = int(row["id"])
+        except (KeyError, TypeError, ValueError):
+            raise ImportRowError("id is required")
+        fields = {}
+        try:
+            if row.get("title") not in (None, ""):
+                fields["title"] = str(row["title"])
+            if row.get("price") not in (None, ""):
+                fields["price"] = Decimal(str(row["price"])).quantize(Decimal("0.01"))
+            if row.get("count") not in (None, ""):
+                fields["count"] = int(row["count"])
+        except (InvalidOperation, ValueError):
+            raise ImportRowError("price and count must be numbers")
+        for name in ("description", "fullDescription"):
+            if name in row:
+                fields[name] = row[name] or None
+        if row.get("freeDelivery") not in (None, ""):
+            fields["freeDelivery"] = parse_bool(row["freeDelivery"])
+        if row.get("categoryId") not in (None, ""):
+            try:
+                category_id = int(row["categoryId"])
+            except ValueError:
+                raise ImportRowError(f"unknown category {row['categoryId']}")
+            if category_id not in self.categories_by_id:
+                raise ImportRowError(f"unknown category {category_id}")
+            fields["category_id"] = category_id
+        elif row.get("category") not in (None, ""):
+            if row["category"] not in self.categories_by_title:
+                raise ImportRowError(f"unknown category {row['category']}")
+            fields["category_id"] = self.categories_by_title[row["category"]]
+        parsed = {"id": product_id, "fields": fields}
+        if "tags" in row:
+            parsed["tags"] = parse_list(row["tags"])
+            if any(len(name) > TAG_NAME_LENGTH for name in parsed["tags"]):
+                raise ImportRowError(f"tag names are limited to {TAG_NAME_LENGTH} characters")
+        if "specifications" in row:
+            parsed["specifications"] = parse_specifications(row["specifications"])
+            if any(len(part) > SPECIFICATION_LENGTH for item in parsed["specifications"] for part in item):
+                raise ImportRowError(f"specifications are limited to {SPECIFICATION_LENGTH} characters")
+        return parsed
+
+    @transaction.atomic
+    def import_batch(self, batch: List[Dict[str, Any]]) -> None:
+
+        """метод записывает пачку строк: два запроса на товары и по два-три на каждую связь M2M"""
+
+        existing = Product.objects.in_bulk([row["id"] for row in batch])
+        created, updated, update_fields = {}, {}, set()
+        for row in batch:
+            product = existing.get(row["id"]) or created.get(row["id"])
+            if product is None:
+                if "title" not in row["fields"]:
+                    self.skip(f"product {row['id']}: title is required for new products")
+                    continue
+                created[row["id"]] = Product(pk=row["id"], **row["fields"])
+                continue
+            for name, value in row["fields"].items():
+                if getattr(product, name) != value:
+                    setattr(product, name, value)
+                    update_fields.add(name)
+                    if row["id"] in existing:
+                        updated[row["id"]] = product
+        if created:
+            Product.objects.bulk_create(created.values())
+        if updated:
+            Product.objects.bulk_update(updated.values(), sorted(update_fields))
+        rows = [row for row in batch if row["id"] in existing or row["id"] in created]
+        self.stats["rows"] += len(rows)
+        self.stats["created"] += len(created)
+        self.stats["updated"] += len(updated)
+        self.changed_ids.update(created, updated)
+        self.created_ids.update(created)
+
+        self.create_tags({name for row in rows for name in row.get("tags", ())})
+        self.create_specifications({item for row in rows for item in row.get("specifications", ())})
+        tag_links = {
+            row["id"]: {self.tags[name] for name in row["tags"]}
+            for row in rows if "tags" in row
+        }
+        specification_links = {
+            row["id"]: {self.specifications[item] for item in row["specifications"]}
+            for row in rows if "specifications" in row
+        }
+        self.sync_links(Product.tags.through, 'tag_id', tag_links)
+        self.sync_links(Product.specifications.through, 'specification_id', specification_links)
+
+    def create_tags(self, names: Set[str]) -> None:
+        missing = {name for name in names if name not in self.tags}
+        if missing:
+            Tag.objects.bulk_create([Tag(name=name) for name in sorted(missing)])
+            self.tags.update(Tag.objects.filter(name__in=missing).values_list('name', 'pk'))
+            self.stats["tags"] += len(missing)
+
+    def create_specifications(self, specifications: Set[Tuple[str, str]]) -> None:
+        missing = {item for item in specifications if item not in self.specifications}
+        if missing:
+            Specification.objects.bulk_create([Specification(name=name, value=value) for name, value in sorted(missing)])
+            for pk, name, value in Specification.objects.filter(
+                    name__in={name for name, _ in missing}).order_by('-pk').values_list('pk', 'name', 'value'):
+                self.specifications.setdefault((name or "", value or ""), pk)
+            self.stats["specifications"] += len(missing)
+
+    def sync_links(self, through, target_field: str, links: Dict[int, Set[int]]) -> None:
+
+        """метод приводит связи M2M товаров пачки к переданным: добавляет недостающие и удаляет лишние"""
+
+        if not links:
+            return
+        stale, current = [], set()
+        for pk, product_id, target_id in through.objects.filter(
+                product_id__in=links).values_list('pk', 'product_id', target_field):
+            if target_id in links[product_id]:
+                current.add((product_id, target_id))
+            else:
+                stale.append(pk)
+                self.changed_ids.add(product_id)
+        missing = [
+            through(product_id=product_id, **{target_field: target_id})
+            for product_id, target_ids in links.items()
+            for target_id in target_ids if (product_id, target_id) not in current
+        ]
+        if stale:
+            through.objects.filter(pk__in=stale).delete()
+        if missing:
+            through.objects.bulk_create(missing, ignore_conflicts=True)
+            self.changed_ids.update(link.product_id for link in missing)
+        self.stats["links"] += len(stale) + len(missing)
+
+    def finish(self) -> None:
+
+        """метод обновляет производные данные, которые при обычном сохранении обновляют сигналы"""
+
+        if self.stats["created"]:
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(no_style(), [Product]):
+                    cursor.execute(sql)
+        if self.stats["tags"]:
+            bump_generation(TAGS_NAMESPACE)
+        if not self.changed_ids:
+            return
+        changed_ids = sorted(self.changed_ids)
+        for start in range(0, len(changed_ids), self.batch_size):
+            index_products(changed_ids[start:start + self.batch_size])
+        # у новых товаров еще нет детальных документов в кеше
+        invalidate_product_details(self.changed_ids - self.created_ids)
+        bump_facets_version()
+        invalidate_product_stores()
+        bump_generation(CATALOG_NAMESPACE)
+
+
+def import_catalog(stream: IO[str], file_format: str, batch_size: int = IMPORT_BATCH_SIZE) -> CatalogImporter:
+
+    """функция загружает каталог из текстового потока в формате csv или ndjson"""
+
+    importer = CatalogImporter(batch_size=batch_size)
+    importer.run(IMPORT_READERS[file_format](stream))
+    return importer
+
+
+def open_import_file(path: str) -> IO[str]:
+    if path == "-":
+        return io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8")
+    return open(path, encoding="utf-8", newline="")
@@ -0,0 +1,42 @@
+import time
+from itertools import cycle, islice
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from mycatalog.models import Product
+from mycatalog.renderers import FastJSONRenderer, product_cards
+from mycatalog.serializers import ProductSerializer
+
+
+class Command(BaseCommand):
+
+    """Команда сравнивает скорость вывода карточек товаров сериалайзером и быстрым рендерером"""
+
+    help = "Benchmark ProductSerializer + JSONRenderer against product_cards + FastJSONRenderer"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=1000, help="rows rendered per run")
+        parser.add_argument("--repeat", type=int, default=5, help="runs per renderer, the best one is reported")
+
+    def handle(self, *args, **options):
+        products = list(ProductSerializer.setup_eager_loading(Product.objects.order_by('pk')))
+        if not products:
+            raise CommandError("No products in the database, load fixtures first")
+        rows = list(islice(cycle(products), options["rows"]))
+
+        def serializer_path():
+            return JSONRenderer().render(ProductSerializer(rows, many=True).data)
+
+        def fast_path():
+            return FastJSONRenderer().render(product_cards(rows))
+
+        if serializer_path() != fast_path():
+            raise CommandError("Renderers produce different output")
+        for name, render in (("serializer", serializer_path), ("fast path", fast_path)):
+            best = min(self.measure(render) for _ in range(options["repeat"]))
+            self.stdout.write(f"{name:>10}: {len(rows) / best:,.0f} rows/s ({best * 1000:.1f} ms per {len(rows)} rows)")
+
+    @staticmethod
+    def measure(render) -> float:
+        started = time.perf_counter()
+        render()
+        return time.perf_counter() - started
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from megano.cache import get_generation
+from mycatalog.cache import CATALOG_NAMESPACE, get_catalog_cache_stats
+
+
+class Command(BaseCommand):
+
+    """Команда выводит статистику кеша страниц каталога"""
+
+    help = "Show hit/miss counters of the /api/catalog page cache"
+
+    def handle(self, *args, **options):
+        stats = get_catalog_cache_stats()
+        self.stdout.write(
+            f"generation={get_generation(CATALOG_NAMESPACE)} hits={stats['hits']} "
+            f"misses={stats['misses']} hit_ratio={stats['ratio']:.2%}"
+        )
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from mycatalog.images import IMAGE_MODELS, generate_image_variants
+
+
+class Command(BaseCommand):
+
+    """Команда строит уменьшенные копии картинок товаров и категорий"""
+
+    help = "Generate resized WebP variants of product and category images"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--missing", action="store_true", help="only images without variants")
+
+    def handle(self, *args, **options):
+        generated = 0
+        for model in IMAGE_MODELS.values():
+            images = model.objects.exclude(image='').exclude(image__isnull=True)
+            if options["missing"]:
+                images = images.filter(variants__isnull=True)
+            for image_object in images.iterator(chunk_size=100):
+                try:
+                    generated += generate_image_variants(image_object)
+                except OSError as error:
+                    self.stderr.write(f"Skipped {image_object.image.name}: {error}")
+        self.stdout.write(self.style.SUCCESS(f"Generated {generated} image variants"))
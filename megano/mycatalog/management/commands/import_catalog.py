@@ -0,0 +1,44 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from mycatalog.importer import (
+    IMPORT_BATCH_SIZE,
+    IMPORT_READERS,
+    ImportBatchError,
+    detect_format,
+    import_catalog,
+    open_import_file,
+)
+
+
+class Command(BaseCommand):
+
+    """Команда загружает товары из CSV или NDJSON файла пачками"""
+
+    help = "Import products, tags and specifications from a CSV or NDJSON file ('-' reads stdin)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--format", choices=sorted(IMPORT_READERS), help="defaults to the file extension")
+        parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        file_format = options["format"] or detect_format(options["path"])
+        started = time.perf_counter()
+        try:
+            with open_import_file(options["path"]) as stream:
+                importer = import_catalog(stream, file_format, batch_size=options["batch_size"])
+        except ImportBatchError as error:
+            raise CommandError(
+                f"Import stopped at {error}; {error.stats['rows']} rows from earlier batches were imported"
+            )
+        except (OSError, ValueError) as error:
+            raise CommandError(f"Import failed: {error}")
+        elapsed = time.perf_counter() - started
+        stats = importer.stats
+        for error in importer.errors:
+            self.stderr.write(error)
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['rows']} rows in {elapsed:.2f}s ({stats['rows'] / elapsed if elapsed else 0:.0f} rows/s): "
+            f"created={stats['created']} updated={stats['updated']} skipped={stats['skipped']} "
+            f"tags={stats['tags']} specifications={stats['specifications']} links={stats['links']}"
+        ))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from mycatalog.stores import rebuild_banner_pool
+
+
+class Command(BaseCommand):
+
+    """Команда заново собирает пул товаров в наличии для случайных банеров"""
+
+    help = "Rebuild the pool of in-stock products used for random banners"
+
+    def handle(self, *args, **options):
+        pooled = rebuild_banner_pool()
+        self.stdout.write(self.style.SUCCESS(f"Banner pool rebuilt with {pooled} products"))
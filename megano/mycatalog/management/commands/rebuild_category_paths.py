@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from mycatalog.services import rebuild_category_paths
+
+
+class Command(BaseCommand):
+
+    """Команда пересчитывает материализованные пути дерева категорий"""
+
+    help = "Rebuild materialized paths of the category tree"
+
+    def handle(self, *args, **options):
+        rebuilt = rebuild_category_paths()
+        self.stdout.write(self.style.SUCCESS(f"Paths rebuilt for {rebuilt} categories"))
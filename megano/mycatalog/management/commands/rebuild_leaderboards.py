@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from mycatalog.stores import rebuild_leaderboards
+
+
+class Command(BaseCommand):
+
+    """Команда заново собирает рейтинги популярных и лимитированных товаров"""
+
+    help = "Rebuild the popular and limited products leaderboards"
+
+    def handle(self, *args, **options):
+        for name, size in rebuild_leaderboards().items():
+            self.stdout.write(self.style.SUCCESS(f"Leaderboard {name} rebuilt with {size} products"))
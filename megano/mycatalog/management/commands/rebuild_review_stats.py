@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from mycatalog.services import rebuild_review_stats
+
+
+class Command(BaseCommand):
+
+    """Команда пересчитывает агрегаты отзывов товаров (колличество, сумму оценок и гистограмму)"""
+
+    help = "Rebuild denormalized review aggregates of products from the review table"
+
+    def add_arguments(self, parser):
+        parser.add_argument("product_ids", nargs="*", type=int, help="products to rebuild, all by default")
+
+    def handle(self, *args, **options):
+        product_ids = options["product_ids"] or None
+        updated = rebuild_review_stats(product_ids)
+        self.stdout.write(self.style.SUCCESS(f"Review stats rebuilt for {updated} products"))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from mycatalog.search import get_search_backend, rebuild_search_index
+
+
+class Command(BaseCommand):
+
+    """Команда переиндексирует поисковые документы всех товаров"""
+
+    help = "Rebuild full-text search documents of all products"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        indexed = rebuild_search_index(batch_size=options["batch_size"])
+        backend = type(get_search_backend()).__name__
+        self.stdout.write(self.style.SUCCESS(f"{indexed} products indexed ({backend})"))
@@ -0,0 +1,72 @@
+# Generated by Django 4.2.6 on 2026-10-18 19:22
+
+from collections import defaultdict
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_review_stats(apps, schema_editor):
+    Product = apps.get_model('mycatalog', 'Product')
+    Review = apps.get_model('mycatalog', 'Review')
+    stats = defaultdict(lambda: {'reviews_count': 0, 'rating_sum': 0})
+    rows = Review.objects.values('product', 'rate').annotate(total=Count('pk')).order_by()
+    for row in rows:
+        product_stats = stats[row['product']]
+        product_stats['reviews_count'] += row['total']
+        product_stats['rating_sum'] += row['rate'] * row['total']
+        if 1 <= row['rate'] <= 5:
+            product_stats[f"rating_{row['rate']}"] = row['total']
+    for product_id, product_stats in stats.items():
+        Product.objects.filter(pk=product_id).update(**product_stats)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mycatalog', '0008_alter_product_rating'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='rating_1',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_2',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_3',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_4',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_5',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_sum',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='reviews_count',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='rating',
+            field=models.FloatField(blank=True, db_index=True, default=0, null=True),
+        ),
+        migrations.RunPython(fill_review_stats, migrations.RunPython.noop),
+    ]
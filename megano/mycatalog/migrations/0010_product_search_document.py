@@ -0,0 +1,105 @@
+# Generated by Django 4.2.6 on 2026-10-18 19:24
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+SQLITE_FORWARD = [
+    """CREATE VIRTUAL TABLE mycatalog_product_fts USING fts5(
+        title, body,
+        content='mycatalog_productsearchdocument', content_rowid='product_id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )""",
+    """CREATE TRIGGER mycatalog_product_fts_ai AFTER INSERT ON mycatalog_productsearchdocument BEGIN
+        INSERT INTO mycatalog_product_fts(rowid, title, body) VALUES (new.product_id, new.title, new.body);
+    END""",
+    """CREATE TRIGGER mycatalog_product_fts_ad AFTER DELETE ON mycatalog_productsearchdocument BEGIN
+        INSERT INTO mycatalog_product_fts(mycatalog_product_fts, rowid, title, body)
+        VALUES ('delete', old.product_id, old.title, old.body);
+    END""",
+    """CREATE TRIGGER mycatalog_product_fts_au AFTER UPDATE ON mycatalog_productsearchdocument BEGIN
+        INSERT INTO mycatalog_product_fts(mycatalog_product_fts, rowid, title, body)
+        VALUES ('delete', old.product_id, old.title, old.body);
+        INSERT INTO mycatalog_product_fts(rowid, title, body) VALUES (new.product_id, new.title, new.body);
+    END""",
+]
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS mycatalog_product_fts_au",
+    "DROP TRIGGER IF EXISTS mycatalog_product_fts_ad",
+    "DROP TRIGGER IF EXISTS mycatalog_product_fts_ai",
+    "DROP TABLE IF EXISTS mycatalog_product_fts",
+]
+POSTGRESQL_FORWARD = [
+    """ALTER TABLE mycatalog_productsearchdocument ADD COLUMN search_vector tsvector
+        GENERATED ALWAYS AS (
+            setweight(to_tsvector('simple', coalesce(title, '')), 'A')
+            || setweight(to_tsvector('simple', coalesce(body, '')), 'B')
+        ) STORED""",
+    """CREATE INDEX mycatalog_productsearch_vector_idx
+        ON mycatalog_productsearchdocument USING GIN (search_vector)""",
+]
+POSTGRESQL_BACKWARD = [
+    "DROP INDEX IF EXISTS mycatalog_productsearch_vector_idx",
+    "ALTER TABLE mycatalog_productsearchdocument DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def sqlite_has_fts5(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA compile_options")
+        return any(row[0] == 'ENABLE_FTS5' for row in cursor.fetchall())
+
+
+def get_statements(schema_editor, forward):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        return POSTGRESQL_FORWARD if forward else POSTGRESQL_BACKWARD
+    if connection.vendor == 'sqlite' and (not forward or sqlite_has_fts5(connection)):
+        return SQLITE_FORWARD if forward else SQLITE_BACKWARD
+    return []
+
+
+def create_search_index(apps, schema_editor):
+    for statement in get_statements(schema_editor, forward=True):
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    for statement in get_statements(schema_editor, forward=False):
+        schema_editor.execute(statement)
+
+
+def fill_search_documents(apps, schema_editor):
+    Product = apps.get_model('mycatalog', 'Product')
+    ProductSearchDocument = apps.get_model('mycatalog', 'ProductSearchDocument')
+    documents = []
+    for product in Product.objects.prefetch_related('tags', 'specifications'):
+        parts = [product.description or ""]
+        parts.extend(tag.name for tag in product.tags.all() if tag.name)
+        parts.extend(
+            f"{specification.name or ''} {specification.value or ''}".strip()
+            for specification in product.specifications.all()
+        )
+        body = "\n".join(part for part in parts if part)
+        documents.append(ProductSearchDocument(product_id=product.pk, title=product.title, body=body))
+    ProductSearchDocument.objects.bulk_create(documents, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mycatalog', '0009_product_review_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchDocument',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='mycatalog.product')),
+                ('title', models.CharField(blank=True, max_length=255)),
+                ('body', models.TextField(blank=True)),
+            ],
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+        migrations.RunPython(fill_search_documents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.6 on 2026-10-18 19:25
+
+from django.db import migrations, models
+
+
+def fill_category_paths(apps, schema_editor):
+    Categories = apps.get_model('mycatalog', 'Categories')
+    parents = dict(Categories.objects.values_list('pk', 'parent_category_id'))
+    paths = {}
+
+    def build_path(category_id, seen=()):
+        if category_id not in paths:
+            parent_id = parents.get(category_id)
+            parent_path = ''
+            if parent_id is not None and parent_id not in seen:
+                parent_path = build_path(parent_id, seen + (category_id,))
+            paths[category_id] = f"{parent_path}{category_id:010d}/"
+        return paths[category_id]
+
+    categories = list(Categories.objects.all())
+    for category in categories:
+        category.path = build_path(category.pk)
+    Categories.objects.bulk_update(categories, ['path'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mycatalog', '0010_product_search_document'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='categories',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(fill_category_paths, migrations.RunPython.noop),
+    ]
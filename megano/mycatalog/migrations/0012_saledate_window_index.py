@@ -0,0 +1,17 @@
+# Generated by Django 4.2.6 on 2026-10-18 19:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mycatalog', '0011_categories_path'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='saledate',
+            index=models.Index(fields=['date_from', 'date_to'], name='mycatalog_sale_window_idx'),
+        ),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 4.2.6 on 2026-10-18 20:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_null_ratings(apps, schema_editor):
+    Product = apps.get_model('mycatalog', 'Product')
+    Product.objects.filter(rating__isnull=True).update(rating=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mycatalog', '0013_image_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_null_ratings, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='product',
+            name='category',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='mycatalog.categories'),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='description',
+            field=models.TextField(blank=True, max_length=300, null=True),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='fullDescription',
+            field=models.TextField(blank=True, max_length=600, null=True),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='rating',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='reviews_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='review',
+            name='text',
+            field=models.TextField(blank=True, max_length=500),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['rating', 'id'], name='mycatalog_product_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['reviews_count', 'id'], name='mycatalog_product_reviews_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['date', 'id'], name='mycatalog_product_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'rating', 'id'], name='mycatalog_product_cat_rate_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'reviews_count', 'id'], name='mycatalog_product_cat_rev_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'date', 'id'], name='mycatalog_product_cat_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['count'], name='mycatalog_product_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['freeDelivery', 'count'], name='mycatalog_product_delivery_idx'),
+        ),
+    ]
@@ -1,19 +1,73 @@
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import Value
+from django.db.models.functions import Concat, Substr
 from django.contrib.auth.models import User
 
 
+CATEGORY_PATH_STEP = 10
+
+
+def category_path_segment(category_id: int) -> str:
+
+    """функция-помощник, возвращает сегмент материализованного пути категории"""
+
+    return f"{category_id:0{CATEGORY_PATH_STEP}d}/"
+
+
 class Categories(models.Model):
 
-    """Модель категории"""
+    """Модель категории.
+    Поле path хранит материализованный путь из id всех предков категории,
+    поэтому дерево читается одним запросом, а потомки выбираются по префиксу пути"""
 
     title = models.CharField(max_length=255)
     parent_category = models.ForeignKey(
         'self', null=True, blank=True, on_delete=models.CASCADE
     )
+    path = models.CharField(max_length=255, blank=True, default='', db_index=True, editable=False)
 
     def __str__(self):
         return f"{self.title!r}"
 
+    def clean(self):
+        super().clean()
+        if self.moves_under_itself(self.get_parent_path()):
+            raise ValidationError({'parent_category': "Category can not be moved under its own subcategory"})
+
+    def save(self, *args, **kwargs):
+        parent_path = self.get_parent_path()
+        # форма админки проверяет это в clean(), здесь защита от прямого сохранения
+        if self.moves_under_itself(parent_path):
+            raise ValueError("Category can not be moved under its own subcategory")
+        super().save(*args, **kwargs)
+        self.update_path(parent_path)
+
+    def moves_under_itself(self, parent_path: str) -> bool:
+        return bool(self.path) and parent_path.startswith(self.path)
+
+    def get_parent_path(self) -> str:
+        if not self.parent_category_id:
+            return ''
+        return Categories.objects.filter(
+            pk=self.parent_category_id
+        ).values_list('path', flat=True).first() or ''
+
+    def update_path(self, parent_path: str) -> None:
+
+        """метод сохраняет путь категории и переносит пути всех ее потомков"""
+
+        new_path = parent_path + category_path_segment(self.pk)
+        old_path = self.path
+        if new_path == old_path:
+            return
+        Categories.objects.filter(pk=self.pk).update(path=new_path)
+        if old_path:
+            Categories.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                path=Concat(Value(new_path), Substr('path', len(old_path) + 1))
+            )
+        self.path = new_path
+
 
 def category_images_directory_path(instance: "CategoryImage", filename: str) -> str:
 
@@ -80,6 +134,25 @@ class ProductImage(models.Model):
     )
 
 
+class ImageVariant(models.Model):
+
+    """Модель уменьшенной копии картинки товара или категории"""
+
+    product_image = models.ForeignKey(
+        ProductImage, on_delete=models.CASCADE, null=True, blank=True, related_name="variants"
+    )
+    category_image = models.ForeignKey(
+        CategoryImage, on_delete=models.CASCADE, null=True, blank=True, related_name="variants"
+    )
+    image = models.ImageField(upload_to="image_variants/")
+    width = models.PositiveIntegerField(default=0)
+    height = models.PositiveIntegerField(default=0)
+    size = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['width']
+
+
 class Product(models.Model):
 
     """Модель товаров"""
@@ -88,28 +161,80 @@ class Product(models.Model):
     count = models.IntegerField(default=0)
     date = models.DateTimeField(auto_now_add=True)
     title = models.CharField(max_length=255)
-    fullDescription = models.TextField(max_length=600, null=True, blank=True, db_index=True)
-    description = models.TextField(max_length=300, null=True, blank=True, db_index=True)
+    fullDescription = models.TextField(max_length=600, null=True, blank=True)
+    description = models.TextField(max_length=300, null=True, blank=True)
     freeDelivery = models.BooleanField(default=False)
     tags = models.ManyToManyField(Tag, blank=True, related_name="product")
-    category = models.ForeignKey(Categories, on_delete=models.SET_NULL, null=True)
+    # category_id стоит первым в составных индексах Meta.indexes, отдельный индекс не нужен
+    category = models.ForeignKey(Categories, on_delete=models.SET_NULL, null=True, db_index=False)
     specifications = models.ManyToManyField(Specification, related_name="product")
-    rating = models.FloatField(default=0, null=True, blank=True)
+    rating = models.FloatField(default=0)
+    reviews_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.IntegerField(default=0)
+    rating_1 = models.PositiveIntegerField(default=0)
+    rating_2 = models.PositiveIntegerField(default=0)
+    rating_3 = models.PositiveIntegerField(default=0)
+    rating_4 = models.PositiveIntegerField(default=0)
+    rating_5 = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        # индексы под сортировки и фильтры каталога (DataFilter и курсорная пагинация),
+        # id в конце индекса дает порядок курсора (значение, id) без сортировки в памяти.
+        # Сортировка и фильтр по цене идут по цене со скидкой, которая зависит от
+        # текущего времени, поэтому индекс по price им не помогает
+        indexes = [
+            models.Index(fields=['rating', 'id'], name='mycatalog_product_rating_idx'),
+            models.Index(fields=['reviews_count', 'id'], name='mycatalog_product_reviews_idx'),
+            models.Index(fields=['date', 'id'], name='mycatalog_product_date_idx'),
+            models.Index(fields=['category', 'rating', 'id'], name='mycatalog_product_cat_rate_idx'),
+            models.Index(fields=['category', 'reviews_count', 'id'], name='mycatalog_product_cat_rev_idx'),
+            models.Index(fields=['category', 'date', 'id'], name='mycatalog_product_cat_date_idx'),
+            models.Index(fields=['count'], name='mycatalog_product_count_idx'),
+            models.Index(fields=['freeDelivery', 'count'], name='mycatalog_product_delivery_idx'),
+        ]
 
     def __str__(self):
         return f"{self.title!r}"
 
+    @property
+    def rating_histogram(self) -> dict:
+
+        """распределение оценок отзывов по звездам от 1 до 5"""
+
+        return {star: getattr(self, f"rating_{star}") for star in range(1, 6)}
+
+
+class ProductSearchDocument(models.Model):
+
+    """Модель поискового документа товара.
+    Хранит текст товара (название, описание, теги и спецификации),
+    по которому строится полнотекстовый индекс базы данных"""
+
+    product = models.OneToOneField(
+        Product, on_delete=models.CASCADE, primary_key=True, related_name="search_document"
+    )
+    title = models.CharField(max_length=255, blank=True)
+    body = models.TextField(blank=True)
+
 
 class Review(models.Model):
 
     """Модель отзывов"""
 
     author = models.ForeignKey(User, on_delete=models.CASCADE)
-    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="review")
-    text = models.TextField(max_length=500, null=False, blank=True, db_index=True)
+    # product_id стоит первым в индексах Meta.indexes, отдельный индекс не нужен
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="review", db_index=False)
+    text = models.TextField(max_length=500, null=False, blank=True)
     rate = models.SmallIntegerField(default=0)
     date = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # страницы отзывов товара по дате и по оценке (ReviewCursorPaginator)
+        indexes = [
+            models.Index(fields=['product', 'date', 'id'], name='mycatalog_review_date_idx'),
+            models.Index(fields=['product', 'rate', 'id'], name='mycatalog_review_rate_idx'),
+        ]
+
 
 class SaleDate(models.Model):
 
@@ -119,3 +244,8 @@ class SaleDate(models.Model):
     date_to = models.DateTimeField(blank=True, null=True)
     discount = models.SmallIntegerField(default=0, blank=True, null=True)
     product = models.OneToOneField(Product, on_delete=models.CASCADE, related_name="sale")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['date_from', 'date_to'], name='mycatalog_sale_window_idx'),
+        ]
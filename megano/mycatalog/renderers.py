@@ -0,0 +1,113 @@
+from decimal import Decimal
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from .models import Product
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+PRICE_QUANTUM = Decimal("0.01")
+
+
+def render_price(price: Optional[Decimal]) -> Optional[str]:
+
+    """функция форматирует цену так же как DecimalField сериалайзера (строка с двумя знаками)"""
+
+    if price is None:
+        return None
+    return format(Decimal(price).quantize(PRICE_QUANTUM), "f")
+
+
+def render_datetime(value, current_timezone) -> Optional[str]:
+
+    """функция форматирует дату так же как DateTimeField сериалайзера (ISO 8601, UTC как Z)"""
+
+    if value is None:
+        return None
+    if timezone.is_aware(value):
+        value = value.astimezone(current_timezone)
+    value = value.isoformat()
+    if value.endswith("+00:00"):
+        value = value[:-6] + "Z"
+    return value
+
+
+# адрес файла в FileSystemStorage зависит только от имени, поэтому его можно запомнить
+@lru_cache(maxsize=8192)
+def image_url(name: str) -> str:
+    return default_storage.url(name)
+
+
+def prefetched(product: Product, relation: str) -> Iterable[Any]:
+
+    """функция возвращает загруженные prefetch_related объекты без создания менеджера связи"""
+
+    cached = getattr(product, '_prefetched_objects_cache', {})
+    if relation in cached:
+        return cached[relation]
+    return getattr(product, relation).all()
+
+
+def product_card(product: Product, current_timezone=None) -> Dict[str, Any]:
+
+    """
+    функция собирает карточку товара в том же виде что и ProductSerializer,
+    но без полей сериалайзера, только чтением атрибутов,
+    теги и картинки должны быть загружены через ProductSerializer.setup_eager_loading
+    """
+
+    return {
+        "id": product.pk,
+        "category": product.category_id,
+        "price": render_price(product.price),
+        "count": product.count,
+        "date": render_datetime(product.date, current_timezone or timezone.get_current_timezone()),
+        "title": product.title,
+        "description": product.description,
+        "freeDelivery": product.freeDelivery,
+        "images": [
+            {
+                "src": image_url(image.image.name),
+                "alt": image.image.name,
+                "srcset": [
+                    {"src": image_url(variant.image.name), "width": variant.width, "height": variant.height}
+                    for variant in sorted(prefetched(image, 'variants'), key=lambda variant: variant.width)
+                ],
+            }
+            for image in prefetched(product, 'images')
+        ],
+        "tags": [
+            {"id": tag.id, "name": tag.name}
+            for tag in sorted(prefetched(product, 'tags'), key=lambda tag: tag.id)
+        ],
+        "reviews": product.reviews_count,
+        "rating": product.rating,
+    }
+
+
+def product_cards(products: Iterable[Product]) -> List[Dict[str, Any]]:
+    current_timezone = timezone.get_current_timezone()
+    return [product_card(product, current_timezone) for product in products]
+
+
+class FastJSONRenderer(JSONRenderer):
+
+    """
+    Рендерер JSON на orjson для уже подготовленных данных (строки, числа, списки, словари).
+    Вывод совпадает с JSONRenderer побайтно, а при отступах или типах,
+    которые orjson кодирует иначе (Decimal, даты), используется JSONRenderer
+    """
+
+    def render(self, data: Any, accepted_media_type: Optional[str] = None, renderer_context=None) -> bytes:
+        if data is None or orjson is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            return orjson.dumps(data, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
@@ -0,0 +1,157 @@
+import re
+from typing import Iterable, List
+from django.db import connection
+from django.db.models import FloatField, Q, QuerySet, Value
+from django.db.models.expressions import RawSQL
+from .models import Product, ProductSearchDocument
+
+
+SEARCH_DOCUMENT_TABLE = ProductSearchDocument._meta.db_table
+SQLITE_FTS_TABLE = "mycatalog_product_fts"
+MAX_SEARCH_TERMS = 8
+
+
+def search_terms(text: str) -> List[str]:
+
+    """функция разбивает поисковую строку на слова в нижнем регистре"""
+
+    return re.findall(r"\w+", str(text).lower())[:MAX_SEARCH_TERMS]
+
+
+def build_search_body(product: Product) -> str:
+
+    """функция собирает текст поискового документа товара
+    из описания, тегов и спецификаций"""
+
+    parts = [product.description or ""]
+    parts.extend(tag.name for tag in product.tags.all() if tag.name)
+    parts.extend(
+        f"{specification.name or ''} {specification.value or ''}".strip()
+        for specification in product.specifications.all()
+    )
+    return "\n".join(part for part in parts if part)
+
+
+def index_products(product_ids: Iterable[int]) -> int:
+
+    """
+    функция обновляет поисковые документы переданных товаров,
+    полнотекстовый индекс базы данных обновляется вслед за таблицей документов
+    :return: колличество проиндексированных товаров
+    """
+
+    product_ids = list(product_ids)
+    if not product_ids:
+        return 0
+    products = Product.objects.filter(pk__in=product_ids).prefetch_related('tags', 'specifications')
+    documents = [
+        ProductSearchDocument(product_id=product.pk, title=product.title, body=build_search_body(product))
+        for product in products
+    ]
+    ProductSearchDocument.objects.bulk_create(
+        documents,
+        update_conflicts=True,
+        unique_fields=['product'],
+        update_fields=['title', 'body'],
+    )
+    return len(documents)
+
+
+def rebuild_search_index(batch_size: int = 500) -> int:
+
+    """функция переиндексирует все товары пачками"""
+
+    ProductSearchDocument.objects.exclude(product__in=Product.objects.all()).delete()
+    indexed = 0
+    batch = []
+    for product_id in Product.objects.values_list('pk', flat=True).order_by('pk').iterator(chunk_size=batch_size):
+        batch.append(product_id)
+        if len(batch) >= batch_size:
+            indexed += index_products(batch)
+            batch = []
+    indexed += index_products(batch)
+    return indexed
+
+
+class SearchBackend:
+
+    """Базовый поиск по таблице документов без полнотекстового индекса"""
+
+    def search(self, queryset: QuerySet[Product], terms: List[str]) -> QuerySet[Product]:
+        for term in terms:
+            queryset = queryset.filter(
+                Q(search_document__title__icontains=term) | Q(search_document__body__icontains=term)
+            )
+        return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+class SqliteSearchBackend(SearchBackend):
+
+    """Поиск по виртуальной таблице SQLite FTS5 с ранжированием bm25"""
+
+    def search(self, queryset: QuerySet[Product], terms: List[str]) -> QuerySet[Product]:
+        match = " ".join('"{}"*'.format(term) for term in terms)
+        ids_sql = f"SELECT rowid FROM {SQLITE_FTS_TABLE} WHERE {SQLITE_FTS_TABLE} MATCH %s"
+        rank_sql = (
+            f"SELECT -bm25({SQLITE_FTS_TABLE}, 10.0, 1.0) FROM {SQLITE_FTS_TABLE} "
+            f"WHERE {SQLITE_FTS_TABLE} MATCH %s AND rowid = {Product._meta.db_table}.id"
+        )
+        return queryset.filter(pk__in=RawSQL(ids_sql, [match])).annotate(
+            search_rank=RawSQL(rank_sql, [match], output_field=FloatField())
+        )
+
+
+class PostgresSearchBackend(SearchBackend):
+
+    """Поиск по колонке tsvector с GIN индексом и ранжированием ts_rank"""
+
+    def search(self, queryset: QuerySet[Product], terms: List[str]) -> QuerySet[Product]:
+        tsquery = " & ".join(f"{term}:*" for term in terms)
+        ids_sql = (
+            f"SELECT product_id FROM {SEARCH_DOCUMENT_TABLE} "
+            f"WHERE search_vector @@ to_tsquery('simple', %s)"
+        )
+        rank_sql = (
+            f"SELECT ts_rank(search_vector, to_tsquery('simple', %s)) FROM {SEARCH_DOCUMENT_TABLE} "
+            f"WHERE product_id = {Product._meta.db_table}.id"
+        )
+        return queryset.filter(pk__in=RawSQL(ids_sql, [tsquery])).annotate(
+            search_rank=RawSQL(rank_sql, [tsquery], output_field=FloatField())
+        )
+
+
+_sqlite_fts_available = {}
+
+
+def sqlite_fts_available() -> bool:
+
+    """функция проверяет (один раз для файла базы) создана ли таблица FTS5"""
+
+    name = str(connection.settings_dict['NAME'])
+    if name not in _sqlite_fts_available:
+        _sqlite_fts_available[name] = SQLITE_FTS_TABLE in connection.introspection.table_names()
+    return _sqlite_fts_available[name]
+
+
+def get_search_backend() -> SearchBackend:
+
+    """функция выбирает поиск по возможностям текущей базы данных"""
+
+    if connection.vendor == 'postgresql':
+        return PostgresSearchBackend()
+    if connection.vendor == 'sqlite' and sqlite_fts_available():
+        return SqliteSearchBackend()
+    return SearchBackend()
+
+
+def search_products(queryset: QuerySet[Product], text: str) -> QuerySet[Product]:
+
+    """
+    функция фильтрует товары по поисковой строке с учетом префиксов слов
+    и добавляет аннотацию search_rank, чем больше значение тем выше релевантность
+    """
+
+    terms = search_terms(text)
+    if not terms:
+        return queryset
+    return get_search_backend().search(queryset, terms)
@@ -1,7 +1,13 @@
 from typing import Any, Dict, List
 from rest_framework import serializers
+from django.core.files.storage import default_storage
+from django.db.models import Prefetch, QuerySet
 from drf_spectacular.utils import OpenApiTypes, extend_schema_field, OpenApiExample, extend_schema_serializer
 from .models import Categories, Product, Tag, Review
+from .images import image_srcset
+
+
+PRODUCT_DETAIL_REVIEWS = 3
 
 
 class CategoriesSerializer(serializers.ModelSerializer):
@@ -29,8 +35,12 @@ class CategoriesSerializer(serializers.ModelSerializer):
                 }
         })
     def get_subcategories(self, instance: Categories) -> Dict[str, Any]:
-        subcategories = Categories.objects.filter(parent_category=instance)
-        serializer = CategoriesSerializer(subcategories, many=True)
+        children = self.context.get("children")
+        if children is not None:
+            subcategories = children.get(instance.pk, [])
+        else:
+            subcategories = Categories.objects.filter(parent_category=instance)
+        serializer = CategoriesSerializer(subcategories, many=True, context=self.context)
         return serializer.data
 
     @extend_schema_field(
@@ -39,14 +49,23 @@ class CategoriesSerializer(serializers.ModelSerializer):
                             'example':
                                 {
                                      "src": "string",
-                                     "alt": "string"
+                                     "alt": "string",
+                                     "srcset": [{"src": "string", "width": "int", "height": "int"}]
                                 }
                         })
     def get_image(self, instance: Categories) -> Dict[str, Any]:
+        if hasattr(instance, "image_name"):
+            if not instance.image_name:
+                return None
+            return {
+                "src": default_storage.url(instance.image_name),
+                "alt": instance.image_name,
+                "srcset": image_srcset(getattr(instance, "image_variants", [])),
+            }
         image_instance = instance.category_image.first()
         src = image_instance.image.url
         alt = image_instance.image.name
-        return {"src": src, "alt": alt}
+        return {"src": src, "alt": alt, "srcset": image_srcset(image_instance.variants.all())}
 
 
 class ProductSerializer(serializers.ModelSerializer):
@@ -62,9 +81,18 @@ class ProductSerializer(serializers.ModelSerializer):
         fields = ("id", "category", "price", "count", "date", "title",
                   "description", "freeDelivery", "images", "tags", "reviews", "rating")
 
+    @staticmethod
+    def setup_eager_loading(queryset: QuerySet[Product]) -> QuerySet[Product]:
+
+        """метод подготавливает queryset для вывода списка продуктов:
+        теги и картинки загружаются фиксированным числом запросов
+        независимо от размера страницы"""
+
+        return queryset.prefetch_related('tags', 'images__variants')
+
     @staticmethod
     def get_reviews(instance: Product) -> int:
-        return instance.review.all().count()
+        return instance.reviews_count
 
     @staticmethod
     def get_rating(instance: Product) -> float:
@@ -77,15 +105,13 @@ class ProductSerializer(serializers.ModelSerializer):
         for inst in image_instance:
             src = inst.image.url
             alt = inst.image.name
-            images.append({"src": src, "alt": alt})
+            images.append({"src": src, "alt": alt, "srcset": image_srcset(inst.variants.all())})
         return images
 
     def to_representation(self, instance: Product) -> Dict[str, List[dict]]:
         data = super().to_representation(instance)
-        tag_ids = data["tags"]
         data["tags"] = []
-        queryset = Tag.objects.filter(id__in=tag_ids)
-        for tag in queryset:
+        for tag in sorted(instance.tags.all(), key=lambda tag: tag.id):
             data["tags"].append({"id": tag.id, "name": tag.name,})
         return data
 
@@ -105,16 +131,20 @@ class SaleProductSerializer(serializers.ModelSerializer):
         for inst in image_instance:
             src = inst.image.url
             alt = inst.image.name
-            images.append({"src": src, "alt": alt})
+            images.append({"src": src, "alt": alt, "srcset": image_srcset(inst.variants.all())})
         return images
 
     def to_representation(self, instance: Product) -> Dict[str, Any]:
         data = super().to_representation(instance)
         sale_info = instance.sale
-        price = float(data["price"])
-        data["salePrice"] = price - round(sale_info.discount * price / 100, 2)
-        data["dateFrom"] = sale_info.date_from.strftime("%m-%d")
-        data["dateTo"] = sale_info.date_to.strftime("%m-%d")
+        sale_price = getattr(instance, 'sale_price', None)
+        if sale_price is None:
+            price = float(data["price"])
+            data["salePrice"] = price - round((sale_info.discount or 0) * price / 100, 2)
+        else:
+            data["salePrice"] = float(sale_price)
+        data["dateFrom"] = sale_info.date_from.strftime("%m-%d") if sale_info.date_from else None
+        data["dateTo"] = sale_info.date_to.strftime("%m-%d") if sale_info.date_to else None
         return data
 
 
@@ -124,10 +154,30 @@ class ProductIDSerializer(serializers.ModelSerializer):
 
     specifications = serializers.SerializerMethodField()
     reviews = serializers.SerializerMethodField()
+    reviewsCount = serializers.SerializerMethodField()
+    ratingHistogram = serializers.SerializerMethodField()
 
     class Meta:
         model = Product
-        fields = ("specifications", "reviews", "fullDescription",)
+        fields = ("specifications", "reviews", "reviewsCount", "ratingHistogram", "fullDescription",)
+
+    @staticmethod
+    def setup_eager_loading(queryset: QuerySet[Product]) -> QuerySet[Product]:
+
+        """метод подготавливает queryset для детальной страницы продукта:
+        спецификации и последние PRODUCT_DETAIL_REVIEWS отзывов вместе
+        с профилями авторов загружаются фиксированным числом запросов"""
+
+        return ProductSerializer.setup_eager_loading(queryset).prefetch_related(
+            'specifications',
+            Prefetch(
+                'review',
+                queryset=ReviewListSerializer.setup_eager_loading(
+                    Review.objects.order_by('-date', '-id')
+                )[:PRODUCT_DETAIL_REVIEWS],
+                to_attr='latest_reviews',
+            ),
+        )
 
     @staticmethod
     def get_specifications(instance: Product) -> List[Dict[str, Any]]:
@@ -141,22 +191,18 @@ class ProductIDSerializer(serializers.ModelSerializer):
 
     @staticmethod
     def get_reviews(instance: Product) -> List[Dict[str, Any]]:
-        reviews_inst = instance.review.all()
-        reviews = []
-        for review in reviews_inst:
-            author = review.author.profile.fullName
-            email = review.author.profile.email
-            text = review.text
-            rate = review.rate
-            date = review.date
-            reviews.append({
-                "author": author,
-                "email": email,
-                "text": text,
-                "rate": rate,
-                "date": date
-            })
-        return reviews
+
+        """первые отзывы товара, остальные отдает /api/product/<id>/reviews"""
+
+        return ReviewListSerializer(instance.latest_reviews, many=True).data
+
+    @staticmethod
+    def get_reviewsCount(instance: Product) -> int:
+        return instance.reviews_count
+
+    @staticmethod
+    def get_ratingHistogram(instance: Product) -> Dict[str, int]:
+        return {str(star): count for star, count in instance.rating_histogram.items()}
 
     def to_representation(self, instance: Product) -> Dict[str, Any]:
         data = super().to_representation(instance)
@@ -167,6 +213,25 @@ class ProductIDSerializer(serializers.ModelSerializer):
         return data
 
 
+class ReviewListSerializer(serializers.ModelSerializer):
+
+    """Сериалайзер отзывов для чтения, имя и почта автора берутся из его профиля"""
+
+    author = serializers.CharField(source="author.profile.fullName", read_only=True)
+    email = serializers.CharField(source="author.profile.email", read_only=True)
+
+    class Meta:
+        model = Review
+        fields = ("id", "author", "email", "text", "rate", "date")
+
+    @staticmethod
+    def setup_eager_loading(queryset: QuerySet[Review]) -> QuerySet[Review]:
+
+        """метод загружает авторов и их профили одним запросом с отзывами"""
+
+        return queryset.select_related('author__profile')
+
+
 class ReviewSerializer(serializers.ModelSerializer):
 
     """Сериалайзер обрабатывающий данные об отзывах """
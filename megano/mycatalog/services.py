@@ -1,14 +1,91 @@
 import math
-from typing import List, Dict, Any, Union
+import json
+import base64
+import binascii
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+from typing import List, Dict, Any, Union, Iterable, Optional, Tuple
 from rest_framework.request import Request
-from .models import Product
-from django.db.models import DecimalField, Count, QuerySet
-from django.db.models.functions import Coalesce
+from .models import Categories, CategoryImage, ImageVariant, Product, Review, SaleDate, category_path_segment
+from .search import search_products
+from megano.cache import bump_generation
+from .cache import (
+    CATALOG_NAMESPACE,
+    PRODUCT_DETAIL_TIMEOUT,
+    invalidate_product_details,
+    product_detail_key,
+    remember_product_modified,
+)
+from .serializers import ProductIDSerializer, ProductSerializer
+from .stores import get_redis, sync_product_stores, top_product_ids
+from django.core.cache import cache
+from django.db.models import (
+    Case, DecimalField, Count, ExpressionWrapper, QuerySet, F, Q, Min, Value, OuterRef, Subquery, When,
+)
+from django.db.models.functions import Coalesce, Round
 from django.http import QueryDict
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
 from rest_framework.response import Response
 
 
+PRICE_FIELD = DecimalField(max_digits=10, decimal_places=2)
+
+
+def active_sale_q(now: Optional[datetime] = None, prefix: str = 'sale__') -> Q:
+
+    """функция возвращает условие действующей скидки, пустая дата начала
+    или окончания считается открытой границей"""
+
+    now = now or timezone.now()
+    return (
+        Q(**{f'{prefix}isnull': False})
+        & (Q(**{f'{prefix}date_from__isnull': True}) | Q(**{f'{prefix}date_from__lte': now}))
+        & (Q(**{f'{prefix}date_to__isnull': True}) | Q(**{f'{prefix}date_to__gte': now}))
+    )
+
+
+def sale_price_expression() -> ExpressionWrapper:
+
+    """функция возвращает выражение цены со скидкой, скидка округляется до копеек"""
+
+    discount = Round(
+        F('price') * Coalesce(F('sale__discount'), 0) * Value(Decimal('0.01'), output_field=DecimalField()),
+        2,
+    )
+    return ExpressionWrapper(F('price') - discount, output_field=PRICE_FIELD)
+
+
+def effective_price_expression(now: Optional[datetime] = None) -> Case:
+
+    """функция возвращает выражение цены товара с учетом только действующей скидки"""
+
+    return Case(
+        When(active_sale_q(now), then=sale_price_expression()),
+        default=F('price'),
+        output_field=PRICE_FIELD,
+    )
+
+
+def seconds_to_next_sale_change(timeout: int) -> int:
+
+    """функция ограничивает время жизни кеша моментом ближайшего начала или окончания скидки,
+    после которого меняются цены со скидкой"""
+
+    now = timezone.now()
+    boundaries = SaleDate.objects.aggregate(
+        next_start=Min('date_from', filter=Q(date_from__gt=now)),
+        next_end=Min('date_to', filter=Q(date_to__gt=now)),
+    )
+    for boundary in boundaries.values():
+        if boundary is not None:
+            timeout = min(timeout, math.ceil((boundary - now).total_seconds()))
+    return max(timeout, 1)
+
+
 class CatalogPaginator(PageNumberPagination):
     """Класс пагинации"""
     page_size = 2
@@ -34,6 +111,120 @@ class CatalogPaginator(PageNumberPagination):
         return queryset[start_index:end_index]
 
 
+class CatalogCursorPaginator:
+
+    """Класс курсорной (keyset) пагинации каталога.
+    Курсор хранит значение ключа сортировки и id последнего товара страницы,
+    поэтому страница выбирается условием по индексируемым полям без OFFSET
+    и без подсчета общего количества товаров"""
+
+    default_limit = 20
+    max_limit = 100
+    invalid_cursor_message = 'Invalid cursor'
+    sort_fields = {
+        'price': F('effective_price'),
+        'rating': F('rating'),
+        'reviews': F('reviews_count'),
+        'date': F('date'),
+        'id': F('id'),
+    }
+    default_sort = 'id'
+    default_sort_type = 'inc'
+
+    def __init__(self):
+        self.next_cursor = None
+        self.limit = self.default_limit
+
+    def get_paginated_response(self, data: List[Dict[str, Any]]) -> Response:
+        return Response(
+            {
+                "items": data,
+                "nextCursor": self.next_cursor,
+                "limit": self.limit,
+            }
+        )
+
+    def get_limit(self, query: Dict[str, Any]) -> int:
+        limit = query.get('limit')
+        if not isinstance(limit, int) or limit <= 0:
+            return self.default_limit
+        return min(limit, self.max_limit)
+
+    def paginate_queryset(self, queryset: QuerySet, request: Request, query, view=None) -> List[Any]:
+        self.limit = self.get_limit(query)
+        sort = query.get('sort')
+        if sort not in self.sort_fields:
+            sort = self.default_sort
+        descending = query.get('sortType', self.default_sort_type) == 'dec'
+        lookup = 'lt' if descending else 'gt'
+        if sort == 'price' and 'effective_price' not in queryset.query.annotations:
+            queryset = queryset.annotate(effective_price=effective_price_expression())
+        queryset = queryset.annotate(cursor_value=self.sort_fields[sort])
+        if descending:
+            queryset = queryset.order_by('-cursor_value', '-id')
+        else:
+            queryset = queryset.order_by('cursor_value', 'id')
+
+        cursor = query.get('cursor')
+        if cursor:
+            value, last_id = self.decode_cursor(str(cursor), sort, descending)
+            queryset = queryset.filter(
+                Q(**{f'cursor_value__{lookup}': value})
+                | Q(cursor_value=value, **{f'id__{lookup}': last_id})
+            )
+
+        page = list(queryset[:self.limit + 1])
+        if len(page) > self.limit:
+            page = page[:self.limit]
+            last = page[-1]
+            self.next_cursor = self.encode_cursor(last.cursor_value, last.id, sort, descending)
+        return page
+
+    @staticmethod
+    def encode_cursor(value: Any, last_id: int, sort: str, descending: bool) -> str:
+        if sort in ('price', 'date'):
+            value = value.isoformat() if sort == 'date' else str(value)
+        payload = json.dumps({"s": sort, "d": descending, "v": value, "id": last_id}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def decode_cursor(self, cursor: str, sort: str, descending: bool) -> tuple:
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+            if payload["s"] != sort or payload["d"] != descending:
+                raise ValueError
+            value = payload["v"]
+            last_id = int(payload["id"])
+            if sort == 'price':
+                value = Decimal(value)
+            elif sort == 'date':
+                value = parse_datetime(value)
+                if value is None:
+                    raise ValueError
+            elif sort == 'rating':
+                value = float(value)
+            else:
+                value = int(value)
+        except (binascii.Error, UnicodeDecodeError, InvalidOperation,
+                KeyError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        return value, last_id
+
+
+class ReviewCursorPaginator(CatalogCursorPaginator):
+
+    """Класс курсорной пагинации отзывов товара, по умолчанию сначала новые.
+    Сортировка по дате или оценке, страница выбирается по индексу (товар, ключ, id)"""
+
+    default_limit = 10
+    max_limit = 50
+    sort_fields = {
+        'date': F('date'),
+        'rating': F('rate'),
+    }
+    default_sort = 'date'
+    default_sort_type = 'dec'
+
+
 class DataFilter:
 
     """Кастомный класс для фильтрации данных"""
@@ -58,13 +249,54 @@ class DataFilter:
                 filtered_dict[key] = converted_values[0]
         return filtered_dict
 
+    @staticmethod
+    def filter_by_category(products: QuerySet[Product], category: Any, subcategories: bool) -> QuerySet[Product]:
+
+        """метод фильтрует товары по категории и, если нужно, по всем ее подкатегориям.
+        Префикс материализованного пути задается диапазоном: LIKE в SQLite не использует
+        индекс path, диапазон выбирает категории по индексу, а товары - по индексам с category_id"""
+
+        category_path = None
+        if subcategories:
+            category_path = Categories.objects.filter(pk=category).values_list('path', flat=True).first()
+        if category_path:
+            # следующая за префиксом строка: путь заканчивается на "/", за ним идет "0"
+            path_end = category_path[:-1] + chr(ord(category_path[-1]) + 1)
+            descendants = Categories.objects.filter(path__gte=category_path, path__lt=path_end).values('pk')
+            return products.filter(category__in=descendants)
+        return products.filter(category=category)
+
+    def apply_search_and_price(self, filtered_products: QuerySet[Product]) -> QuerySet[Product]:
+
+        """метод применяет фильтры, которых нет в индексе фасетов: поиск по названию и диапазон цены"""
+
+        name = self.filtered_dict.get('filter[name]')
+        min_price = self.filtered_dict.get('filter[minPrice]')
+        max_price = self.filtered_dict.get('filter[maxPrice]')
+        if name:
+            filtered_products = search_products(filtered_products, name)
+        if min_price and max_price:
+            filtered_products = filtered_products.annotate(effective_price=effective_price_expression()).filter(
+                effective_price__gte=min_price, effective_price__lte=max_price
+            )
+        return filtered_products
+
+    def search_and_price_ids(self) -> Optional[List[int]]:
+
+        """метод возвращает id товаров, прошедших поиск и фильтр по цене,
+        или None, если эти фильтры не заданы. Нужен для подсчета фасетов"""
+
+        query = self.filtered_dict
+        if not query.get('filter[name]') and not (query.get('filter[minPrice]') and query.get('filter[maxPrice]')):
+            return None
+        return list(self.apply_search_and_price(Product.objects.all()).order_by().values_list('pk', flat=True))
+
     def apply_filters_to_products(self, filtered_products: QuerySet[Product]) -> QuerySet[Product]:
 
         """метод для фильтрации и создания набора продуктов по заданным параметрам"""
 
         filter_criteria = self.filtered_dict
         category = filter_criteria.get('category')
-        name = filter_criteria.get('filter[name]')
         min_price = filter_criteria.get('filter[minPrice]')
         max_price = filter_criteria.get('filter[maxPrice]')
         free_delivery = filter_criteria.get('filter[freeDelivery]')
@@ -73,32 +305,219 @@ class DataFilter:
         sort_type = filter_criteria.get('sortType')
         tags = filter_criteria.get('tags[]')
         print(max_price, min_price, "max" * 10)
+        subcategories = filter_criteria.get('subcategories')
         if category:
-            filtered_products = filtered_products.filter(category=category)
+            filtered_products = self.filter_by_category(filtered_products, category, subcategories != 'false')
         if tags and type(tags) == list:
             filtered_products = filtered_products.filter(tags__id__in=tags)
         elif type(tags) == int:
             filtered_products = filtered_products.filter(tags=tags)
-        if name:
-            filtered_products = filtered_products.filter(title__icontains=name)
-        if min_price and max_price:
-            filtered_products = filtered_products.filter(price__gte=min_price, price__lte=max_price)
+        filtered_products = self.apply_search_and_price(filtered_products)
+        if sort == 'price' and 'effective_price' not in filtered_products.query.annotations:
+            filtered_products = filtered_products.annotate(effective_price=effective_price_expression())
         if free_delivery in ['true']:
             filtered_products = filtered_products.filter(freeDelivery=(free_delivery == 'true'))
         if available == 'true':
             filtered_products = filtered_products.filter(count__gt=0)
         if sort == 'price':
-            sort_order = '-price' if sort_type == 'dec' else 'price'
+            sort_order = '-effective_price' if sort_type == 'dec' else 'effective_price'
             filtered_products = filtered_products.order_by(sort_order)
         elif sort == 'rating':
             sort_order = '-rating' if sort_type == 'dec' else 'rating'
             filtered_products = filtered_products.order_by(sort_order)
         elif sort == 'reviews':
-            sort_order = '-total_reviews' if sort_type == 'dec' else 'total_reviews'
-            filtered_products = filtered_products.annotate(
-                total_reviews=Count('review')
-            ).order_by(sort_order)
+            sort_order = '-reviews_count' if sort_type == 'dec' else 'reviews_count'
+            filtered_products = filtered_products.order_by(sort_order)
         elif sort == 'date':
             sort_order = '-date' if sort_type == 'dec' else 'date'
             filtered_products = filtered_products.order_by(sort_order)
+        elif 'search_rank' in filtered_products.query.annotations:
+            filtered_products = filtered_products.order_by('-search_rank', 'pk')
         return filtered_products
+
+
+REVIEW_STARS = range(1, 6)
+REVIEW_STATS_DIRTY_KEY = "review_stats:dirty"
+REVIEW_STATS_BATCH_SIZE = 500
+
+
+def calculate_rating(reviews_count: int, rating_sum: int) -> float:
+
+    """функция считает средний рейтинг товара по агрегатам его отзывов"""
+
+    if reviews_count > 0:
+        return round(rating_sum / reviews_count, 2)
+    return 0
+
+
+def rebuild_review_stats(product_ids: Optional[Iterable[int]] = None, batch_size: int = 500) -> int:
+
+    """
+    функция пересчитывает агрегаты отзывов по таблице отзывов,
+    используется для восстановления после загрузки фикстур и массовых операций
+    :param product_ids: товары для пересчета, по умолчанию все
+    :return: колличество пересчитанных товаров
+    """
+
+    products = Product.objects.all()
+    reviews = Review.objects.all()
+    if product_ids is not None:
+        products = products.filter(pk__in=list(product_ids))
+        reviews = reviews.filter(product__in=products)
+    stats = defaultdict(dict)
+    for row in reviews.values('product', 'rate').annotate(total=Count('pk')).order_by():
+        stats[row['product']][row['rate']] = row['total']
+
+    fields = ['reviews_count', 'rating_sum', 'rating'] + [f'rating_{star}' for star in REVIEW_STARS]
+    batch = []
+    updated = 0
+    for product in products.only('pk').iterator(chunk_size=batch_size):
+        rates = stats.get(product.pk, {})
+        product.reviews_count = sum(rates.values())
+        product.rating_sum = sum(rate * total for rate, total in rates.items())
+        product.rating = calculate_rating(product.reviews_count, product.rating_sum)
+        for star in REVIEW_STARS:
+            setattr(product, f'rating_{star}', rates.get(star, 0))
+        batch.append(product)
+        if len(batch) >= batch_size:
+            Product.objects.bulk_update(batch, fields)
+            updated += len(batch)
+            batch = []
+    if batch:
+        Product.objects.bulk_update(batch, fields)
+        updated += len(batch)
+    return updated
+
+
+def mark_review_stats_dirty(product_ids: Iterable[int]) -> bool:
+
+    """
+    функция запоминает товары, агрегаты отзывов которых нужно пересчитать
+    :return: False, если кеш не на Redis и пересчет нужно выполнить сразу
+    """
+
+    product_ids = list(product_ids)
+    redis = get_redis()
+    if redis is None:
+        return False
+    if product_ids:
+        redis.sadd(REVIEW_STATS_DIRTY_KEY, *product_ids)
+    return True
+
+
+def pop_dirty_review_stats(count: int = REVIEW_STATS_BATCH_SIZE) -> List[int]:
+    redis = get_redis()
+    if redis is None:
+        return []
+    return [int(product_id) for product_id in redis.spop(REVIEW_STATS_DIRTY_KEY, count) or []]
+
+
+def reconcile_review_stats(product_ids: Iterable[int]) -> int:
+
+    """
+    функция пересчитывает агрегаты отзывов товаров одним запросом к отзывам
+    и одним обновлением товаров, затем обновляет рейтинги, пул банеров
+    и кеши, которые зависят от рейтинга
+    :return: колличество пересчитанных товаров
+    """
+
+    product_ids = sorted(set(product_ids))
+    if not product_ids:
+        return 0
+    updated = rebuild_review_stats(product_ids, batch_size=len(product_ids))
+    for product in Product.objects.filter(pk__in=product_ids).only('pk', 'count', 'rating'):
+        sync_product_stores(product)
+    invalidate_product_details(product_ids)
+    bump_generation(CATALOG_NAMESPACE)
+    return updated
+
+
+def get_category_tree() -> Tuple[List[Categories], Dict[int, List[Categories]]]:
+
+    """
+    функция читает все дерево категорий одним запросом вместе с первой картинкой каждой категории,
+    уменьшенные копии картинок читаются вторым запросом
+    :return: корневые категории и словарь "id родителя: список дочерних категорий"
+    """
+
+    first_image = CategoryImage.objects.filter(category=OuterRef('pk')).order_by('pk')
+    categories = list(Categories.objects.annotate(
+        image_id=Subquery(first_image.values('pk')[:1]),
+        image_name=Subquery(first_image.values('image')[:1]),
+    ).order_by('path'))
+    variants = defaultdict(list)
+    image_ids = [category.image_id for category in categories if category.image_id]
+    for variant in ImageVariant.objects.filter(category_image__in=image_ids) if image_ids else []:
+        variants[variant.category_image_id].append(variant)
+    roots = []
+    children = defaultdict(list)
+    for category in categories:
+        category.image_variants = variants.get(category.image_id, [])
+        if category.parent_category_id is None:
+            roots.append(category)
+        else:
+            children[category.parent_category_id].append(category)
+    return roots, dict(children)
+
+
+def rebuild_category_paths() -> int:
+
+    """функция пересчитывает материализованные пути всех категорий,
+    используется после загрузки фикстур
+    :return: колличество категорий"""
+
+    parents = dict(Categories.objects.values_list('pk', 'parent_category_id'))
+    paths = {}
+
+    def build_path(category_id: int, seen: tuple = ()) -> str:
+        if category_id not in paths:
+            parent_id = parents.get(category_id)
+            parent_path = ''
+            if parent_id is not None and parent_id not in seen:
+                parent_path = build_path(parent_id, seen + (category_id,))
+            paths[category_id] = parent_path + category_path_segment(category_id)
+        return paths[category_id]
+
+    categories = list(Categories.objects.only('pk', 'parent_category'))
+    for category in categories:
+        category.path = build_path(category.pk)
+    Categories.objects.bulk_update(categories, ['path'], batch_size=500)
+    return len(categories)
+
+
+def top_products(name: str, count: int) -> List[Product]:
+
+    """
+    функция возвращает первые товары рейтинга (popular или limited) в порядке рейтинга,
+    товары загружаются одним запросом по id вместо сортировки всей таблицы
+    """
+
+    product_ids = top_product_ids(name, count)
+    products = ProductSerializer.setup_eager_loading(Product.objects.filter(pk__in=product_ids))
+    products_by_id = {product.pk: product for product in products}
+    return [products_by_id[product_id] for product_id in product_ids if product_id in products_by_id]
+
+
+def get_product_details(product_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+
+    """
+    функция возвращает детальные документы товаров одним чтением кеша,
+    отсутствующие в кеше документы собираются фиксированным числом запросов
+    и сохраняются в кеш одной записью
+    :return: словарь "id товара: детальные данные", несуществующих товаров в нем нет
+    """
+
+    keys = {product_detail_key(product_id): product_id for product_id in product_ids}
+    cached = cache.get_many(list(keys))
+    details = {keys[key]: data for key, data in cached.items()}
+    missing_ids = [product_id for key, product_id in keys.items() if key not in cached]
+    if missing_ids:
+        products = ProductIDSerializer.setup_eager_loading(Product.objects.filter(pk__in=missing_ids))
+        built = {product.pk: ProductIDSerializer(instance=product).data for product in products}
+        cache.set_many(
+            {product_detail_key(product_id): data for product_id, data in built.items()},
+            PRODUCT_DETAIL_TIMEOUT,
+        )
+        remember_product_modified(built)
+        details.update(built)
+    return details
@@ -0,0 +1,331 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.db import transaction
+from django.dispatch import receiver
+from myauth.models import Profile
+from .models import (
+    Categories, CategoryImage, ImageVariant, Product, ProductImage, Review, SaleDate, Specification, Tag,
+)
+from megano.cache import bump_generation_on_commit
+from .cache import (
+    CATALOG_NAMESPACE,
+    CATEGORIES_NAMESPACE,
+    TAGS_NAMESPACE,
+    invalidate_product_details_on_commit,
+)
+from .facets import bump_facets_version, publish_facets_change
+from .search import index_products
+from .stores import discard_product_stores, invalidate_product_stores, sync_product_stores
+from .tasks import build_image_variants, schedule_review_stats
+
+
+@receiver(pre_save, sender=Review)
+def remember_review_state(sender, instance: Review, raw: bool = False, **kwargs) -> None:
+    """
+    функция запоминает товар и оценку отзыва до сохранения,
+    чтобы при редактировании отзыва скорректировать агрегаты товара
+    """
+    instance._previous_state = None
+    if raw or instance.pk is None:
+        return
+    instance._previous_state = Review.objects.filter(pk=instance.pk).values_list('product_id', 'rate').first()
+
+
+@receiver(post_save, sender=Review)
+def apply_review_to_product_stats(sender, instance: Review, created: bool, raw: bool = False, **kwargs) -> None:
+    """
+    функция обновляет агрегаты отзывов товара при создании и редактировании отзыва,
+    пересчет откладывается и объединяет все изменения отзывов товара за REVIEW_STATS_DELAY секунд
+    """
+    if raw:
+        return
+    previous_state = getattr(instance, '_previous_state', None)
+    if previous_state == (instance.product_id, instance.rate):
+        return
+    product_ids = {instance.product_id, previous_state[0]} if previous_state else {instance.product_id}
+    transaction.on_commit(lambda: schedule_review_stats(product_ids))
+
+
+@receiver(post_delete, sender=Review)
+def remove_review_from_product_stats(sender, instance: Review, **kwargs) -> None:
+    """
+    функция обновляет агрегаты отзывов товара при удалении отзыва
+    """
+    product_id = instance.product_id
+    transaction.on_commit(lambda: schedule_review_stats([product_id]))
+
+
+@receiver(post_save, sender=Product)
+def index_saved_product(sender, instance: Product, raw: bool = False, **kwargs) -> None:
+    """
+    функция обновляет поисковый документ товара после сохранения
+    """
+    update_fields = kwargs.get('update_fields')
+    if raw or (update_fields and not {'title', 'description'} & set(update_fields)):
+        return
+    index_products([instance.pk])
+
+
+@receiver(m2m_changed, sender=Product.tags.through)
+@receiver(m2m_changed, sender=Product.specifications.through)
+def index_product_relations(sender, instance, action: str, reverse: bool, pk_set, **kwargs) -> None:
+    """
+    функция переиндексирует товары при изменении их тегов и спецификаций,
+    перед очисткой связи со стороны тега запоминает его товары
+    """
+    if action == 'pre_clear' and reverse:
+        instance._indexed_product_ids = list(instance.product.values_list('pk', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        index_products([instance.pk])
+    elif action == 'post_clear':
+        index_products(getattr(instance, '_indexed_product_ids', []))
+    else:
+        index_products(pk_set or [])
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Specification)
+def index_products_of_relation(sender, instance, raw: bool = False, created: bool = False, **kwargs) -> None:
+    """
+    функция переиндексирует товары переименованного тега или спецификации
+    """
+    if raw or created:
+        return
+    index_products(instance.product.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Specification)
+def remember_products_of_relation(sender, instance, **kwargs) -> None:
+    """
+    функция запоминает товары удаляемого тега или спецификации
+    """
+    instance._indexed_product_ids = list(instance.product.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Specification)
+def index_products_of_deleted_relation(sender, instance, **kwargs) -> None:
+    """
+    функция переиндексирует товары удаленного тега или спецификации
+    """
+    index_products(getattr(instance, '_indexed_product_ids', []))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+@receiver(post_save, sender=SaleDate)
+@receiver(post_delete, sender=SaleDate)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+@receiver(post_save, sender=Categories)
+@receiver(post_delete, sender=Categories)
+def invalidate_catalog_pages(sender, **kwargs) -> None:
+    """
+    функция меняет поколение кеша каталога при любом изменении данных,
+    которые попадают в страницы каталога
+    """
+    bump_generation_on_commit(CATALOG_NAMESPACE)
+
+
+@receiver(m2m_changed, sender=Product.tags.through)
+def invalidate_catalog_pages_on_tags(sender, action: str, **kwargs) -> None:
+    """
+    функция меняет поколение кеша каталога при изменении тегов товаров
+    """
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_generation_on_commit(CATALOG_NAMESPACE)
+
+
+@receiver(post_save, sender=Categories)
+@receiver(post_delete, sender=Categories)
+@receiver(post_save, sender=CategoryImage)
+@receiver(post_delete, sender=CategoryImage)
+def invalidate_categories_cache(sender, **kwargs) -> None:
+    """
+    функция меняет поколение кеша дерева категорий
+    """
+    bump_generation_on_commit(CATEGORIES_NAMESPACE)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tags_cache(sender, **kwargs) -> None:
+    """
+    функция меняет поколение кеша списка тегов
+    """
+    bump_generation_on_commit(TAGS_NAMESPACE)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def update_product_facets(sender, instance: Product, raw: bool = False, **kwargs) -> None:
+    """
+    функция после фиксации транзакции публикует изменение товара для индекса фасетов,
+    при загрузке фикстур индекс перестраивается целиком
+    """
+    if raw:
+        transaction.on_commit(bump_facets_version)
+    else:
+        product_ids = [instance.pk]
+        transaction.on_commit(lambda: publish_facets_change(product_ids))
+
+
+@receiver(m2m_changed, sender=Product.tags.through)
+def update_tag_facets(sender, instance, action: str, reverse: bool, pk_set, **kwargs) -> None:
+    """
+    функция публикует для индекса фасетов товары, у которых изменились теги
+    """
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        product_ids = [instance.pk]
+    elif action == 'post_clear':
+        product_ids = list(getattr(instance, '_indexed_product_ids', []))
+    else:
+        product_ids = list(pk_set or [])
+    transaction.on_commit(lambda: publish_facets_change(product_ids))
+
+
+@receiver(post_delete, sender=Tag)
+def update_facets_of_deleted_tag(sender, instance: Tag, **kwargs) -> None:
+    """
+    функция публикует для индекса фасетов товары удаленного тега
+    """
+    product_ids = list(getattr(instance, '_indexed_product_ids', []))
+    transaction.on_commit(lambda: publish_facets_change(product_ids))
+
+
+@receiver(post_save, sender=Categories)
+@receiver(post_delete, sender=Categories)
+def invalidate_facets(sender, **kwargs) -> None:
+    """
+    функция после изменения дерева категорий помечает индекс фасетов устаревшим,
+    индекс будет перестроен при следующем чтении
+    """
+    transaction.on_commit(bump_facets_version)
+
+
+@receiver(post_save, sender=Product)
+def update_product_stores(sender, instance: Product, raw: bool = False, **kwargs) -> None:
+    """
+    функция обновляет товар в пуле банеров и рейтингах популярных и лимитированных товаров
+    """
+    if raw:
+        transaction.on_commit(invalidate_product_stores)
+    else:
+        transaction.on_commit(lambda: sync_product_stores(instance))
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_from_stores(sender, instance: Product, **kwargs) -> None:
+    """
+    функция убирает удаленный товар из пула банеров и рейтингов
+    """
+    product_id = instance.pk
+    transaction.on_commit(lambda: discard_product_stores(product_id))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_detail(sender, instance: Product, **kwargs) -> None:
+    """
+    функция удаляет из кеша детальный документ измененного товара
+    """
+    invalidate_product_details_on_commit([instance.pk])
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def invalidate_product_detail_on_image(sender, instance: ProductImage, **kwargs) -> None:
+    """
+    функция удаляет из кеша детальный документ товара при изменении его картинок
+    """
+    invalidate_product_details_on_commit([instance.images_product_id])
+
+
+@receiver(post_save, sender=SaleDate)
+@receiver(post_delete, sender=SaleDate)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_product_detail_on_relation(sender, instance, **kwargs) -> None:
+    """
+    функция удаляет из кеша детальный документ товара при изменении его скидки или отзывов,
+    при переносе отзыва на другой товар документ прежнего товара тоже удаляется
+    """
+    previous_state = getattr(instance, '_previous_state', None)
+    previous_product_ids = [previous_state[0]] if previous_state else []
+    invalidate_product_details_on_commit([instance.product_id, *previous_product_ids])
+
+
+@receiver(m2m_changed, sender=Product.tags.through)
+@receiver(m2m_changed, sender=Product.specifications.through)
+def invalidate_product_detail_on_m2m(sender, instance, action: str, reverse: bool, pk_set, **kwargs) -> None:
+    """
+    функция удаляет из кеша детальные документы товаров при изменении их тегов и спецификаций
+    """
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        invalidate_product_details_on_commit([instance.pk])
+    elif action == 'post_clear':
+        invalidate_product_details_on_commit(getattr(instance, '_indexed_product_ids', []))
+    else:
+        invalidate_product_details_on_commit(pk_set or [])
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Specification)
+def invalidate_product_detail_of_relation(sender, instance, raw: bool = False, created: bool = False, **kwargs) -> None:
+    """
+    функция удаляет из кеша детальные документы товаров измененного тега или спецификации
+    """
+    if raw or created:
+        return
+    invalidate_product_details_on_commit(instance.product.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Specification)
+def invalidate_product_detail_of_deleted_relation(sender, instance, **kwargs) -> None:
+    """
+    функция удаляет из кеша детальные документы товаров удаленного тега или спецификации
+    """
+    invalidate_product_details_on_commit(getattr(instance, '_indexed_product_ids', []))
+
+
+@receiver(post_save, sender=Profile)
+def invalidate_product_detail_of_author(sender, instance: Profile, raw: bool = False, **kwargs) -> None:
+    """
+    функция удаляет из кеша детальные документы товаров с отзывами пользователя,
+    так как в отзывах выводятся имя и почта из профиля
+    """
+    if raw:
+        return
+    invalidate_product_details_on_commit(Review.objects.filter(author_id=instance.user_id).values_list('product_id', flat=True))
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_save, sender=CategoryImage)
+def schedule_image_variants(sender, instance, raw: bool = False, **kwargs) -> None:
+    """
+    функция после сохранения картинки ставит в очередь Celery построение ее уменьшенных копий
+    """
+    if raw or not instance.image:
+        return
+    kind = 'product' if sender is ProductImage else 'category'
+    transaction.on_commit(lambda: build_image_variants.delay(kind, instance.pk))
+
+
+@receiver(post_delete, sender=ImageVariant)
+def delete_image_variant_file(sender, instance: ImageVariant, **kwargs) -> None:
+    """
+    функция удаляет файл уменьшенной копии картинки вместе с записью
+    """
+    if instance.image:
+        instance.image.delete(save=False)
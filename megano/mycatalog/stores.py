@@ -0,0 +1,428 @@
+import heapq
+import random
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+from django.conf import settings
+from megano.cache import namespace_get, namespace_set
+from .cache import CATALOG_NAMESPACE
+from .models import Product
+
+
+BANNER_POOL_KEY = "banners:pool:{bucket}"
+BANNER_POOL_READY_KEY = "banners:pool:ready"
+BANNER_BUCKETS = range(0, 6)
+BANNER_WEIGHTINGS = {
+    "uniform": lambda bucket: 1,
+    "rating": lambda bucket: bucket + 1,
+}
+BANNERS_COUNT = 4
+BANNER_SELECTION_KEY = "banners:selection"
+BANNER_SELECTION_TIMEOUT = 3
+# v2: члены множества - id с ведущими нулями, значения рейтингов по убыванию хранятся со знаком минус
+LEADERBOARD_KEY = "leaderboard:{name}:v2"
+LEADERBOARD_READY_KEY = "leaderboard:{name}:v2:ready"
+LEADERBOARD_MEMBER = "{product_id:020d}"
+
+
+def get_redis():
+
+    """функция возвращает клиент Redis кеша по умолчанию или None, если кеш не на Redis"""
+
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection("default")
+    except (ImportError, NotImplementedError):
+        return None
+
+
+def banner_bucket(rating: Optional[float]) -> int:
+
+    """функция возвращает корзину пула по рейтингу товара"""
+
+    return min(max(int(round(rating or 0)), BANNER_BUCKETS[0]), BANNER_BUCKETS[-1])
+
+
+def split_sample(sizes: Dict[int, int], count: int, weighting: str) -> Dict[int, int]:
+
+    """
+    функция распределяет колличество случайных товаров по корзинам пула
+    пропорционально размеру корзины и ее весу
+    :return: словарь "корзина: сколько товаров взять"
+    """
+
+    weight = BANNER_WEIGHTINGS.get(weighting, BANNER_WEIGHTINGS["uniform"])
+    left = dict(sizes)
+    plan = {}
+    for _ in range(min(count, sum(sizes.values()))):
+        buckets = [bucket for bucket, size in left.items() if size > 0]
+        bucket = random.choices(buckets, weights=[left[b] * weight(b) for b in buckets])[0]
+        plan[bucket] = plan.get(bucket, 0) + 1
+        left[bucket] -= 1
+    return plan
+
+
+class RedisBannerPool:
+
+    """
+    Пул id товаров в наличии для случайных банеров.
+    Товары разложены по множествам Redis по рейтингу, выборка делается
+    командами SCARD и SRANDMEMBER, поэтому память и время ответа процесса
+    не зависят от размера каталога
+    """
+
+    def __init__(self, redis):
+        self.redis = redis
+
+    def is_ready(self) -> bool:
+        return bool(self.redis.exists(BANNER_POOL_READY_KEY))
+
+    def invalidate(self) -> None:
+        self.redis.delete(BANNER_POOL_READY_KEY)
+
+    def rebuild(self, rows: Iterable[Tuple[int, Optional[float]]]) -> None:
+        temporary = {bucket: BANNER_POOL_KEY.format(bucket=bucket) + ":new" for bucket in BANNER_BUCKETS}
+        pipeline = self.redis.pipeline()
+        pipeline.delete(*temporary.values())
+        for number, (product_id, rating) in enumerate(rows, start=1):
+            pipeline.sadd(temporary[banner_bucket(rating)], product_id)
+            if number % 1000 == 0:
+                pipeline.execute()
+        for key in temporary.values():
+            pipeline.exists(key)
+        filled = pipeline.execute()[-len(temporary):]
+        # пустое множество в Redis не существует, его корзину просто очищаем
+        pipeline = self.redis.pipeline()
+        for (bucket, key), exists in zip(temporary.items(), filled):
+            if exists:
+                pipeline.rename(key, BANNER_POOL_KEY.format(bucket=bucket))
+            else:
+                pipeline.delete(BANNER_POOL_KEY.format(bucket=bucket))
+        pipeline.set(BANNER_POOL_READY_KEY, 1)
+        pipeline.execute()
+
+    def put(self, product_id: int, rating: Optional[float]) -> None:
+        target = banner_bucket(rating)
+        pipeline = self.redis.pipeline()
+        for bucket in BANNER_BUCKETS:
+            if bucket != target:
+                pipeline.srem(BANNER_POOL_KEY.format(bucket=bucket), product_id)
+        pipeline.sadd(BANNER_POOL_KEY.format(bucket=target), product_id)
+        pipeline.execute()
+
+    def discard(self, product_id: int) -> None:
+        pipeline = self.redis.pipeline()
+        for bucket in BANNER_BUCKETS:
+            pipeline.srem(BANNER_POOL_KEY.format(bucket=bucket), product_id)
+        pipeline.execute()
+
+    def sizes(self) -> Dict[int, int]:
+        pipeline = self.redis.pipeline()
+        for bucket in BANNER_BUCKETS:
+            pipeline.scard(BANNER_POOL_KEY.format(bucket=bucket))
+        return dict(zip(BANNER_BUCKETS, pipeline.execute()))
+
+    def sample(self, count: int, weighting: str = "uniform") -> List[int]:
+        plan = split_sample(self.sizes(), count, weighting)
+        pipeline = self.redis.pipeline()
+        for bucket, bucket_count in plan.items():
+            pipeline.srandmember(BANNER_POOL_KEY.format(bucket=bucket), bucket_count)
+        return [int(product_id) for members in pipeline.execute() for product_id in members]
+
+
+class MemoryBannerPool:
+
+    """Пул банеров в памяти процесса, используется когда кеш работает не на Redis"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ready = False
+        self.buckets = {bucket: [] for bucket in BANNER_BUCKETS}
+        self.positions = {}
+
+    def is_ready(self) -> bool:
+        return self.ready
+
+    def invalidate(self) -> None:
+        self.ready = False
+
+    def rebuild(self, rows: Iterable[Tuple[int, Optional[float]]]) -> None:
+        with self.lock:
+            self.buckets = {bucket: [] for bucket in BANNER_BUCKETS}
+            self.positions = {}
+            for product_id, rating in rows:
+                self._add(product_id, banner_bucket(rating))
+            self.ready = True
+
+    def _add(self, product_id: int, bucket: int) -> None:
+        self.positions[product_id] = (bucket, len(self.buckets[bucket]))
+        self.buckets[bucket].append(product_id)
+
+    def _remove(self, product_id: int) -> None:
+        position = self.positions.pop(product_id, None)
+        if position is None:
+            return
+        bucket, index = position
+        members = self.buckets[bucket]
+        last = members.pop()
+        if last != product_id:
+            members[index] = last
+            self.positions[last] = (bucket, index)
+
+    def put(self, product_id: int, rating: Optional[float]) -> None:
+        with self.lock:
+            self._remove(product_id)
+            self._add(product_id, banner_bucket(rating))
+
+    def discard(self, product_id: int) -> None:
+        with self.lock:
+            self._remove(product_id)
+
+    def sizes(self) -> Dict[int, int]:
+        return {bucket: len(members) for bucket, members in self.buckets.items()}
+
+    def sample(self, count: int, weighting: str = "uniform") -> List[int]:
+        with self.lock:
+            plan = split_sample(self.sizes(), count, weighting)
+            return [
+                product_id
+                for bucket, bucket_count in plan.items()
+                for product_id in random.sample(self.buckets[bucket], bucket_count)
+            ]
+
+
+_memory_banner_pool = MemoryBannerPool()
+
+
+def get_banner_pool():
+
+    """функция возвращает пул банеров в Redis, а без Redis пул в памяти процесса"""
+
+    redis = get_redis()
+    if redis is None:
+        return _memory_banner_pool
+    return RedisBannerPool(redis)
+
+
+def rebuild_banner_pool() -> int:
+
+    """функция заново собирает пул банеров из товаров в наличии
+    :return: колличество товаров в пуле"""
+
+    rows = Product.objects.filter(count__gt=0).values_list('pk', 'rating').order_by().iterator(chunk_size=2000)
+    pool = get_banner_pool()
+    pool.rebuild(rows)
+    return sum(pool.sizes().values())
+
+
+def sample_banner_ids(count: int, weighting: str = "uniform") -> List[int]:
+
+    """функция возвращает id случайных товаров в наличии для банеров"""
+
+    pool = get_banner_pool()
+    if not pool.is_ready():
+        rebuild_banner_pool()
+    return pool.sample(count, weighting)
+
+
+def current_banner_ids() -> List[int]:
+
+    """функция возвращает текущую выборку банеров, выборка меняется раз в несколько секунд
+    и сразу после любого изменения каталога"""
+
+    product_ids = namespace_get(CATALOG_NAMESPACE, BANNER_SELECTION_KEY)
+    if product_ids is None:
+        product_ids = sample_banner_ids(BANNERS_COUNT, settings.BANNERS_WEIGHTING)
+        namespace_set(CATALOG_NAMESPACE, product_ids, BANNER_SELECTION_KEY, BANNER_SELECTION_TIMEOUT)
+    return product_ids
+
+
+class RedisLeaderboard:
+
+    """
+    Рейтинг товаров в сортированном множестве Redis, top-K читается командой ZRANGE за O(log N + K).
+    При равных значениях Redis сравнивает члены как строки, поэтому id хранятся с ведущими нулями,
+    а значения рейтингов по убыванию со знаком минус: обычный ZRANGE по возрастанию
+    сразу дает порядок базы данных "значение, затем id по возрастанию"
+    """
+
+    def __init__(self, redis, name: str, reverse: bool):
+        self.redis = redis
+        self.key = LEADERBOARD_KEY.format(name=name)
+        self.ready_key = LEADERBOARD_READY_KEY.format(name=name)
+        self.reverse = reverse
+
+    def member(self, product_id: int) -> str:
+        return LEADERBOARD_MEMBER.format(product_id=int(product_id))
+
+    def score(self, value: float) -> float:
+        return -value if self.reverse else value
+
+    def is_ready(self) -> bool:
+        return bool(self.redis.exists(self.ready_key))
+
+    def invalidate(self) -> None:
+        self.redis.delete(self.ready_key)
+
+    def rebuild(self, rows: Iterable[Tuple[int, float]]) -> None:
+        temporary = self.key + ":new"
+        pipeline = self.redis.pipeline()
+        pipeline.delete(temporary)
+        scores = {}
+        for product_id, score in rows:
+            scores[self.member(product_id)] = self.score(score)
+            if len(scores) >= 1000:
+                pipeline.zadd(temporary, scores)
+                pipeline.execute()
+                scores = {}
+        if scores:
+            pipeline.zadd(temporary, scores)
+        pipeline.exists(temporary)
+        filled = pipeline.execute()[-1]
+        pipeline = self.redis.pipeline()
+        if filled:
+            pipeline.rename(temporary, self.key)
+        else:
+            pipeline.delete(self.key)
+        pipeline.set(self.ready_key, 1)
+        pipeline.execute()
+
+    def put(self, product_id: int, score: float) -> None:
+        self.redis.zadd(self.key, {self.member(product_id): self.score(score)})
+
+    def discard(self, product_id: int) -> None:
+        self.redis.zrem(self.key, self.member(product_id))
+
+    def top(self, count: int) -> List[int]:
+        if count <= 0:
+            return []
+        return [int(member) for member in self.redis.zrange(self.key, 0, count - 1)]
+
+
+class MemoryLeaderboard:
+
+    """Рейтинг товаров в памяти процесса, используется когда кеш работает не на Redis"""
+
+    def __init__(self, reverse: bool):
+        self.lock = threading.Lock()
+        self.ready = False
+        self.scores = {}
+        self.reverse = reverse
+
+    def is_ready(self) -> bool:
+        return self.ready
+
+    def invalidate(self) -> None:
+        self.ready = False
+
+    def rebuild(self, rows: Iterable[Tuple[int, float]]) -> None:
+        with self.lock:
+            self.scores = dict(rows)
+            self.ready = True
+
+    def put(self, product_id: int, score: float) -> None:
+        with self.lock:
+            self.scores[product_id] = score
+
+    def discard(self, product_id: int) -> None:
+        with self.lock:
+            self.scores.pop(product_id, None)
+
+    def top(self, count: int) -> List[int]:
+        with self.lock:
+            return leaderboard_order(self.scores.items(), count, self.reverse)
+
+
+def leaderboard_order(rows: Iterable[Tuple[int, float]], count: int, reverse: bool) -> List[int]:
+
+    """функция возвращает первые count id по значению, при равенстве по возрастанию id"""
+
+    sign = -1 if reverse else 1
+    return [product_id for product_id, _ in heapq.nsmallest(count, rows, key=lambda row: (sign * row[1], row[0]))]
+
+
+def popular_score(count: Optional[int], rating: Optional[float]) -> Optional[float]:
+    return rating or 0.0
+
+
+def limited_score(count: Optional[int], rating: Optional[float]) -> Optional[float]:
+    return count if count and count > 0 else None
+
+
+# имя рейтинга: (значение товара или None если товар не участвует, сначала большие значения)
+LEADERBOARDS = {
+    "popular": (popular_score, True),
+    "limited": (limited_score, False),
+}
+_memory_leaderboards = {name: MemoryLeaderboard(reverse) for name, (_, reverse) in LEADERBOARDS.items()}
+
+
+def get_leaderboard(name: str):
+
+    """функция возвращает рейтинг товаров в Redis, а без Redis рейтинг в памяти процесса"""
+
+    redis = get_redis()
+    if redis is None:
+        return _memory_leaderboards[name]
+    return RedisLeaderboard(redis, name, LEADERBOARDS[name][1])
+
+
+def rebuild_leaderboards() -> Dict[str, int]:
+
+    """функция заново собирает все рейтинги товаров одним проходом по таблице товаров
+    :return: колличество товаров в каждом рейтинге"""
+
+    rows = {name: [] for name in LEADERBOARDS}
+    products = Product.objects.values_list('pk', 'count', 'rating').order_by()
+    for product_id, count, rating in products.iterator(chunk_size=2000):
+        for name, (score, _) in LEADERBOARDS.items():
+            value = score(count, rating)
+            if value is not None:
+                rows[name].append((product_id, value))
+    for name, leaderboard_rows in rows.items():
+        get_leaderboard(name).rebuild(leaderboard_rows)
+    return {name: len(leaderboard_rows) for name, leaderboard_rows in rows.items()}
+
+
+def top_product_ids(name: str, count: int) -> List[int]:
+
+    """функция возвращает id первых count товаров рейтинга"""
+
+    leaderboard = get_leaderboard(name)
+    if not leaderboard.is_ready():
+        rebuild_leaderboards()
+    return leaderboard.top(count)
+
+
+def sync_product_stores(product: Product) -> None:
+
+    """функция обновляет товар в пуле банеров и рейтингах по остатку и рейтингу товара"""
+
+    pool = get_banner_pool()
+    if product.count and product.count > 0:
+        pool.put(product.pk, product.rating)
+    else:
+        pool.discard(product.pk)
+    for name, (score, _) in LEADERBOARDS.items():
+        value = score(product.count, product.rating)
+        if value is None:
+            get_leaderboard(name).discard(product.pk)
+        else:
+            get_leaderboard(name).put(product.pk, value)
+
+
+def discard_product_stores(product_id: int) -> None:
+
+    """функция убирает товар из пула банеров и рейтингов"""
+
+    get_banner_pool().discard(product_id)
+    for name in LEADERBOARDS:
+        get_leaderboard(name).discard(product_id)
+
+
+def invalidate_product_stores() -> None:
+
+    """функция помечает пул банеров и рейтинги устаревшими, они пересоберутся при следующем чтении"""
+
+    get_banner_pool().invalidate()
+    for name in LEADERBOARDS:
+        get_leaderboard(name).invalidate()
@@ -1,30 +1,56 @@
 from celery import shared_task
 import time
 from celery_singleton import Singleton
-from django.db.models import F
-import celery
-from .models import Product, Review
-from django.db.models import DecimalField, Count, QuerySet
-from django.db.models.functions import Coalesce
-from django.http import QueryDict
+from django.conf import settings
+from django.core.cache import cache
+from .services import mark_review_stats_dirty, pop_dirty_review_stats, reconcile_review_stats
+from .images import IMAGE_MODELS, generate_image_variants
+
+
+REVIEW_STATS_LOCK_KEY = "review_stats:scheduled"
+REVIEW_STATS_LOCK_EXPIRY = 10 * 60
+
+
+@shared_task(base=Singleton, lock_expiry=REVIEW_STATS_LOCK_EXPIRY)
+def reconcile_dirty_review_stats():
+    """
+    задача пересчитывает агрегаты отзывов всех помеченных товаров пачками,
+    запускается через REVIEW_STATS_DELAY секунд после первого изменения отзывов и раз в минуту по расписанию,
+    Singleton не дает запускам по расписанию и после изменений выполняться одновременно
+    """
+    # отзывы, измененные во время пересчета, запланируют следующий запуск
+    cache.delete(REVIEW_STATS_LOCK_KEY)
+    reconciled = 0
+    while True:
+        product_ids = pop_dirty_review_stats()
+        if not product_ids:
+            return reconciled
+        try:
+            reconciled += reconcile_review_stats(product_ids)
+        except Exception:
+            # снятые с множества товары возвращаются в него и пересчитаются следующим запуском
+            mark_review_stats_dirty(product_ids)
+            raise
+
+
+def schedule_review_stats(product_ids):
+    """
+    функция откладывает пересчет агрегатов отзывов товаров: все изменения отзывов
+    за REVIEW_STATS_DELAY секунд применяются одной задачей, каждый товар пересчитывается один раз
+    """
+    if not mark_review_stats_dirty(product_ids):
+        reconcile_review_stats(product_ids)
+        return
+    if cache.add(REVIEW_STATS_LOCK_KEY, 1, timeout=settings.REVIEW_STATS_DELAY):
+        reconcile_dirty_review_stats.apply_async(countdown=settings.REVIEW_STATS_DELAY)
 
 
 @shared_task()
-def count_rating(product_id):
-    instance = Product.objects.get(id=product_id)
-    reviews_instances = instance.review.all()
-    count = reviews_instances.count()
-    rate_summ = 0
-    if count > 0:
-        for review in reviews_instances:
-            rate_summ += review.rate
-        result = round(rate_summ / count, 2)
-        instance.rating = result
-        instance.save()
-    elif count == 0:
-        instance.rating = rate_summ
-        instance.save()
-
+def build_image_variants(kind, image_id):
+    """задача строит уменьшенные webp копии картинки товара (kind="product") или категории (kind="category")"""
+    image_object = IMAGE_MODELS[kind].objects.filter(pk=image_id).first()
+    if image_object is not None:
+        generate_image_variants(image_object)
 
 
 @shared_task()
@@ -4,8 +4,44 @@ from django.http import QueryDict
 from rest_framework import status
 from django.urls import reverse
 from django.contrib.auth import authenticate
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.core.cache import cache
+from django.utils import timezone
+from datetime import timedelta
+from decimal import Decimal
+from django.core.management import CommandError, call_command
+from io import BytesIO, StringIO
+from PIL import Image as PILImage
+from django.core.files.storage import default_storage
 import json
-from .models import Categories, CategoryImage, Review
+from unittest import mock
+from .models import Categories, CategoryImage, Review, Product, ProductImage, ProductSearchDocument, SaleDate, Tag
+from .serializers import PRODUCT_DETAIL_REVIEWS, ProductSerializer
+from .renderers import FastJSONRenderer, product_cards
+from rest_framework.renderers import JSONRenderer
+from .services import (
+    DataFilter,
+    get_product_details,
+    mark_review_stats_dirty,
+    pop_dirty_review_stats,
+    rebuild_review_stats,
+)
+from megano.cache import bump_generation
+from .cache import (
+    CATALOG_NAMESPACE,
+    CATEGORIES_NAMESPACE,
+    PRODUCT_MODIFIED_KEY,
+    TAGS_NAMESPACE,
+    invalidate_product_details,
+    product_detail_key,
+)
+from .facets import FacetIndex, facet_index
+from .tasks import REVIEW_STATS_LOCK_KEY, build_image_variants, reconcile_dirty_review_stats
+from .stores import RedisLeaderboard, get_redis, rebuild_leaderboards, sample_banner_ids, top_product_ids
+from .importer import import_catalog
 
 
 class CategoriesViewTestCase(APITestCase):
@@ -45,6 +81,110 @@ class CategoriesViewTestCase(APITestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_categories_conditional_get(self):
+        url = reverse('mycatalog:categories')
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Categories.objects.create(title="new category")
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_tags_cache_follows_changes(self):
+        url = reverse('mycatalog:tags')
+        bump_generation(TAGS_NAMESPACE)
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            tag = Tag.objects.create(name="fresh tag")
+            # до фиксации транзакции поколение не меняется, кеш отдает прежний список
+            self.assertNotIn(tag.pk, [item["id"] for item in self.client.get(url).json()])
+        self.assertIn(tag.pk, [item["id"] for item in self.client.get(url).json()])
+
+    def test_categories_tree_single_query(self):
+        grandchild = Categories.objects.create(title="grandchild", parent_category=self.child_category)
+        url = reverse('mycatalog:categories')
+        bump_generation(CATEGORIES_NAMESPACE)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(len([q for q in context.captured_queries if 'mycatalog_categories' in q['sql']]), 1)
+        root = [item for item in response.json() if item["id"] == self.category.pk][0]
+        child = root["subcategories"][0]
+        self.assertEqual(child["id"], self.child_category.pk)
+        self.assertEqual(child["image"]["src"], self.category_image2.image.url)
+        self.assertEqual(child["subcategories"][0]["id"], grandchild.pk)
+        self.assertIsNone(child["subcategories"][0]["image"])
+
+    def test_catalog_includes_subcategories(self):
+        grandchild = Categories.objects.create(title="grandchild", parent_category=self.child_category)
+        other = Categories.objects.create(title="other")
+        in_root = Product.objects.create(title="in root", category=self.category)
+        in_grandchild = Product.objects.create(title="in grandchild", category=grandchild)
+        Product.objects.create(title="in other", category=other)
+
+        products = DataFilter(QueryDict(f"category={self.category.pk}")).apply_filters_to_products(
+            Product.objects.order_by('pk')
+        )
+        self.assertEqual(list(products), [in_root, in_grandchild])
+        products = DataFilter(QueryDict(f"category={self.category.pk}&subcategories=false")).apply_filters_to_products(
+            Product.objects.order_by('pk')
+        )
+        self.assertEqual(list(products), [in_root])
+
+        self.child_category.parent_category = other
+        self.child_category.save()
+        grandchild.refresh_from_db()
+        self.assertTrue(grandchild.path.startswith(other.path + self.child_category.path[-11:]))
+        products = DataFilter(QueryDict(f"category={other.pk}")).apply_filters_to_products(
+            Product.objects.order_by('pk')
+        )
+        self.assertEqual(products.count(), 2)
+
+    def test_catalog_facets_respect_subcategories(self):
+        # категории setUp созданы без фиксации транзакции, индекс процесса о них не знает
+        facet_index.rebuild()
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(title="in root", category=self.category, count=1)
+            Product.objects.create(title="in child", category=self.child_category, count=1)
+        url = reverse('mycatalog:catalog')
+        for subcategories in ("true", "false"):
+            query = f"category={self.category.pk}&subcategories={subcategories}"
+            expected = DataFilter(QueryDict(query)).apply_filters_to_products(Product.objects.all())
+            facets = self.client.get(f"{url}?{query}").json()["facets"]
+            self.assertEqual(facets["total"], expected.count())
+            category_counts = {category["id"]: category["count"] for category in facets["categories"]}
+            self.assertEqual(category_counts[self.category.pk], expected.count())
+        self.assertEqual(facets["total"], 1)
+        self.assertEqual(
+            facet_index.matching_ids(category=self.category.pk, subcategories=False),
+            list(Product.objects.filter(category=self.category).order_by('pk').values_list('pk', flat=True)),
+        )
+
+    def test_category_cycle_is_a_validation_error(self):
+        grandchild = Categories.objects.create(title="grandchild", parent_category=self.child_category)
+        self.category.parent_category = grandchild
+        with self.assertRaises(ValidationError) as context:
+            self.category.full_clean()
+        self.assertIn('parent_category', context.exception.message_dict)
+        with self.assertRaises(ValueError):
+            self.category.save()
+
+        url = reverse('admin:mycatalog_categories_change', args=[self.category.pk])
+        self.client.force_login(User.objects.create_superuser(username='admin', password='admin_password'))
+        response = self.client.post(url, {
+            "title": "test_title",
+            "parent_category": grandchild.pk,
+            "category_image-TOTAL_FORMS": 0,
+            "category_image-INITIAL_FORMS": 0,
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context["adminform"].form.errors["parent_category"])
+
 
 class CatalogViewTestCase(APITestCase):
     fixtures = [
@@ -70,10 +210,222 @@ class CatalogViewTestCase(APITestCase):
             query_dict[f"filter[{key}]"] = value
         url = reverse('mycatalog:catalog')
         response = self.client.get(url, data=query_dict)
-        expected_keys = ['items', 'currentPage', 'lastPage']
+        expected_keys = ['items', 'currentPage', 'lastPage', 'facets']
         self.assertEqual(set(response.json().keys()), set(expected_keys))
         self.assertEqual(response.status_code, 200)
 
+    def test_product_catalog_facets(self):
+        url = reverse('mycatalog:catalog')
+        products = Product.objects.all()
+        response = self.client.get(url, data={"tags[]": [1], "filter[available]": "true"})
+        facets = response.json()["facets"]
+        available_with_tag = products.filter(tags=1, count__gt=0)
+        self.assertEqual(facets["total"], available_with_tag.count())
+        self.assertEqual(facets["available"], available_with_tag.count())
+        self.assertEqual(facets["freeDelivery"], available_with_tag.filter(freeDelivery=True).count())
+        tag_counts = {tag["id"]: tag["count"] for tag in facets["tags"]}
+        self.assertEqual(tag_counts[2], products.filter(tags=2, count__gt=0).count())
+
+        product = available_with_tag.first()
+        with self.captureOnCommitCallbacks(execute=True):
+            product.tags.remove(1)
+        response = self.client.get(url, data={"tags[]": [1], "filter[available]": "true"})
+        self.assertEqual(response.json()["facets"]["total"], available_with_tag.count())
+        self.assertEqual(
+            facet_index.matching_ids(tags=[1], available=True),
+            list(available_with_tag.order_by('pk').values_list('pk', flat=True)),
+        )
+
+    def test_product_catalog_facets_follow_search_and_price(self):
+        query = "filter[name]=cat&filter[minPrice]=900&filter[maxPrice]=1200&filter[available]=true"
+        response = self.client.get(f"{reverse('mycatalog:catalog')}?{query}")
+        expected = DataFilter(QueryDict(query)).apply_filters_to_products(Product.objects.all())
+        facets = response.json()["facets"]
+        self.assertEqual(facets["total"], expected.count())
+        self.assertLess(facets["total"], Product.objects.filter(count__gt=0).count())
+        self.assertEqual(facets["freeDelivery"], expected.filter(freeDelivery=True).count())
+
+    def test_facet_index_applies_published_changes(self):
+        index = FacetIndex()
+        index.ensure_fresh()
+        product = Product.objects.filter(count__gt=0).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            product.count = 0
+            product.save()
+            product.tags.add(2)
+        with mock.patch.object(index, 'rebuild') as rebuild:
+            self.assertNotIn(product.pk, index.matching_ids(available=True))
+        rebuild.assert_not_called()
+        self.assertIn(product.pk, index.matching_ids(tags=[2]))
+
+    def test_product_catalog_cache(self):
+        url = reverse('mycatalog:catalog')
+        query = "sort=price&sortType=inc&tags[]=2&tags[]=1&currentPage=1"
+        response = self.client.get(f"{url}?{query}")
+        self.assertEqual(response['X-Cache'], 'MISS')
+        response = self.client.get(f"{url}?tags[]=1&currentPage=1&sortType=inc&tags[]=2&sort=price&filter[name]=")
+        self.assertEqual(response['X-Cache'], 'HIT')
+
+        product = Product.objects.get(pk=response.json()["items"][0]["id"])
+        product.title = "renamed product"
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        response = self.client.get(f"{url}?{query}")
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()["items"][0]["title"], "renamed product")
+
+    def test_catalog_cache_separates_cursor_pages(self):
+        url = reverse('mycatalog:catalog')
+        bump_generation(CATALOG_NAMESPACE)
+        response = self.client.get(url)
+        self.assertEqual((response['X-Cache'], "lastPage" in response.json()), ('MISS', True))
+        response = self.client.get(f"{url}?cursor=")
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertIn("nextCursor", response.json())
+        self.assertNotIn("lastPage", response.json())
+        self.assertEqual(self.client.get(f"{url}?cursor=")['X-Cache'], 'HIT')
+
+    def test_product_catalog_cursor(self):
+        url = reverse('mycatalog:catalog')
+        product_ids = list(Product.objects.order_by('pk').values_list('pk', flat=True))
+        for sort in ['price', 'rating', 'reviews', 'date']:
+            query = {"cursor": "", "limit": 3, "sort": sort, "sortType": "dec"}
+            seen_ids = []
+            while True:
+                with CaptureQueriesContext(connection) as context:
+                    response = self.client.get(url, data=query)
+                self.assertEqual(response.status_code, 200)
+                self.assertFalse(any('COUNT(*)' in q['sql'] for q in context.captured_queries))
+                data = response.json()
+                self.assertLessEqual(len(data["items"]), 3)
+                seen_ids += [item["id"] for item in data["items"]]
+                if not data["nextCursor"]:
+                    break
+                query["cursor"] = data["nextCursor"]
+            self.assertEqual(sorted(seen_ids), product_ids)
+
+        query["sort"] = "price"
+        response = self.client.get(url, data=query)
+        self.assertEqual(response.status_code, 404)
+
+
+class CatalogExportTestCase(APITestCase):
+    fixtures = [
+        'categories.json',
+        'category_images.json',
+        'tags.json',
+        'specifications.json',
+        'products.json',
+        'users',
+        'reviews.json'
+    ]
+
+    def setUp(self):
+        self.url = reverse('mycatalog:catalog_export')
+        self.client.force_authenticate(user=User.objects.first())
+
+    def test_export_ndjson(self):
+        now = timezone.now()
+        SaleDate.objects.create(product_id=8, discount=10, date_from=now - timedelta(days=1), date_to=now + timedelta(days=1))
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual([row["id"] for row in rows], list(Product.objects.order_by('pk').values_list('pk', flat=True)))
+        sale_row = [row for row in rows if row["id"] == 8][0]
+        self.assertEqual((sale_row["price"], sale_row["salePrice"], sale_row["discount"]), ("2000.00", "1800.00", 10))
+        self.assertEqual(
+            [row for row in rows if row["id"] == 1][0]["tags"],
+            sorted(Product.objects.get(pk=1).tags.values_list('name', flat=True)),
+        )
+
+    def test_export_csv(self):
+        response = self.client.get(self.url, data={'type': 'csv'})
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertTrue(lines[0].startswith("id,title,categoryId,category,price"))
+        self.assertEqual(len(lines), Product.objects.count() + 1)
+        self.assertEqual(self.client.get(self.url, data={'type': 'xml'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_requires_authentication(self):
+        self.client.force_authenticate(user=None)
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+
+
+class ImportCatalogTestCase(APITestCase):
+    fixtures = [
+        'categories.json',
+        'tags.json',
+        'specifications.json',
+        'products.json',
+    ]
+
+    def test_import_is_batched_and_idempotent(self):
+        rows = StringIO(
+            "id,title,price,count,categoryId,freeDelivery,tags,specifications\n"
+            "1,computer 4 cat,999.90,2,4,false,imported|fresh,color:red\n"
+            "400,new product,10,3,4,true,imported,color:red|size:XL\n"
+            "401,another product,20,0,4,false,,\n"
+            "402,broken,10,1,999,false,,\n"
+        )
+        with CaptureQueriesContext(connection) as queries:
+            importer = import_catalog(rows, 'csv', batch_size=2)
+        self.assertLess(len(queries), 60)
+        self.assertEqual(importer.stats["rows"], 3)
+        self.assertEqual(importer.stats["created"], 2)
+        self.assertEqual(importer.stats["updated"], 1)
+        self.assertEqual(importer.stats["skipped"], 1)
+        product = Product.objects.get(pk=400)
+        self.assertEqual((product.price, product.count, product.freeDelivery), (Decimal("10.00"), 3, True))
+        self.assertEqual(sorted(product.specifications.values_list('value', flat=True)), ["XL", "red"])
+        self.assertEqual(sorted(Product.objects.get(pk=1).tags.values_list('name', flat=True)), ["fresh", "imported"])
+        self.assertEqual(Product.objects.get(pk=1).price, Decimal("999.90"))
+        self.assertTrue(ProductSearchDocument.objects.filter(product_id=400).exists())
+        self.assertEqual(Product.objects.create(title="next").pk, 402)
+
+        rows.seek(0)
+        again = import_catalog(rows, 'csv')
+        self.assertEqual((again.stats["created"], again.stats["updated"], again.stats["links"]), (0, 0, 0))
+
+    def test_import_command_reads_ndjson(self):
+        path = default_storage.path('import_test.ndjson')
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(json.dumps({"id": 2, "count": 7, "tags": ["imported"]}) + "\n")
+        out = StringIO()
+        call_command('import_catalog', path, stdout=out, stderr=StringIO())
+        default_storage.delete('import_test.ndjson')
+        self.assertIn("rows/s", out.getvalue())
+        product = Product.objects.get(pk=2)
+        self.assertEqual(product.count, 7)
+        self.assertEqual(list(product.tags.values_list('name', flat=True)), ["imported"])
+
+    def test_import_skips_invalid_ndjson_lines(self):
+        rows = StringIO(
+            json.dumps({"id": 2, "count": 7}) + "\n"
+            "\n"
+            "{\"id\": 3, \"count\": \n"
+            + json.dumps({"id": 5, "count": 1}) + "\n"
+        )
+        importer = import_catalog(rows, 'ndjson')
+        self.assertEqual(importer.stats["rows"], 2)
+        self.assertEqual(importer.stats["skipped"], 1)
+        self.assertEqual(len(importer.errors), 1)
+        self.assertIn("invalid JSON on line 3", importer.errors[0])
+        self.assertEqual((Product.objects.get(pk=2).count, Product.objects.get(pk=5).count), (7, 1))
+
+    def test_import_command_reports_failed_batch(self):
+        path = default_storage.path('import_test.csv')
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write("id,title,count\n2,,7\n3,,8\n410,new product,1\n411,other product,1\n")
+        failure = DatabaseError("disk I/O error")
+        with mock.patch.object(Product.objects, 'bulk_create', side_effect=failure):
+            with self.assertRaisesMessage(
+                CommandError, "rows 3-4: disk I/O error; 2 rows from earlier batches were imported"
+            ):
+                call_command('import_catalog', path, '--batch-size', '2', stdout=StringIO(), stderr=StringIO())
+        default_storage.delete('import_test.csv')
+        self.assertEqual((Product.objects.get(pk=2).count, Product.objects.get(pk=3).count), (7, 8))
+        self.assertFalse(Product.objects.filter(pk__in=[410, 411]).exists())
+
 
 class ProductsLimitedViewTestCase(APITestCase):
     fixtures = [
@@ -115,6 +467,22 @@ class SalesViewTestCase(APITestCase):
         self.assertEqual(set(response.json().keys()), set(expected_keys))
         self.assertEqual(response.json().get('currentPage'), int(data.get('currentPage')))
 
+    def test_only_active_sales_with_database_price(self):
+        now = timezone.now()
+        SaleDate.objects.create(product_id=8, discount=95, date_from=now - timedelta(days=1), date_to=now + timedelta(days=1))
+        SaleDate.objects.create(product_id=6, discount=99, date_from=now - timedelta(days=9), date_to=now - timedelta(days=1))
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('mycatalog:sales'), data={'currentPage': '1'})
+        items = response.json()['items']
+        self.assertEqual([item['id'] for item in items], [8])
+        self.assertEqual(items[0]['salePrice'], 100.0)
+
+        by_price = DataFilter(QueryDict('sort=price')).apply_filters_to_products(Product.objects.all())
+        self.assertEqual([product.pk for product in by_price][:2], [8, 3])
+        self.assertEqual(by_price[0].effective_price, Decimal('100.00'))
+        in_range = DataFilter(QueryDict('filter[minPrice]=50&filter[maxPrice]=120'))
+        self.assertEqual([product.pk for product in in_range.apply_filters_to_products(Product.objects.all())], [8])
+
 
 class ProductsPopularTestCase(APITestCase):
     fixtures = [
@@ -132,6 +500,49 @@ class ProductsPopularTestCase(APITestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.json()), 4)
 
+    def test_leaderboards_follow_changes(self):
+        call_command('rebuild_leaderboards', stdout=StringIO())
+        response = self.client.get(reverse('mycatalog:popular'))
+        self.assertEqual([item["id"] for item in response.json()], [2, 6, 5, 8])
+        response = self.client.get(reverse('mycatalog:limited'))
+        self.assertEqual([item["id"] for item in response.json()], [1, 2, 5, 7])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.get(pk=7)
+            product.count = 1
+            product.rating = 9
+            product.save()
+            product = Product.objects.get(pk=1)
+            product.count = 0
+            product.save()
+        response = self.client.get(reverse('mycatalog:popular'))
+        self.assertEqual([item["id"] for item in response.json()], [7, 2, 6, 5])
+        response = self.client.get(reverse('mycatalog:limited'))
+        self.assertEqual([item["id"] for item in response.json()], [7, 2, 5, 8])
+
+    def test_rolled_back_save_does_not_reach_leaderboards(self):
+        rebuild_leaderboards()
+        limited = top_product_ids("limited", 4)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    product = Product.objects.get(pk=7)
+                    product.count = 1
+                    product.save()
+                    raise DatabaseError
+            except DatabaseError:
+                pass
+        self.assertEqual(callbacks, [])
+        self.assertEqual(top_product_ids("limited", 4), limited)
+
+    def test_redis_leaderboard_ties_ordered_by_id(self):
+        leaderboard = RedisLeaderboard(get_redis(), "test", reverse=True)
+        self.addCleanup(get_redis().delete, leaderboard.key, leaderboard.ready_key)
+        leaderboard.rebuild([(10, 1.0), (9, 1.0), (100, 2.0), (11, 1.0), (3, 0.5)])
+        self.assertEqual(leaderboard.top(3), [100, 9, 10])
+        leaderboard.put(2, 1.0)
+        leaderboard.discard(100)
+        self.assertEqual(leaderboard.top(10), [2, 9, 10, 11, 3])
 
 
 class BannersTestCase(APITestCase):
@@ -150,6 +561,192 @@ class BannersTestCase(APITestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.json()), 4)
 
+    def test_banner_pool_follows_stock(self):
+        call_command('rebuild_banner_pool', stdout=StringIO())
+        product = Product.objects.get(pk=1)
+        product.count = 0
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        self.assertEqual(set(sample_banner_ids(10)), {2, 5, 7, 8})
+        self.assertEqual(set(sample_banner_ids(10, "rating")), {2, 5, 7, 8})
+        product.count = 3
+        with self.captureOnCommitCallbacks(execute=True):
+            product.save()
+        self.assertIn(1, sample_banner_ids(10))
+
+
+class ProductSerializerQueriesTestCase(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='reviewer', password='reviewer_password')
+        self.tags = [Tag.objects.create(name=f"tag{i}") for i in range(3)]
+        for i in range(10):
+            product = Product.objects.create(title=f"product {i}", price=100 + i, count=i)
+            product.tags.set(self.tags[:i % 3 + 1])
+            ProductImage.objects.create(image=f"products_images/product_{i}.jpg", images_product=product)
+            ProductImage.objects.create(image=f"products_images/product_{i}_2.jpg", images_product=product)
+            Review.objects.create(author=self.user, product=product, text="text", rate=i % 5 + 1)
+        rebuild_review_stats()
+
+    def count_queries(self, size):
+        queryset = ProductSerializer.setup_eager_loading(Product.objects.order_by('pk'))[:size]
+        with CaptureQueriesContext(connection) as context:
+            data = ProductSerializer(instance=queryset, many=True).data
+        self.assertEqual(len(data), size)
+        return len(context.captured_queries), data
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        small_page_queries, _ = self.count_queries(2)
+        large_page_queries, data = self.count_queries(10)
+        self.assertEqual(small_page_queries, large_page_queries)
+        self.assertEqual(data[0]["reviews"], 1)
+        self.assertEqual(len(data[2]["images"]), 2)
+        self.assertEqual([tag["id"] for tag in data[2]["tags"]], [tag.id for tag in self.tags])
+
+    def test_fast_renderer_matches_serializer(self):
+        Product.objects.create(title="Ёлка «люкс»", price=Decimal("10.5"), description=None, count=0)
+        products = ProductSerializer.setup_eager_loading(Product.objects.order_by('pk'))
+        expected = JSONRenderer().render({"items": ProductSerializer(products, many=True).data, "lastPage": 1})
+        rendered = FastJSONRenderer().render({"items": product_cards(products), "lastPage": 1})
+        self.assertEqual(rendered, expected)
+
+    def test_bench_command(self):
+        out = StringIO()
+        call_command('bench_product_cards', rows=20, repeat=1, stdout=out)
+        self.assertIn('rows/s', out.getvalue())
+
+
+class ImageVariantsTestCase(APITestCase):
+
+    def setUp(self):
+        buffer = BytesIO()
+        PILImage.new('RGB', (800, 600), 'red').save(buffer, 'PNG')
+        self.product = Product.objects.create(title="product", price=100, count=1)
+        with mock.patch.object(build_image_variants, 'delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.product_image = ProductImage.objects.create(
+                    image=SimpleUploadedFile('photo.png', buffer.getvalue(), content_type='image/png'),
+                    images_product=self.product,
+                )
+        delay.assert_called_once_with('product', self.product_image.pk)
+
+    def test_variants_in_srcset(self):
+        build_image_variants('product', self.product_image.pk)
+        variants = list(self.product_image.variants.all())
+        self.assertEqual([(variant.width, variant.height) for variant in variants], [(160, 120), (320, 240), (640, 480)])
+        self.assertTrue(all(default_storage.exists(variant.image.name) for variant in variants))
+
+        products = ProductSerializer.setup_eager_loading(Product.objects.filter(pk=self.product.pk))
+        srcset = ProductSerializer(products, many=True).data[0]["images"][0]["srcset"]
+        self.assertEqual([item["width"] for item in srcset], [160, 320, 640])
+        self.assertTrue(srcset[0]["src"].endswith('.webp'))
+        self.assertEqual(
+            FastJSONRenderer().render(product_cards(products)),
+            JSONRenderer().render(ProductSerializer(products, many=True).data),
+        )
+
+        self.product_image.delete()
+        self.assertFalse(any(default_storage.exists(variant.image.name) for variant in variants))
+
+
+class ReviewStatsTestCase(APITestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='reviewer', password='reviewer_password')
+        self.product = Product.objects.create(title="product", price=100, count=1)
+        self.other_product = Product.objects.create(title="other product", price=100, count=1)
+        cache.delete(REVIEW_STATS_LOCK_KEY)
+        pop_dirty_review_stats(count=10000)
+
+    def reconcile(self, changes):
+        # изменения применяются после коммита одной отложенной задачей, здесь она выполняется сразу
+        with mock.patch.object(reconcile_dirty_review_stats, 'apply_async') as apply_async:
+            with self.captureOnCommitCallbacks(execute=True):
+                changes()
+        reconcile_dirty_review_stats()
+        self.product.refresh_from_db()
+        self.other_product.refresh_from_db()
+        return apply_async.call_count
+
+    def test_stats_follow_review_changes(self):
+        reviews = []
+        scheduled = self.reconcile(lambda: reviews.extend([
+            Review.objects.create(author=self.user, product=self.product, text="text", rate=5),
+            Review.objects.create(author=self.user, product=self.product, text="text", rate=2),
+        ]))
+        first, second = reviews
+        self.assertEqual(scheduled, 1)
+        self.assertEqual((self.product.reviews_count, self.product.rating_sum, self.product.rating), (2, 7, 3.5))
+        self.assertEqual(self.product.rating_histogram, {1: 0, 2: 1, 3: 0, 4: 0, 5: 1})
+
+        def move_reviews():
+            second.rate = 4
+            second.save()
+            first.product = self.other_product
+            first.save()
+
+        self.reconcile(move_reviews)
+        self.assertEqual((self.product.reviews_count, self.product.rating, self.product.rating_4), (1, 4.0, 1))
+        self.assertEqual((self.other_product.reviews_count, self.other_product.rating_5), (1, 1))
+
+        self.reconcile(second.delete)
+        self.assertEqual((self.product.reviews_count, self.product.rating_sum, self.product.rating), (0, 0, 0))
+        self.assertEqual(pop_dirty_review_stats(), [])
+
+    def test_failed_reconcile_keeps_products_dirty(self):
+        mark_review_stats_dirty([self.product.pk, self.other_product.pk])
+        with mock.patch('mycatalog.tasks.reconcile_review_stats', side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                reconcile_dirty_review_stats()
+        self.assertEqual(sorted(pop_dirty_review_stats()), [self.product.pk, self.other_product.pk])
+
+    def test_reconcile_updates_popular_leaderboard(self):
+        rebuild_leaderboards()
+        self.reconcile(lambda: Review.objects.create(author=self.user, product=self.other_product, text="text", rate=5))
+        self.assertEqual(top_product_ids("popular", 1), [self.other_product.pk])
+
+    def test_rebuild_command(self):
+        Review.objects.create(author=self.user, product=self.product, text="text", rate=3)
+        Product.objects.update(reviews_count=0, rating_sum=0, rating=0, rating_3=0)
+        call_command('rebuild_review_stats', stdout=StringIO())
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.reviews_count, self.product.rating, self.product.rating_3), (1, 3.0, 1))
+
+
+class ProductSearchTestCase(APITestCase):
+
+    def setUp(self):
+        self.red_tag = Tag.objects.create(name="crimson")
+        self.truck = Product.objects.create(title="Heavy truck", price=100, description="diesel engine")
+        self.pickup = Product.objects.create(title="Pickup", price=100, description="light truck for a farm")
+        self.coupe = Product.objects.create(title="Coupe", price=100, description="sport car")
+        self.coupe.tags.add(self.red_tag)
+        self.coupe.specifications.create(name="engine", value="turbocharged")
+
+    def search(self, text):
+        data_filter = DataFilter(QueryDict(f"filter[name]={text}"))
+        return list(data_filter.apply_filters_to_products(Product.objects.all()))
+
+    def test_ranked_prefix_search(self):
+        self.assertEqual(self.search("truc"), [self.truck, self.pickup])
+        self.assertEqual(self.search("crims"), [self.coupe])
+        self.assertEqual(self.search("turbo engine"), [self.coupe])
+        self.assertEqual(self.search("truck farm"), [self.pickup])
+
+    def test_index_follows_changes(self):
+        self.red_tag.name = "scarlet"
+        self.red_tag.save()
+        self.assertEqual(self.search("crimson"), [])
+        self.assertEqual(self.search("scarlet"), [self.coupe])
+        self.coupe.tags.clear()
+        self.assertEqual(self.search("scarlet"), [])
+        self.pickup.title = "Roadster"
+        self.pickup.description = ""
+        self.pickup.save()
+        self.assertEqual(self.search("truck"), [self.truck])
+        self.truck.delete()
+        self.assertEqual(self.search("truck"), [])
+
 
 class ProductViewTestCase(APITestCase):
 
@@ -170,6 +767,87 @@ class ProductViewTestCase(APITestCase):
         response = self.client.get(url, data=data)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_product_detail_cache(self):
+        first_url = reverse('mycatalog:product', args=[1])
+        self.assertEqual(self.client.get(first_url).json()["id"], 1)
+        self.assertEqual(self.client.get(reverse('mycatalog:product', args=[2])).json()["id"], 2)
+        self.assertEqual(self.client.get(reverse('mycatalog:product', args=[100])).status_code, 404)
+        with self.assertNumQueries(0):
+            self.client.get(first_url)
+
+        with mock.patch.object(reconcile_dirty_review_stats, 'apply_async'):
+            with self.captureOnCommitCallbacks(execute=True):
+                Review.objects.create(author=User.objects.first(), product_id=1, text="fresh review", rate=5)
+                # документ удаляется из кеша только после фиксации транзакции
+                with self.assertNumQueries(0):
+                    self.client.get(first_url)
+        reviews = self.client.get(first_url).json()["reviews"]
+        self.assertIn("fresh review", [review["text"] for review in reviews])
+
+    def test_product_conditional_get(self):
+        url = reverse('mycatalog:product', args=[1])
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(self.client.get(reverse('mycatalog:banners'), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        with mock.patch.object(reconcile_dirty_review_stats, 'apply_async'):
+            with self.captureOnCommitCallbacks(execute=True):
+                Review.objects.create(author=User.objects.first(), product_id=1, text="fresh review", rate=5)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+        banners_etag = self.client.get(reverse('mycatalog:banners'))['ETag']
+        response = self.client.get(reverse('mycatalog:banners'), HTTP_IF_NONE_MATCH=banners_etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_product_conditional_get_does_not_store_unknown_ids(self):
+        cache.delete(PRODUCT_MODIFIED_KEY.format(product_id=100))
+        self.assertEqual(self.client.get(reverse('mycatalog:product', args=[100])).status_code, 404)
+        self.assertIsNone(cache.get(PRODUCT_MODIFIED_KEY.format(product_id=100)))
+
+        cache.delete_many([product_detail_key(1), PRODUCT_MODIFIED_KEY.format(product_id=1)])
+        etag = self.client.get(reverse('mycatalog:product', args=[1]))['ETag']
+        self.assertGreater(cache.ttl(PRODUCT_MODIFIED_KEY.format(product_id=1)) or 0, 0)
+        response = self.client.get(reverse('mycatalog:product', args=[1]), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_product_details_batch(self):
+        with CaptureQueriesContext(connection) as single:
+            invalidate_product_details([1])
+            get_product_details([1])
+        invalidate_product_details([1, 2, 3])
+        with CaptureQueriesContext(connection) as batch:
+            details = get_product_details([1, 2, 3, 100])
+        self.assertEqual(sorted(details), [1, 2, 3])
+        self.assertEqual(len(single.captured_queries), len(batch.captured_queries))
+
+    def test_product_embeds_latest_reviews_and_stats(self):
+        # фикстуры загружаются без сигналов, агрегаты отзывов пересчитываются отдельно
+        rebuild_review_stats([3])
+        invalidate_product_details([3])
+        data = self.client.get(reverse('mycatalog:product', args=[3])).json()
+        latest = Review.objects.filter(product_id=3).order_by('-date', '-id')[:PRODUCT_DETAIL_REVIEWS]
+        self.assertEqual([review["id"] for review in data["reviews"]], [review.pk for review in latest])
+        self.assertEqual(data["reviewsCount"], Review.objects.filter(product_id=3).count())
+        self.assertEqual(sum(data["ratingHistogram"].values()), data["reviewsCount"])
+
+    def test_reviews_cursor_pages(self):
+        url = reverse('mycatalog:reviews', args=[3])
+        for params, ordering in [({}, ('-date', '-id')), ({"sort": "rating", "sortType": "inc"}, ('rate', 'id'))]:
+            with self.subTest(params=params):
+                expected = list(Review.objects.filter(product_id=3).order_by(*ordering).values_list('pk', flat=True))
+                seen, cursor = [], None
+                while True:
+                    page_params = dict(params, limit=4, **({"cursor": cursor} if cursor else {}))
+                    with self.assertNumQueries(1):
+                        page = self.client.get(url, page_params).json()
+                    seen.extend(review["id"] for review in page["items"])
+                    cursor = page["nextCursor"]
+                    if not cursor:
+                        break
+                self.assertEqual(seen, expected)
+        self.assertEqual(self.client.get(reverse('mycatalog:reviews', args=[100])).status_code, 404)
+        self.assertEqual(self.client.get(url, {"cursor": "broken"}).status_code, 404)
+
 
 # class ReviewViewTestCase(APITestCase):
 #     # при использовании данного теста необходимо
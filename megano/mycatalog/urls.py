@@ -3,6 +3,7 @@ from django.urls import path
 from .views import (
     CategoriesView,
     CatalogView,
+    CatalogExportView,
     ProductsPopularView,
     ProductsLimitedView,
     SalesView,
@@ -17,6 +18,7 @@ app_name = "mycatalog"
 urlpatterns = [
     path("categories", CategoriesView.as_view(), name='categories'),
     path("catalog", CatalogView.as_view(), name='catalog'),
+    path("catalog/export", CatalogExportView.as_view(), name='catalog_export'),
     path("products/popular", ProductsPopularView.as_view(), name='popular'),
     path("products/limited", ProductsLimitedView.as_view(), name='limited'),
     path("sales", SalesView.as_view(), name='sales'),
@@ -1,24 +1,50 @@
-import random
 from django.core.cache import cache
+from django.http import StreamingHttpResponse
+from django.utils.decorators import method_decorator
 from typing import Any, List, Dict
 from drf_spectacular.openapi import OpenApiTypes, OpenApiParameter
 from drf_spectacular.utils import extend_schema_view, extend_schema, OpenApiParameter
-from .tasks import count_rating, test_task
 from rest_framework import status
 from rest_framework.views import APIView
 from rest_framework.request import Request
 from rest_framework.response import Response
-from django.db.models.functions import Coalesce
-from django.db.models import DecimalField, IntegerField
-from rest_framework.permissions import IsAuthenticated
-from .models import Categories, Product, Tag
-from .services import CatalogPaginator, DataFilter
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
+from .models import Categories, Product, Review, Tag
+from megano.cache import namespace_get, namespace_set
+from .cache import (
+    CATALOG_NAMESPACE,
+    CATALOG_PAGE_TIMEOUT,
+    CATEGORIES_NAMESPACE,
+    TAGS_NAMESPACE,
+    catalog_filter_spec,
+    catalog_page_key,
+    count_catalog_cache,
+)
+from .facets import catalog_facets
+from .stores import current_banner_ids, get_banner_pool
+from .renderers import FastJSONRenderer, product_cards
+from .export import EXPORT_CONTENT_TYPES, EXPORT_STREAMS
+from .conditional import banners_condition, namespace_condition, product_condition
+from .services import (
+    CatalogPaginator,
+    CatalogCursorPaginator,
+    DataFilter,
+    ReviewCursorPaginator,
+    active_sale_q,
+    get_category_tree,
+    get_product_details,
+    sale_price_expression,
+    seconds_to_next_sale_change,
+    top_products,
+)
 from .for_swagger import Product_ID_sw, CatalogSw, QuerySerializerFilter, ProductSw, Sales_Sw
 from .serializers import (
     CategoriesSerializer,
     ProductSerializer,
     SaleProductSerializer,
-    ProductIDSerializer,
+    ReviewListSerializer,
     ReviewSerializer,
     TagsSerializer,
 )
@@ -34,20 +60,19 @@ from .serializers import (
             },
         ),
 )
+@method_decorator(namespace_condition(CATEGORIES_NAMESPACE), name='get')
 class CategoriesView(APIView):
 
     """Вью для отображения категорий"""
 
     def get(self, request):
-        categories_cache_name = 'categories_cache'
-        categories_cache = cache.get(categories_cache_name)
-        if categories_cache:
-            categories = categories_cache
-        else:
-            categories = Categories.objects.filter(parent_category=None)
-            cache.set(categories_cache_name, categories, 20)
-        serializer = CategoriesSerializer(instance=categories, many=True)
-        return Response(data=serializer.data, status=status.HTTP_200_OK)
+        serialized_data = namespace_get(CATEGORIES_NAMESPACE)
+        if serialized_data is None:
+            categories, children = get_category_tree()
+            serializer = CategoriesSerializer(instance=categories, many=True, context={"children": children})
+            serialized_data = serializer.data
+            namespace_set(CATEGORIES_NAMESPACE, serialized_data)
+        return Response(data=serialized_data, status=status.HTTP_200_OK)
 
 
 @extend_schema(tags=["mycatalog APP"])
@@ -62,10 +87,23 @@ class CategoriesView(APIView):
             OpenApiParameter("filter", QuerySerializerFilter),
             OpenApiParameter("currentPage", OpenApiTypes.UUID, OpenApiParameter.QUERY),
             OpenApiParameter("category", OpenApiTypes.UUID, OpenApiParameter.QUERY),
+            OpenApiParameter(
+                "subcategories",
+                OpenApiTypes.BOOL,
+                OpenApiParameter.QUERY,
+                description="включать товары подкатегорий, по умолчанию true",
+            ),
             OpenApiParameter("sort", OpenApiTypes.UUID, OpenApiParameter.QUERY),
             OpenApiParameter("sortType", OpenApiTypes.UUID, OpenApiParameter.QUERY),
             OpenApiParameter("tags", OpenApiTypes.UUID, OpenApiParameter.QUERY),
             OpenApiParameter("limit", OpenApiTypes.UUID, OpenApiParameter.QUERY),
+            OpenApiParameter(
+                "cursor",
+                OpenApiTypes.STR,
+                OpenApiParameter.QUERY,
+                description="курсорная пагинация: пустое значение для первой страницы, "
+                            "далее значение nextCursor из ответа",
+            ),
 
         ],
 
@@ -75,21 +113,31 @@ class CatalogView(APIView):
 
     """Вью для отображения каталога и фильтрации продуктов"""
 
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
     def get(self, request: Request) -> Response:
-        catalog_cache_name = 'catalog_cache'
-        catalog_cache = cache.get(catalog_cache_name)
-        if catalog_cache:
-            queryset = catalog_cache
-        else:
-            queryset = Product.objects.all()
-            cache.set(catalog_cache_name, queryset, 20)
         data_filter_object = DataFilter(self.request.query_params)
-        filtered_products = data_filter_object.apply_filters_to_products(queryset)
         query = data_filter_object.filtered_dict
-        paginator = CatalogPaginator()
+        page_cache_name = catalog_page_key(catalog_filter_spec(query))
+        page_cache = cache.get(page_cache_name)
+        count_catalog_cache(hit=page_cache is not None)
+        if page_cache is not None:
+            response = Response(data=page_cache, status=status.HTTP_200_OK)
+            response['X-Cache'] = 'HIT'
+            return response
+        queryset = Product.objects.all()
+        filtered_products = data_filter_object.apply_filters_to_products(queryset)
+        filtered_products = ProductSerializer.setup_eager_loading(filtered_products)
+        if 'cursor' in query:
+            paginator = CatalogCursorPaginator()
+        else:
+            paginator = CatalogPaginator()
         result_page = paginator.paginate_queryset(filtered_products, request, query)
-        serializer = ProductSerializer(result_page, many=True)
-        return paginator.get_paginated_response(serializer.data)
+        response = paginator.get_paginated_response(product_cards(result_page))
+        response.data["facets"] = catalog_facets(query, data_filter_object.search_and_price_ids())
+        cache.set(page_cache_name, response.data, seconds_to_next_sale_change(CATALOG_PAGE_TIMEOUT))
+        response['X-Cache'] = 'MISS'
+        return response
 
 
 @extend_schema(tags=["mycatalog APP"])
@@ -103,24 +151,16 @@ class CatalogView(APIView):
             },
         ),
 )
+@method_decorator(namespace_condition(CATALOG_NAMESPACE), name='get')
 class ProductsPopularView(APIView):
 
     """Вью для отображения популярных продуктов"""
 
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
     def get(self, request):
-        products_cache_name = 'catalog_cache'
-        product_popular_cache = cache.get(products_cache_name)
-        if product_popular_cache:
-            product = product_popular_cache
-        else:
-            product = Product.objects.all()
-            cache.set(products_cache_name, product, 20)
-        product = product.annotate(
-            rating_coalesced=Coalesce('rating', -1, output_field=DecimalField())
-        ).order_by('-rating_coalesced')
-        product = product[:4]
-        serializer = ProductSerializer(instance=product, many=True)
-        return Response(data=serializer.data, status=status.HTTP_200_OK)
+        product = top_products('popular', 4)
+        return Response(data=product_cards(product), status=status.HTTP_200_OK)
 
 
 @extend_schema(tags=["mycatalog APP"])
@@ -138,20 +178,11 @@ class ProductsLimitedView(APIView):
 
     """Вью для отображения лимитированных продуктов"""
 
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
     def get(self, request) -> Response:
-        products_limited_name = 'product_limited_cache'
-        product_limited_cache = cache.get(products_limited_name)
-        if product_limited_cache:
-            product = product_limited_cache
-        else:
-            product = Product.objects.exclude(count__isnull=True).exclude(count=0)
-            cache.set(products_limited_name, product, 20)
-        product = product.annotate(
-            product_count_coalesced=Coalesce('count', -1, output_field=IntegerField())
-        ).order_by('product_count_coalesced')
-        product = product[:4]
-        serializer = ProductSerializer(instance=product, many=True)
-        return Response(data=serializer.data, status=status.HTTP_200_OK)
+        product = top_products('limited', 4)
+        return Response(data=product_cards(product), status=status.HTTP_200_OK)
 
 
 @extend_schema(tags=["mycatalog APP"])
@@ -170,7 +201,9 @@ class SalesView(APIView):
     """Вью для отображения скидок на продукты"""
 
     def get(self, request: Request) -> Response:
-        product = Product.objects.exclude(sale__isnull=True)
+        product = Product.objects.filter(active_sale_q()).select_related('sale').annotate(
+            sale_price=sale_price_expression()
+        ).prefetch_related('images__variants').order_by('pk')
         paginator = CatalogPaginator()
         current_page = {
             "currentPage": int(self.request.query_params.get("currentPage"))
@@ -193,22 +226,22 @@ class SalesView(APIView):
             },
         ),
 )
+@method_decorator(banners_condition, name='get')
 class BannersView(APIView):
 
     """Вью для отображения банеров продуктов"""
 
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+
     def get(self, request: Request) -> Response:
-        all_ids = Product.objects.filter(count__gt=0).values_list('pk', flat=True)
-        random_ids = random.sample(list(all_ids), 4)
-        random_inst_cach_name = 'random_inst_cach_name'
-        random_inst_cach = cache.get(random_inst_cach_name)
-        if random_inst_cach:
-            random_instances = random_inst_cach
-        else:
-            random_instances = Product.objects.filter(pk__in=random_ids)
-            cache.set(random_inst_cach_name, random_instances, 3)
-        serializer = ProductSerializer(instance=random_instances, many=True)
-        serialized_data: List[Dict[str, Any]] = serializer.data
+        random_ids = current_banner_ids()
+        random_instances = ProductSerializer.setup_eager_loading(
+            Product.objects.filter(pk__in=random_ids)
+        )
+        serialized_data: List[Dict[str, Any]] = product_cards(random_instances)
+        missing_ids = set(random_ids) - {item["id"] for item in serialized_data}
+        for product_id in missing_ids:
+            get_banner_pool().discard(product_id)
         return Response(data=serialized_data, status=status.HTTP_200_OK)
 
 
@@ -223,24 +256,45 @@ class BannersView(APIView):
             },
         ),
 )
+@method_decorator(product_condition, name='get')
 class ProductView(APIView):
 
     """Вью для отображения детальной информации о продуктах"""
 
     def get(self, request: Request, **kwargs: Any) -> Response:
-        product_cache_id_name = 'product_cache_id'
-        product_cache_id = cache.get(product_cache_id_name)
-        if product_cache_id:
-            product = product_cache_id
-        else:
-            product = Product.objects.get(id=self.kwargs.get("id"))
-            cache.set(product_cache_id_name, product, 3)
-        serializer = ProductIDSerializer(instance=product)
-        return Response(data=serializer.data, status=status.HTTP_200_OK)
+        product_id = self.kwargs.get("id")
+        product_data = get_product_details([product_id]).get(product_id)
+        if product_data is None:
+            raise NotFound()
+        return Response(data=product_data, status=status.HTTP_200_OK)
 
 
 @extend_schema(tags=["mycatalog APP"])
 @extend_schema_view(
+    get=extend_schema(
+        summary="Метод для отображения отзывов о продукте",
+        description="""Метод для отображения отзывов о продукте с курсорной пагинацией,
+                       по умолчанию сначала новые""",
+        responses={
+                status.HTTP_200_OK: ReviewListSerializer(many=True),
+            },
+        parameters=[
+            OpenApiParameter(
+                "sort",
+                OpenApiTypes.STR,
+                OpenApiParameter.QUERY,
+                description="date (по умолчанию) или rating",
+            ),
+            OpenApiParameter("sortType", OpenApiTypes.STR, OpenApiParameter.QUERY, description="dec или inc"),
+            OpenApiParameter("limit", OpenApiTypes.INT, OpenApiParameter.QUERY),
+            OpenApiParameter(
+                "cursor",
+                OpenApiTypes.STR,
+                OpenApiParameter.QUERY,
+                description="значение nextCursor из предыдущего ответа",
+            ),
+        ],
+    ),
     post=extend_schema(
         summary="Метод для написания отзыва",
         description="""Метод для написания отзыва.
@@ -254,11 +308,21 @@ class ProductView(APIView):
 )
 class ReviewView(APIView):
 
-    """Вью для написания отзыва.
+    """Вью для отзывов о продукте.
+    Список отзывов доступен всем, авторы и их профили загружаются одним запросом с отзывами.
     Только авторизованный пользователь может оставить отзыв,
     также проверяется правильность ввода почты и имени пользователя"""
 
-    permission_classes = [IsAuthenticated]
+    permission_classes = [IsAuthenticatedOrReadOnly]
+
+    def get(self, request: Request, *args: Any, **kwargs: Any) -> Response:
+        query = DataFilter(request.query_params).filtered_dict
+        reviews = ReviewListSerializer.setup_eager_loading(Review.objects.filter(product_id=kwargs.get("id")))
+        paginator = ReviewCursorPaginator()
+        result_page = paginator.paginate_queryset(reviews, request, query)
+        if not result_page and not Product.objects.filter(pk=kwargs.get("id")).exists():
+            raise NotFound()
+        return paginator.get_paginated_response(ReviewListSerializer(result_page, many=True).data)
 
     def post(self, request: Request, *args: Any, **kwargs: Any) -> Response:
         data = request.data
@@ -271,12 +335,9 @@ class ReviewView(APIView):
             return Response({'error': 'Email does not match.'}, status=status.HTTP_400_BAD_REQUEST)
         data['author'] = user.pk
         data['product'] = kwargs.get("id")
-        product_id = data['product']
         serializer = ReviewSerializer(data=data, context={"request": request})
         if serializer.is_valid():
             serializer.save()
-            count_rating.delay(product_id)
-            # test_task.delay(product_id)
             return Response({'message': 'Review posted successfully.'}, status=status.HTTP_201_CREATED)
         else:
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -292,17 +353,47 @@ class ReviewView(APIView):
             },
         ),
 )
+@method_decorator(namespace_condition(TAGS_NAMESPACE), name='get')
 class TagsView(APIView):
 
     """Вью для отображения тэгов"""
 
     def get(self, request: Request, **kwargs: Any) -> Response:
-        tags_cache_name = 'tags_cache'
-        tags_cache = cache.get(tags_cache_name)
-        if tags_cache:
-            tags = tags_cache
-        else:
-            tags = Tag.objects.all()
-            cache.set(tags_cache_name, tags, 3)
-        serializer = TagsSerializer(instance=tags, many=True)
-        return Response(data=serializer.data, status=status.HTTP_200_OK)
\ No newline at end of file
+        serialized_data = namespace_get(TAGS_NAMESPACE)
+        if serialized_data is None:
+            serialized_data = TagsSerializer(instance=Tag.objects.all(), many=True).data
+            namespace_set(TAGS_NAMESPACE, serialized_data)
+        return Response(data=serialized_data, status=status.HTTP_200_OK)
+
+
+@extend_schema(tags=["mycatalog APP"])
+@extend_schema_view(
+    get=extend_schema(
+        summary="Метод для выгрузки всего каталога",
+        description="""Метод для выгрузки всех товаров каталога с тегами, категорией, ценой,
+                       действующей скидкой и остатком. Ответ отдается потоком в формате
+                       NDJSON (по товару на строку) или CSV. Только для авторизованных пользователей""",
+        parameters=[
+            OpenApiParameter(
+                name="type",
+                description="Формат выгрузки: ndjson (по умолчанию) или csv",
+                required=False,
+                type=str,
+            ),
+        ],
+        responses={status.HTTP_200_OK: OpenApiTypes.BINARY},
+    ),
+)
+class CatalogExportView(APIView):
+
+    """Вью для потоковой выгрузки каталога"""
+
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request: Request) -> StreamingHttpResponse:
+        export_type = request.query_params.get("type", "ndjson")
+        if export_type not in EXPORT_STREAMS:
+            raise ValidationError({"type": f"Expected one of: {', '.join(EXPORT_STREAMS)}"})
+        response = StreamingHttpResponse(EXPORT_STREAMS[export_type](), content_type=EXPORT_CONTENT_TYPES[export_type])
+        response["Content-Disposition"] = f'attachment; filename="catalog.{export_type}"'
+        return response
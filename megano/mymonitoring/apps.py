@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class MymonitoringConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'mymonitoring'
+
+    def ready(self):
+        from . import instrumentation
+        instrumentation.install()
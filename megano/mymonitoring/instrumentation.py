@@ -0,0 +1,99 @@
+import time
+from functools import wraps
+from typing import Any, Callable
+from celery.signals import after_task_publish, before_task_publish, task_prerun
+from rest_framework.serializers import BaseSerializer
+from .metrics import CELERY_PUBLISH_LATENCY, CELERY_QUEUE_WAIT
+from .timing import current_timings
+
+
+ENQUEUED_AT_HEADER = "enqueued_at"
+
+
+def sql_timer(execute: Callable, sql: str, params: Any, many: bool, context: Any) -> Any:
+
+    """обертка connection.execute_wrapper, считает запросы и их время"""
+
+    timings = current_timings()
+    if timings is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.sql_count += 1
+        timings.sql_time += time.perf_counter() - started
+
+
+def query_counter(counter: list) -> Callable:
+
+    """функция возвращает обертку execute_wrapper, которая только считает запросы в counter[0]"""
+
+    def wrapper(execute: Callable, sql: str, params: Any, many: bool, context: Any) -> Any:
+        counter[0] += 1
+        return execute(sql, params, many, context)
+
+    return wrapper
+
+
+def timed_serializer_data(data: property) -> property:
+
+    """
+    функция оборачивает свойство data сериалайзеров DRF,
+    вложенные вызовы (ListSerializer внутри Serializer) считаются один раз
+    """
+
+    @wraps(data.fget)
+    def getter(serializer: BaseSerializer) -> Any:
+        timings = current_timings()
+        if timings is None:
+            return data.fget(serializer)
+        timings.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return data.fget(serializer)
+        finally:
+            timings.serializer_depth -= 1
+            if not timings.serializer_depth:
+                timings.serializer_count += 1
+                timings.serializer_time += time.perf_counter() - started
+
+    return property(getter)
+
+
+def task_publish_started(sender: str = None, headers: dict = None, **kwargs: Any) -> None:
+
+    """функция ставит в заголовки задачи время отправки, по нему воркер считает ожидание в очереди"""
+
+    if headers is not None:
+        headers[ENQUEUED_AT_HEADER] = time.time()
+
+
+def task_published(sender: str = None, headers: dict = None, **kwargs: Any) -> None:
+    enqueued_at = (headers or {}).get(ENQUEUED_AT_HEADER)
+    if enqueued_at is None:
+        return
+    duration = max(time.time() - enqueued_at, 0)
+    CELERY_PUBLISH_LATENCY.labels(sender or "unknown").observe(duration)
+    timings = current_timings()
+    if timings is not None:
+        timings.celery_count += 1
+        timings.celery_time += duration
+
+
+def task_started(sender: Any = None, task: Any = None, **kwargs: Any) -> None:
+    enqueued_at = getattr(getattr(task, "request", None), ENQUEUED_AT_HEADER, None)
+    if enqueued_at is not None:
+        CELERY_QUEUE_WAIT.labels(task.name).observe(max(time.time() - enqueued_at, 0))
+
+
+def install() -> None:
+
+    """функция подключает счетчики к DRF и Celery, вызывается один раз при старте приложения"""
+
+    if not getattr(BaseSerializer.data.fget, "timed", False):
+        BaseSerializer.data = timed_serializer_data(BaseSerializer.data)
+        BaseSerializer.data.fget.timed = True
+    before_task_publish.connect(task_publish_started, dispatch_uid="mymonitoring.task_publish_started")
+    after_task_publish.connect(task_published, dispatch_uid="mymonitoring.task_published")
+    task_prerun.connect(task_started, dispatch_uid="mymonitoring.task_started")
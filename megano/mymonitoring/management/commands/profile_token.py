@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from mymonitoring.profiler import PROFILE_HEADER, profile_token
+
+
+class Command(BaseCommand):
+
+    """Команда выдает подписанный заголовок для профилирования одного запроса"""
+
+    help = "Print a signed X-Profile header value that runs requests under the sampling profiler"
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{PROFILE_HEADER}: {profile_token()}")
+        self.stderr.write(f"valid for {settings.PROFILER_TOKEN_MAX_AGE} seconds")
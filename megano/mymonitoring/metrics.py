@@ -0,0 +1,72 @@
+import os
+import re
+from typing import Iterable
+from prometheus_client import CollectorRegistry, Counter, Histogram, REGISTRY, generate_latest
+from prometheus_client import multiprocess
+
+
+MULTIPROCESS_DIR = os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+if MULTIPROCESS_DIR:
+    # в режиме нескольких процессов значения пишутся в файлы этого каталога
+    os.makedirs(MULTIPROCESS_DIR, exist_ok=True)
+
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+# служебные ключи читаются при каждом запросе и почти всегда попадают в кеш,
+# поэтому считаются отдельно от страниц и документов своего пространства имен
+SERVICE_KEY_FAMILIES = (
+    (re.compile(r'^\w+:generation$|^catalog:facets:version$'), "generation"),
+    (re.compile(r'^\w+:modified$|^product:modified:\d+$'), "validator"),
+)
+
+REQUEST_LATENCY = Histogram(
+    "megano_request_duration_seconds", "Request latency by URL name", ["view", "method"],
+)
+REQUESTS = Counter(
+    "megano_requests_total", "Requests by URL name and status", ["view", "method", "status"],
+)
+REQUEST_ERRORS = Counter(
+    "megano_request_errors_total", "Responses with 4xx and 5xx status by URL name", ["view", "status"],
+)
+REQUEST_QUERIES = Histogram(
+    "megano_request_db_queries", "SQL queries per request by URL name", ["view"], buckets=QUERY_BUCKETS,
+)
+CACHE_LOOKUPS = Counter(
+    "megano_cache_lookups_total", "Cache reads by key family and result", ["family", "result"],
+)
+CELERY_PUBLISH_LATENCY = Histogram(
+    "megano_celery_publish_seconds", "Time spent sending a task to the broker", ["task"],
+)
+CELERY_QUEUE_WAIT = Histogram(
+    "megano_celery_queue_wait_seconds", "Time between sending a task and a worker starting it", ["task"],
+)
+
+
+def cache_key_family(key: object) -> str:
+
+    """функция возвращает семейство ключа кеша: generation и validator для поколений
+    и времени изменения, для остальных ключей часть до первого ':' (catalog, product, banners...)"""
+
+    key = str(key)
+    for pattern, family in SERVICE_KEY_FAMILIES:
+        if pattern.match(key):
+            return family
+    family, separator, _ = key.partition(":")
+    return family if separator else "other"
+
+
+def count_cache_lookups(keys: Iterable[object], hit_keys: Iterable[object] = ()) -> None:
+    hit_keys = set(hit_keys)
+    for key in keys:
+        CACHE_LOOKUPS.labels(cache_key_family(key), "hit" if key in hit_keys else "miss").inc()
+
+
+def export_metrics() -> bytes:
+
+    """функция отдает метрики в текстовом формате Prometheus,
+    при PROMETHEUS_MULTIPROC_DIR суммируются значения всех процессов gunicorn"""
+
+    if MULTIPROCESS_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
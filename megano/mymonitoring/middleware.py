@@ -0,0 +1,121 @@
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack
+from typing import Callable
+from django.conf import settings
+from django.db import connections
+from django.http import HttpRequest, HttpResponse
+from .instrumentation import query_counter, sql_timer
+from .metrics import REQUEST_ERRORS, REQUEST_LATENCY, REQUEST_QUERIES, REQUESTS
+from .profiler import PROFILE_HEADER, PROFILE_QUERY_FLAG, StackSampler, save_profile, valid_profile_token
+from .timing import current_timings, start_timings, stop_timings
+
+
+logger = logging.getLogger("mymonitoring.requests")
+
+
+class ServerTimingMiddleware:
+
+    """
+    Мидлвар собирает для доли запросов SERVER_TIMING_SAMPLE_RATE число и время SQL запросов,
+    обращения к кешу, время сериалайзеров и отправки задач Celery,
+    отдает их в заголовке Server-Timing и пишет строкой JSON в лог mymonitoring.requests.
+    При нулевой доле запрос проходит без счетчиков
+    """
+
+    def __init__(self, get_response: Callable[[HttpRequest], HttpResponse]):
+        self.get_response = get_response
+        self.sample_rate = float(getattr(settings, "SERVER_TIMING_SAMPLE_RATE", 0))
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return self.get_response(request)
+        token = start_timings()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(sql_timer))
+                response = self.get_response(request)
+            timings = current_timings()
+            response["Server-Timing"] = timings.server_timing()
+            logger.info(json.dumps({
+                "method": request.method,
+                "path": request.path,
+                "view": getattr(request.resolver_match, "view_name", None),
+                "status": response.status_code,
+                **timings.as_dict(),
+            }))
+            return response
+        finally:
+            stop_timings(token)
+
+
+class ProfilerMiddleware:
+
+    """
+    Мидлвар выполняет отдельный запрос под статистическим профайлером.
+    Профилируется запрос сотрудника (is_staff) с параметром ?_profile=1
+    или любой запрос с подписанным заголовком X-Profile (manage.py profile_token).
+    Стеки сохраняются в PROFILER_OUTPUT_DIR, имя файла возвращается в заголовке X-Profile-File
+    """
+
+    def __init__(self, get_response: Callable[[HttpRequest], HttpResponse]):
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        if not self.should_profile(request):
+            return self.get_response(request)
+        sampler = StackSampler(interval=settings.PROFILER_INTERVAL).start()
+        try:
+            response = self.get_response(request)
+        finally:
+            sampler.stop()
+        view_name = getattr(request.resolver_match, "view_name", None) or request.path
+        path = save_profile(sampler, f"{request.method}-{view_name}")
+        response["X-Profile-File"] = path.name
+        logger.info(json.dumps({
+            "profile": path.name,
+            "path": request.path,
+            "samples": sampler.samples,
+            "duration_ms": round(sampler.duration * 1000, 2),
+        }))
+        return response
+
+    @staticmethod
+    def should_profile(request: HttpRequest) -> bool:
+        token = request.headers.get(PROFILE_HEADER)
+        if token:
+            return valid_profile_token(token)
+        if PROFILE_QUERY_FLAG in request.GET:
+            user = getattr(request, "user", None)
+            return bool(user is not None and user.is_staff)
+        return False
+
+
+class MetricsMiddleware:
+
+    """
+    Мидлвар пишет в метрики Prometheus время, статус и число SQL запросов каждого запроса,
+    метки - имя URL (view_name), а не путь, чтобы число рядов не зависело от id в адресах
+    """
+
+    def __init__(self, get_response: Callable[[HttpRequest], HttpResponse]):
+        self.get_response = get_response
+
+    def __call__(self, request: HttpRequest) -> HttpResponse:
+        queries = [0]
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(query_counter(queries)))
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+        view = getattr(request.resolver_match, "view_name", None) or "unmatched"
+        REQUEST_LATENCY.labels(view, request.method).observe(duration)
+        REQUESTS.labels(view, request.method, str(response.status_code)).inc()
+        if response.status_code >= 400:
+            REQUEST_ERRORS.labels(view, str(response.status_code)).inc()
+        REQUEST_QUERIES.labels(view).observe(queries[0])
+        return response
@@ -0,0 +1,115 @@
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+from types import FrameType
+from typing import Optional
+from django.conf import settings
+from django.core import signing
+
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_QUERY_FLAG = "_profile"
+PROFILE_SIGNING_SALT = "mymonitoring.profiler"
+PROFILE_SUFFIX = ".collapsed"
+
+
+def frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__', '?')}:{getattr(code, 'co_qualname', code.co_name)}"
+
+
+def collapse_stack(frame: Optional[FrameType]) -> str:
+
+    """функция записывает стек от корня к текущему кадру через ';' (формат collapsed stacks flamegraph)"""
+
+    names = []
+    while frame is not None:
+        names.append(frame_name(frame))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class StackSampler:
+
+    """
+    Статистический профайлер одного потока: отдельный поток раз в interval секунд
+    снимает стек профилируемого потока через sys._current_frames и считает одинаковые стеки.
+    Профилируемый код не замедляется трассировкой, точность ограничена интервалом
+    """
+
+    def __init__(self, thread_id: Optional[int] = None, interval: float = 0.005):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="stack-sampler", daemon=True)
+
+    def start(self) -> "StackSampler":
+        self.started = time.perf_counter()
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.stopped.set()
+        self.thread.join()
+        self.duration = time.perf_counter() - self.started
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[collapse_stack(frame)] += 1
+                self.samples += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def profile_token() -> str:
+
+    """функция выдает подписанное значение заголовка X-Profile"""
+
+    return signing.TimestampSigner(salt=PROFILE_SIGNING_SALT).sign("profile")
+
+
+def valid_profile_token(token: str) -> bool:
+    try:
+        signing.TimestampSigner(salt=PROFILE_SIGNING_SALT).unsign(token, max_age=settings.PROFILER_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def prune_profiles(directory: Path, keep: int) -> None:
+
+    """функция оставляет в каталоге keep последних профилей, более старые удаляются"""
+
+    profiles = []
+    for path in directory.glob(f"*{PROFILE_SUFFIX}"):
+        # файл может удалить параллельный воркер
+        try:
+            profiles.append((path.stat().st_mtime, path))
+        except FileNotFoundError:
+            continue
+    profiles.sort(reverse=True)
+    for _, path in profiles[max(keep, 0):]:
+        path.unlink(missing_ok=True)
+
+
+def save_profile(sampler: StackSampler, label: str) -> Path:
+
+    """функция сохраняет стеки в PROFILER_OUTPUT_DIR, файл открывается flamegraph.pl или speedscope.
+    В каталоге хранится не больше PROFILER_MAX_FILES профилей"""
+
+    directory = Path(settings.PROFILER_OUTPUT_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    safe_label = "".join(char if char.isalnum() or char in "-_" else "_" for char in label)
+    path = directory / f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{uuid.uuid4().hex[:6]}-{safe_label}{PROFILE_SUFFIX}"
+    prune_profiles(directory, settings.PROFILER_MAX_FILES - 1)
+    path.write_text(sampler.collapsed(), encoding="utf-8")
+    return path
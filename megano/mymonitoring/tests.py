@@ -0,0 +1,148 @@
+import json
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+from django.contrib.auth.models import User
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from megano.cache import bump_generation
+from mycatalog.cache import TAGS_NAMESPACE
+from .metrics import cache_key_family
+from .profiler import StackSampler, profile_token
+
+
+class ServerTimingTestCase(APITestCase):
+    fixtures = [
+        'categories.json',
+        'tags.json',
+        'specifications.json',
+        'products.json',
+    ]
+
+    def test_no_header_without_sampling(self):
+        with override_settings(SERVER_TIMING_SAMPLE_RATE=0):
+            response = self.client.get(reverse('mycatalog:tags'))
+        self.assertNotIn('Server-Timing', response)
+
+    def test_sampled_request_reports_sql_cache_and_serializer(self):
+        bump_generation(TAGS_NAMESPACE)
+        with override_settings(SERVER_TIMING_SAMPLE_RATE=1), \
+                self.assertLogs('mymonitoring.requests', level='INFO') as logs, \
+                self.assertNumQueries(1):
+            response = self.client.get(reverse('mycatalog:tags'))
+        header = response['Server-Timing']
+        self.assertIn('desc="1 queries"', header)
+        self.assertIn('desc="1 serializers"', header)
+        self.assertIn('total;dur=', header)
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual((line["view"], line["status"], line["sql_count"]), ("mycatalog:tags", 200, 1))
+        self.assertGreaterEqual(line["cache_misses"], 1)
+        self.assertGreater(line["cache_calls"], line["cache_misses"])
+
+
+
+def busy_loop(seconds: float) -> None:
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+class ProfilerTestCase(APITestCase):
+
+    def setUp(self):
+        self.output_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.output_dir.cleanup)
+        logger = logging.getLogger('mymonitoring.requests')
+        logger.disabled = True
+        self.addCleanup(setattr, logger, 'disabled', False)
+        self.url = reverse('mycatalog:tags')
+
+    def profiled(self, **kwargs):
+        with override_settings(PROFILER_OUTPUT_DIR=self.output_dir.name):
+            return self.client.get(self.url, **kwargs)
+
+    def test_sampler_collects_collapsed_stacks(self):
+        sampler = StackSampler(interval=0.001).start()
+        busy_loop(0.05)
+        sampler.stop()
+        self.assertGreater(sampler.samples, 0)
+        stack, count = sampler.collapsed().splitlines()[0].rsplit(" ", 1)
+        self.assertIn("mymonitoring.tests:busy_loop", stack.split(";"))
+        self.assertGreater(int(count), 0)
+
+    def test_staff_query_flag_saves_profile(self):
+        staff = User.objects.create_user(username='staff', password='password', is_staff=True)
+        self.client.force_login(staff)
+        response = self.profiled(data={'_profile': 1})
+        self.assertTrue((Path(self.output_dir.name) / response['X-Profile-File']).exists())
+
+    def test_query_flag_ignored_for_regular_users(self):
+        self.client.force_login(User.objects.create_user(username='regular', password='password'))
+        response = self.profiled(data={'_profile': 1})
+        self.assertNotIn('X-Profile-File', response)
+        self.assertEqual(list(Path(self.output_dir.name).iterdir()), [])
+
+    def test_signed_header(self):
+        self.assertIn('X-Profile-File', self.profiled(HTTP_X_PROFILE=profile_token()))
+        self.assertNotIn('X-Profile-File', self.profiled(HTTP_X_PROFILE='profile:forged'))
+
+    def test_old_profiles_are_pruned(self):
+        for age in range(3):
+            old = Path(self.output_dir.name) / f"old-{age}.collapsed"
+            old.write_text("main 1\n")
+            os.utime(old, (1000 + age, 1000 + age))
+        with override_settings(PROFILER_MAX_FILES=2):
+            name = self.profiled(HTTP_X_PROFILE=profile_token())['X-Profile-File']
+        self.assertEqual(sorted(path.name for path in Path(self.output_dir.name).iterdir()), sorted([name, "old-2.collapsed"]))
+
+
+class MetricsTestCase(APITestCase):
+    fixtures = [
+        'categories.json',
+        'tags.json',
+        'specifications.json',
+        'products.json',
+    ]
+
+    def setUp(self):
+        self.url = reverse('mymonitoring:metrics')
+
+    def scrape(self, **kwargs) -> str:
+        response = self.client.get(self.url, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def test_metrics_require_staff_or_token(self):
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        with override_settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get(self.url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+            self.scrape(HTTP_AUTHORIZATION='Bearer secret')
+        self.client.force_login(User.objects.create_user(username='staff', password='password', is_staff=True))
+        self.scrape()
+
+    def test_requests_queries_and_cache_are_counted(self):
+        self.client.force_login(User.objects.create_user(username='staff', password='password', is_staff=True))
+        bump_generation(TAGS_NAMESPACE)
+        self.client.get(reverse('mycatalog:tags'))
+        self.client.get(reverse('mycatalog:tags'))
+        self.client.get(reverse('mycatalog:product', args=[999]))
+        text = self.scrape()
+        self.assertIn('megano_request_duration_seconds_count{method="GET",view="mycatalog:tags"}', text)
+        self.assertIn('megano_request_errors_total{status="404",view="mycatalog:product"}', text)
+        self.assertIn('megano_request_db_queries_bucket{le="1.0",view="mycatalog:tags"}', text)
+        self.assertIn('megano_cache_lookups_total{family="tags",result="hit"}', text)
+        self.assertIn('megano_cache_lookups_total{family="tags",result="miss"}', text)
+
+    def test_cache_key_family(self):
+        self.assertEqual(cache_key_family("catalog:12:page"), "catalog")
+        self.assertEqual(cache_key_family("catalog:1700000000000:page:3f2a"), "catalog")
+        self.assertEqual(cache_key_family("product:detail:5"), "product")
+        self.assertEqual(cache_key_family("catalog:generation"), "generation")
+        self.assertEqual(cache_key_family("tags:generation"), "generation")
+        self.assertEqual(cache_key_family("catalog:facets:version"), "generation")
+        self.assertEqual(cache_key_family("categories:modified"), "validator")
+        self.assertEqual(cache_key_family("product:modified:5"), "validator")
+        self.assertEqual(cache_key_family("plainkey"), "other")
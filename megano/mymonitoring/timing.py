@@ -0,0 +1,83 @@
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+
+class RequestTimings:
+
+    """
+    Счетчики одного запроса: SQL, кеш, сериалайзеры и отправка задач Celery.
+    Создаются только для запросов попавших в выборку, в остальных
+    current_timings() возвращает None и инструментирование ничего не делает
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cache_calls = 0
+        self.cache_time = 0.0
+        self.serializer_count = 0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+        self.celery_count = 0
+        self.celery_time = 0.0
+
+    def record_cache(self, duration: float, hits: int = 0, misses: int = 0) -> None:
+        self.cache_calls += 1
+        self.cache_time += duration
+        self.cache_hits += hits
+        self.cache_misses += misses
+
+    def total(self) -> float:
+        return time.perf_counter() - self.started
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "total_ms": milliseconds(self.total()),
+            "sql_count": self.sql_count,
+            "sql_ms": milliseconds(self.sql_time),
+            "cache_calls": self.cache_calls,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "cache_ms": milliseconds(self.cache_time),
+            "serializer_count": self.serializer_count,
+            "serializer_ms": milliseconds(self.serializer_time),
+            "celery_count": self.celery_count,
+            "celery_ms": milliseconds(self.celery_time),
+        }
+
+    def server_timing(self) -> str:
+
+        """метод собирает значение заголовка Server-Timing"""
+
+        metrics: List[str] = [
+            f'sql;dur={milliseconds(self.sql_time)};desc="{self.sql_count} queries"',
+            f'cache;dur={milliseconds(self.cache_time)};desc="{self.cache_hits} hits {self.cache_misses} misses"',
+            f'serializer;dur={milliseconds(self.serializer_time)};desc="{self.serializer_count} serializers"',
+        ]
+        if self.celery_count:
+            metrics.append(f'celery;dur={milliseconds(self.celery_time)};desc="{self.celery_count} tasks"')
+        metrics.append(f'total;dur={milliseconds(self.total())}')
+        return ", ".join(metrics)
+
+
+def milliseconds(seconds: float) -> float:
+    return round(seconds * 1000, 2)
+
+
+_current_timings: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def current_timings() -> Optional[RequestTimings]:
+    return _current_timings.get()
+
+
+def start_timings() -> Any:
+    return _current_timings.set(RequestTimings())
+
+
+def stop_timings(token: Any) -> None:
+    _current_timings.reset(token)
@@ -0,0 +1,27 @@
+import hmac
+from django.conf import settings
+from django.http import HttpRequest, HttpResponse
+from django.views import View
+from prometheus_client import CONTENT_TYPE_LATEST
+from .metrics import export_metrics
+
+
+class MetricsView(View):
+
+    """
+    Вью для сборщика Prometheus. Доступна сотрудникам и по заголовку
+    Authorization: Bearer <METRICS_TOKEN>, снаружи закрыта в nginx
+    """
+
+    def get(self, request: HttpRequest) -> HttpResponse:
+        if not self.has_access(request):
+            return HttpResponse(status=403)
+        return HttpResponse(export_metrics(), content_type=CONTENT_TYPE_LATEST)
+
+    @staticmethod
+    def has_access(request: HttpRequest) -> bool:
+        token = settings.METRICS_TOKEN
+        authorization = request.headers.get("Authorization", "")
+        if token and hmac.compare_digest(authorization, f"Bearer {token}"):
+            return True
+        return request.user.is_authenticated and request.user.is_staff
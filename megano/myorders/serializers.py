@@ -78,7 +78,7 @@ class OrderDetailSerializer(serializers.ModelSerializer):
     def get_products(self, instance: Order) -> List[Dict[str, Any]]:
         items = self.context.get("basket")
         items = {k: int(v) for k, v in items.items() if v != 0}
-        products = instance.products.all()
+        products = ProductSerializer.setup_eager_loading(instance.products.all())
         product_serializer = ProductSerializer(products, many=True)
         result = aply_count_for_product(product_serializer.data, items)
         return result
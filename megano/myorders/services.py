@@ -1,34 +1,149 @@
-from typing import NoReturn
+import uuid
+from typing import Dict, NoReturn, Optional
+from django.conf import settings
 from rest_framework.request import Request
+from mycatalog.stores import get_redis
+
+
+BASKET_SESSION_KEY = 'basket'
+BASKET_ID_SESSION_KEY = 'basket_id'
+BASKET_REDIS_KEY = "basket:{basket_id}"
+# KEYS[1] - корзина, ARGV - ID товара, добавляемое колличество, остаток на складе, BASKET_TTL
+BASKET_ADD_SCRIPT = """
+local count = redis.call('HINCRBY', KEYS[1], ARGV[1], ARGV[2])
+if count > tonumber(ARGV[3]) then
+    count = tonumber(ARGV[3])
+    redis.call('HSET', KEYS[1], ARGV[1], count)
+end
+if count <= 0 then
+    redis.call('HDEL', KEYS[1], ARGV[1])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return count
+"""
+# KEYS[1] - корзина, ARGV - ID товара, удаляемое колличество, BASKET_TTL
+BASKET_REMOVE_SCRIPT = """
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 0 then
+    return 0
+end
+local count = redis.call('HINCRBY', KEYS[1], ARGV[1], -tonumber(ARGV[2]))
+if count <= 0 then
+    redis.call('HDEL', KEYS[1], ARGV[1])
+end
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return count
+"""
+
+
+class SessionBasketStore:
+
+    """Хранение корзины в сессии: словарь "ID товара: колличество" в ключе basket"""
+
+    def __init__(self, request: Request) -> NoReturn:
+        self.session = request.session
+
+    def items(self) -> Dict[str, int]:
+        return dict(self.session.get(BASKET_SESSION_KEY) or {})
+
+    def write(self, items: Dict[str, int]) -> NoReturn:
+        self.session[BASKET_SESSION_KEY] = {key: value for key, value in items.items() if value > 0}
+
+    def add(self, product_id: str, quantity: int, products_count: int) -> NoReturn:
+        items = self.items()
+        items[product_id] = min(items.get(product_id, 0) + quantity, products_count)
+        self.write(items)
+
+    def remove(self, product_id: str, quantity: int) -> NoReturn:
+        items = self.items()
+        if product_id in items:
+            items[product_id] -= quantity
+            self.write(items)
+
+    def clear(self) -> NoReturn:
+        self.session[BASKET_SESSION_KEY] = {}
+
+
+class RedisBasketStore:
+
+    """
+    Хранение корзины в hash Redis, поле - ID товара, значение - колличество.
+    Добавление и удаление выполняются Lua скриптами: изменение колличества, ограничение
+    остатком, удаление нулевых позиций и продление срока жизни происходят атомарно,
+    поэтому одновременные запросы из разных вкладок не затирают друг друга,
+    а чтение корзины ничего не пишет.
+    В сессии хранится только id корзины: он переносится при входе вместе с данными сессии.
+    Корзина удаляется через BASKET_TTL секунд после последнего изменения
+    """
+
+    def __init__(self, request: Request, redis) -> NoReturn:
+        self.session = request.session
+        self.redis = redis
+        self.ttl = settings.BASKET_TTL
+        self.add_script = redis.register_script(BASKET_ADD_SCRIPT)
+        self.remove_script = redis.register_script(BASKET_REMOVE_SCRIPT)
+
+    def key(self, create: bool = False) -> Optional[str]:
+        basket_id = self.session.get(BASKET_ID_SESSION_KEY)
+        if basket_id is None and create:
+            basket_id = self.session[BASKET_ID_SESSION_KEY] = uuid.uuid4().hex
+        return BASKET_REDIS_KEY.format(basket_id=basket_id) if basket_id else None
+
+    def items(self) -> Dict[str, int]:
+        key = self.key()
+        if key is None:
+            return {}
+        return {
+            product_id.decode(): int(count)
+            for product_id, count in self.redis.hgetall(key).items() if int(count) > 0
+        }
+
+    def add(self, product_id: str, quantity: int, products_count: int) -> NoReturn:
+        self.add_script(keys=[self.key(create=True)], args=[product_id, quantity, products_count, self.ttl])
+
+    def remove(self, product_id: str, quantity: int) -> NoReturn:
+        key = self.key()
+        if key is not None:
+            self.remove_script(keys=[key], args=[product_id, quantity, self.ttl])
+
+    def clear(self) -> NoReturn:
+        key = self.key()
+        if key is not None:
+            self.redis.delete(key)
+
+
+def basket_store(request: Request):
+
+    """
+    функция возвращает хранилище корзины по настройке BASKET_BACKEND ("session" или "redis"),
+    если кеш не на Redis, корзина хранится в сессии
+    """
+
+    if settings.BASKET_BACKEND == "redis":
+        redis = get_redis()
+        if redis is not None:
+            return RedisBasketStore(request, redis)
+    return SessionBasketStore(request)
 
 
 class Basket(object):
 
-    """Кастомный класс для работы корзины"""
+    """Кастомный класс для работы корзины, данные хранятся в хранилище из basket_store"""
 
     def __init__(self, request: Request) -> NoReturn:
         """
         :param request: запрос с данными заказа прходит с вью функции BasketView
-        создается словарь в котором будут хранится данние о заказе в течении сессии
+        корзина читается из хранилища, запись происходит только при ее изменении
         """
 
         self.request = request
-        self.session = request.session
-        basket = self.session.get('basket')
-        if not basket:
-            basket = self.session['basket'] = {}
-        self.basket = basket
+        self.store = basket_store(request)
+        self.basket = self.store.items()
 
-    def dell_value_equals_zero(self) -> 'Basket':
+    def dell_value_equals_zero(self) -> Dict[str, int]:
 
-        """Метот удаляет из корзины товары колличество которых равно нулю"""
+        """Метот возвращает товары корзины без товаров, колличество которых равно нулю"""
 
-        new_dict = {}
-        for key, value in self.basket.items():
-            if value != 0:
-                new_dict[key] = value
-        self.basket = new_dict
-        self.save()
+        self.basket = {key: value for key, value in self.basket.items() if value > 0}
         return self.basket
 
     def add_item(self, product_id: int, products_count: int, quantity=1) -> NoReturn:
@@ -41,20 +156,8 @@ class Basket(object):
         не дает заказать товар в колличестве большем чем его есть на складе
         """
 
-        product_id = str(product_id)
-        quantity = int(quantity)
-        if product_id in self.basket and self.basket[product_id] + quantity < products_count:
-            self.basket[product_id] += quantity
-        elif product_id in self.basket and self.basket[product_id] + quantity == products_count:
-            self.basket[product_id] = products_count
-        elif product_id in self.basket and self.basket[product_id] + quantity > products_count:
-            self.basket[product_id] = products_count
-        else:
-            if quantity < products_count:
-                self.basket[product_id] = quantity
-            elif quantity >= products_count:
-                self.basket[product_id] = products_count
-        self.save()
+        self.store.add(str(product_id), int(quantity), products_count)
+        self.basket = self.store.items()
 
     def remove_item(self, product_id: int, quantity=1) -> NoReturn:
         """
@@ -62,13 +165,10 @@ class Basket(object):
         :param quantity: удаляемое колличество
         """
 
-        product_id = str(product_id)
-        quantity = int(quantity)
-        if product_id in self.basket and self.basket[product_id] != 0:
-            self.basket[product_id] -= quantity
-        self.save()
+        self.store.remove(str(product_id), int(quantity))
+        self.basket = self.store.items()
 
-    def get_basket_items(self) -> 'Basket':
+    def get_basket_items(self) -> Dict[str, int]:
         """
         :return: возвращает корозину
         """
@@ -80,14 +180,8 @@ class Basket(object):
         Метод удаляет данные корзины
         """
 
-        self.session['basket'] = {}
-        self.save()
-
-    def save(self) -> NoReturn:
-        """
-        Сохранение корзины
-        """
-        self.session.modified = True
+        self.store.clear()
+        self.basket = {}
 
     def get_ids(self) -> list[int]:
         """
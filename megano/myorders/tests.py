@@ -1,8 +1,14 @@
 import json
+from concurrent.futures import ThreadPoolExecutor
 from .models import Order
+from .services import BASKET_ID_SESSION_KEY, BASKET_REDIS_KEY, RedisBasketStore
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework.test import APITestCase
 from django.contrib.auth.models import User
+from mycatalog.stores import get_redis
 
 
 class BayProductTestCase(APITestCase):
@@ -116,4 +122,82 @@ class BayProductTestCase(APITestCase):
         self.assertEqual(response.status_code, 200)
         order.refresh_from_db()
         self.assertTrue(order.payment.name == "Annoying Orange")
-        self.assertTrue(order.status == "payed")
\ No newline at end of file
+        self.assertTrue(order.status == "payed")
+
+class BasketBackendTestCase(APITestCase):
+
+    fixtures = [
+        'categories.json',
+        'category_images.json',
+        'tags.json',
+        'specifications.json',
+        'products.json',
+    ]
+
+    def session_writes(self, method, *args, **kwargs):
+        with CaptureQueriesContext(connection) as context:
+            response = getattr(self.client, method)(*args, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        writes = [
+            query["sql"] for query in context.captured_queries
+            if "django_session" in query["sql"] and not query["sql"].startswith("SELECT")
+        ]
+        return response, writes
+
+    def test_session_basket_get_does_not_write(self):
+        url = reverse('myorders:basket')
+        self.client.post(url, data={"id": 2, "count": 2})
+        response, writes = self.session_writes('get', url)
+        self.assertEqual(writes, [])
+        self.assertEqual([(item["id"], item["count"]) for item in response.json()], [(2, 2)])
+
+    @override_settings(BASKET_BACKEND="redis")
+    def test_redis_basket(self):
+        url = reverse('myorders:basket')
+        self.client.post(url, data={"id": 1, "count": 1})
+        basket_id = self.client.session["basket_id"]
+        self.addCleanup(get_redis().delete, BASKET_REDIS_KEY.format(basket_id=basket_id))
+        self.assertNotIn("basket", self.client.session)
+
+        # остаток товара 1 равен двум, добавление сверх остатка ограничивается им
+        _, writes = self.session_writes('post', url, data={"id": 1, "count": 3})
+        self.assertEqual(writes, [])
+        self.client.post(url, data={"id": 2, "count": 1})
+        response, writes = self.session_writes('get', url)
+        self.assertEqual(writes, [])
+        self.assertEqual(sorted((item["id"], item["count"]) for item in response.json()), [(1, 2), (2, 1)])
+
+        response = self.client.delete(url, data={"id": 2, "count": 1})
+        self.assertEqual([(item["id"], item["count"]) for item in response.json()], [(1, 2)])
+        self.assertEqual(get_redis().hgetall(BASKET_REDIS_KEY.format(basket_id=basket_id)), {b"1": b"2"})
+        self.assertGreater(get_redis().ttl(BASKET_REDIS_KEY.format(basket_id=basket_id)), 0)
+
+    @override_settings(BASKET_BACKEND="redis")
+    def test_redis_basket_concurrent_changes(self):
+        request = type("Request", (), {"session": {BASKET_ID_SESSION_KEY: "concurrent"}})()
+        key = BASKET_REDIS_KEY.format(basket_id="concurrent")
+        get_redis().delete(key)
+        self.addCleanup(get_redis().delete, key)
+
+        # потоки берут соединения из общего пула, как одновременные запросы из разных вкладок
+        def add():
+            RedisBasketStore(request, get_redis()).add("1", 1, 5)
+
+        def remove():
+            RedisBasketStore(request, get_redis()).remove("1", 1)
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda change: change(), [add] * 40))
+        self.assertEqual(get_redis().hgetall(key), {b"1": b"5"})
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda change: change(), [remove, add] * 20))
+        counts = get_redis().hgetall(key)
+        self.assertTrue(counts == {} or 0 < int(counts[b"1"]) <= 5, counts)
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda change: change(), [remove] * 10))
+        self.assertEqual(get_redis().hgetall(key), {})
+        RedisBasketStore(request, get_redis()).add("1", 2, 5)
+        self.assertEqual(get_redis().hgetall(key), {b"1": b"2"})
+        self.assertGreater(get_redis().ttl(key), 0)
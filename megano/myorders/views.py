@@ -8,6 +8,7 @@ from mycatalog.serializers import ProductSerializer
 from .services import Basket, aply_count_for_product
 from mycatalog.models import Product
 from typing import Any, Tuple, Dict
+from django.db.models import Prefetch
 from .models import Order
 from mycatalog.for_swagger import Order_sw, BusketSw, Product_ID_sw, CatalogSerializerSwagger, CatalogSw, QuerySerializerFilter, ProductSw, Sales_Sw
 
@@ -64,7 +65,7 @@ class BasketView(APIView):
         basket.add_item(product_id, products_count, count)
         items = basket.dell_value_equals_zero()
         ids = basket.get_ids()
-        products = Product.objects.filter(id__in=ids)
+        products = ProductSerializer.setup_eager_loading(Product.objects.filter(id__in=ids))
         serializer = ProductSerializer(instance=products, many=True)
         result = aply_count_for_product(serializer.data, items)
         return Response(data=result, status=status.HTTP_200_OK)
@@ -76,7 +77,7 @@ class BasketView(APIView):
         basket = Basket(request)
         items = basket.dell_value_equals_zero()
         ids = basket.get_ids()
-        products = Product.objects.filter(id__in=ids)
+        products = ProductSerializer.setup_eager_loading(Product.objects.filter(id__in=ids))
         serializer = ProductSerializer(instance=products, many=True)
         result = aply_count_for_product(serializer.data, items)
 
@@ -93,7 +94,7 @@ class BasketView(APIView):
         basket.remove_item(product_id, count)
         items = basket.dell_value_equals_zero()
         ids = basket.get_ids()
-        products = Product.objects.filter(id__in=ids)
+        products = ProductSerializer.setup_eager_loading(Product.objects.filter(id__in=ids))
         serializer = ProductSerializer(instance=products, many=True)
         result = aply_count_for_product(serializer.data, items)
         return Response(data=result, status=status.HTTP_200_OK)
@@ -141,8 +142,10 @@ class OrdersView(APIView):
         """Метод для отображения заказа"""
 
         user = request.user
-        orders = Order.objects.filter(user=user)
-        basket = request.session.get("basket")
+        orders = Order.objects.filter(user=user).select_related('user__profile').prefetch_related(
+            Prefetch('products', queryset=ProductSerializer.setup_eager_loading(Product.objects.all()))
+        )
+        basket = Basket(request).get_basket_items()
         serializer = OrdersGetSerializer(instance=orders, context={"basket": basket}, many=True)
         return Response(data=serializer.data, status=status.HTTP_200_OK)
 
@@ -201,7 +204,7 @@ class OrdersDetailView(APIView):
 
         id = int(kwargs.get("pk"))
         order = Order.objects.get(id=id)
-        basket = request.session.get("basket")
+        basket = Basket(request).get_basket_items()
         serializer = OrderDetailSerializer(instance=order, context={"basket": basket})
         return Response(data=serializer.data, status=status.HTTP_200_OK)
 
@@ -212,7 +215,7 @@ class OrdersDetailView(APIView):
         summary="Метод для ввода данных карты",
         description="""Метод для ввода данных карты
                        также меняет статус заказа на оплаченный,
-                       и удаляет корзину из сессии""",
+                       и очищает корзину""",
         responses={
             status.HTTP_200_OK: PaymentSerializer,
         },
@@ -231,7 +234,7 @@ class OrdersDetailView(APIView):
 class PaymentView(APIView):
 
     """Метод для ввода данных карты
-    также меняет статус заказа на оплаченный, и удаляет корзину из сессии"""
+    также меняет статус заказа на оплаченный, и очищает корзину"""
 
     def post(self, request: Request, **kwargs: Any) -> Response:
         data = request.data
@@ -239,7 +242,7 @@ class PaymentView(APIView):
         serializer = PaymentSerializer(data=data)
         if serializer.is_valid():
             serializer.save()
-            del request.session["basket"]
+            Basket(request).clear_basket()
             order = Order.objects.get(id=kwargs["pk"])
             order.status = "payed"
             order.save()